@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Benchmark page fetches with and without hedged requests against a server with a long latency tail.
+
+Starts a local HTTP server whose answers mostly take a few milliseconds but
+sometimes stall, like the university Moodle under load, then fetches pages
+from 1 and 4 concurrent crawls through scraper.fetch, first without, then with
+hedging, and prints the latency percentiles and the extra requests sent.
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from scraper import fetch
+
+
+class SlowTailHandler(BaseHTTPRequestHandler):
+    """
+    Answers after a latency drawn from the server's distribution
+    """
+    def do_GET(self):
+        time.sleep(self.server.latency())
+        body = b'<html><body>course page</body></html>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def tail_latency(fast, slow, slow_share):
+    """
+    Return a latency distribution: around `fast` seconds, and `slow` seconds for a `slow_share` of requests
+    """
+    def latency():
+        if random.random() < slow_share:
+            return slow
+        return random.uniform(fast * 0.5, fast * 1.5)
+    return latency
+
+
+def crawl(url, crawls, pages_per_crawl):
+    """
+    Fetch `pages_per_crawl` pages in each of `crawls` threads
+
+    Returns:
+        list: The latency of every page, in seconds
+    """
+    def run(_):
+        session = requests.Session()
+        latencies = []
+        for _ in range(pages_per_crawl):
+            started = time.perf_counter()
+            fetch.get(session, url).close()
+            latencies.append(time.perf_counter() - started)
+        session.close()
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=crawls) as executor:
+        return [latency for latencies in executor.map(run, range(crawls)) for latency in latencies]
+
+
+def percentile(samples, share):
+    return samples[min(len(samples) - 1, int(len(samples) * share))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hedged requests against a server with a latency tail')
+    parser.add_argument('--pages', type=int, default=200, help='Pages fetched by each crawl')
+    parser.add_argument('--fast', type=float, default=0.02, help='Usual latency in seconds')
+    parser.add_argument('--slow', type=float, default=1.0, help='Latency of stalled requests in seconds')
+    parser.add_argument('--slow-share', type=float, default=0.03, help='Share of stalled requests')
+    parser.add_argument('--budget', type=float, default=fetch.DEFAULT_HEDGE_BUDGET, help='Hedges per request')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowTailHandler)
+    server.daemon_threads = True
+    server.latency = tail_latency(args.fast, args.slow, args.slow_share)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/course/view.php?id=1"
+
+    print(f"{args.slow_share:.0%} of requests stall for {args.slow}s, the others take about {args.fast * 1000:.0f}ms")
+    print(f"{'crawls':>6} {'hedging':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'hedges':>7} {'won':>5}")
+
+    for crawls in (1, 4):
+        for hedging in (False, True):
+            random.seed(args.seed)
+            fetch.configure(hedging=hedging, budget=args.budget, workers=crawls * 2 + 2)
+            # Observe enough latencies for a p95 before timing
+            crawl(url, 1, fetch.MIN_SAMPLES)
+            latencies = sorted(crawl(url, crawls, args.pages))
+            counts = fetch.stats().get('page', {})
+            print(f"{crawls:>6} {'on' if hedging else 'off':>8} "
+                  f"{percentile(latencies, 0.5) * 1000:>6.0f}ms {percentile(latencies, 0.95) * 1000:>6.0f}ms "
+                  f"{percentile(latencies, 0.99) * 1000:>6.0f}ms {latencies[-1] * 1000:>6.0f}ms "
+                  f"{counts.get('hedges', 0) / max(counts.get('requests', 1), 1):>6.1%} {counts.get('hedge_wins', 0):>5}")
+
+    fetch.configure()
+    server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
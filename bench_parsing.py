@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Benchmark course page parsing in the crawling threads against the parser process pool.
+
+Parses a synthetic Moodle course page with scraper.extractors.course_links from
+1, 4 and 16 concurrent "crawls" (threads), first in-thread, then through
+scraper.parse_pool, and prints the pages parsed per second.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scraper import parse_pool
+from scraper.extractors import course_links
+
+
+def course_page(sections, activities):
+    """
+    Build a course page shaped like Moodle's, with `activities` resources in each section
+    """
+    items = []
+    for section in range(sections):
+        items.append(f'<li class="section main" id="section-{section}"><h3 class="sectionname">Section {section}</h3><ul class="section img-text">')
+        for activity in range(activities):
+            activity_id = section * activities + activity + 1000
+            items.append(
+                f'<li class="activity resource modtype_resource" id="module-{activity_id}"><div class="activityinstance">'
+                f'<a class="aalink" href="https://moodle.example/mod/resource/view.php?id={activity_id}">'
+                f'<img src="https://moodle.example/theme/image.php/boost/core/1/f/pdf-24" class="iconlarge activityicon" alt="">'
+                f'<span class="instancename">Chapter {activity_id}<span class="accesshide"> File</span></span></a>'
+                f'<span class="resourcelinkdetails">1.2MB PDF document</span></div></li>'
+            )
+        items.append('</ul></li>')
+
+    return (
+        '<html><head><title>Course</title></head><body><div id="page"><h1>Algebra 1</h1>'
+        f'<div class="course-content"><ul class="topics">{"".join(items)}</ul></div></div></body></html>'
+    )
+
+
+def parse_pages(page, crawls, pages_per_crawl):
+    """
+    Parse `pages_per_crawl` pages in each of `crawls` threads
+
+    Returns:
+        float: Pages parsed per second
+    """
+    def crawl(_):
+        for _ in range(pages_per_crawl):
+            parse_pool.run(course_links, page)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=crawls) as executor:
+        list(executor.map(crawl, range(crawls)))
+    return crawls * pages_per_crawl / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark in-thread HTML parsing against the parser process pool')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Parser processes')
+    parser.add_argument('--pages', type=int, default=8, help='Pages parsed by each crawl')
+    parser.add_argument('--sections', type=int, default=12, help='Sections of the synthetic course page')
+    parser.add_argument('--activities', type=int, default=15, help='Resources in each section')
+    args = parser.parse_args()
+
+    page = course_page(args.sections, args.activities)
+    print(f"Course page: {len(page) // 1024}KB, {args.sections * args.activities} resources, {args.workers} parser processes")
+    print(f"{'crawls':>6} {'in-thread':>12} {'pool':>12} {'speed-up':>9}")
+
+    for crawls in (1, 4, 16):
+        parse_pool.configure(0)
+        inline = parse_pages(page, crawls, args.pages)
+
+        parse_pool.configure(args.workers, min_size=0)
+        # Start the workers and import the parser in each of them before timing
+        parse_pages(page, args.workers, 1)
+        pooled = parse_pages(page, crawls, args.pages)
+
+        print(f"{crawls:>6} {inline:>8.1f}/s {pooled:>8.1f}/s {pooled / inline:>8.2f}x")
+
+    parse_pool.configure(0)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Benchmark rendering a large course file listing through DRF serializers against the fast renderer.
+
+Builds a listing of 10,000 crawl records, then times rendering its response
+body as it was done before (ResourceSerializer, then DRF's JSONRenderer) and
+with scraper.renderers.FastJSONRenderer on the records, and prints the
+response size uncompressed, gzipped and, when brotli is installed, with brotli.
+"""
+
+import argparse
+import gzip
+import os
+import sys
+import time
+
+import django
+
+
+def listing(rows):
+    """
+    Build `rows` resource records shaped like a category-scale crawl
+    """
+    from scraper.records import ResourceLink
+
+    return [
+        ResourceLink(
+            resource_name=f"Chapitre {row % 40} - Cours {row}",
+            resource_url=f"https://elearning.univ-bba.dz/mod/resource/view.php?id={100000 + row}",
+            pdf_url=f"https://elearning.univ-bba.dz/pluginfile.php/{4000 + row}/mod_resource/content/1/cours_{row}.pdf",
+            pdf_name=f"cours_{row}.pdf"
+        )
+        for row in range(rows)
+    ]
+
+
+def resource_serializer():
+    """
+    Build the DRF serializer resource listings were rendered with before the fast renderer
+    """
+    from rest_framework import serializers
+
+    class ResourceSerializer(serializers.Serializer):
+        resource_name = serializers.CharField()
+        resource_url = serializers.URLField()
+        pdf_url = serializers.URLField(allow_null=True)
+        pdf_name = serializers.CharField(required=False, allow_null=True)
+        error = serializers.CharField(required=False)
+
+    return ResourceSerializer
+
+
+def best_of(repeat, render):
+    """
+    Return the fastest of `repeat` runs of `render`, in milliseconds, and its output
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = render()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark serializer rendering against the fast JSON renderer')
+    parser.add_argument('--rows', type=int, default=10000, help='Records in the listing')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each renderer, the fastest is reported')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+    django.setup()
+
+    from rest_framework.renderers import JSONRenderer
+
+    from scraper import renderers
+    from scraper.middleware import brotli
+
+    records = listing(args.rows)
+    ResourceSerializer = resource_serializer()
+
+    def with_serializer():
+        data = ResourceSerializer(records, many=True).data
+        return JSONRenderer().render({'status': 'success', 'count': len(records), 'data': data})
+
+    def with_fast_renderer():
+        return renderers.FastJSONRenderer().render({'status': 'success', 'count': len(records), 'data': records})
+
+    print(f"{args.rows} rows, orjson {'installed' if renderers.orjson else 'not installed'}")
+    print(f"{'path':<20} {'render':>10} {'body':>10} {'gzip':>10} {'brotli':>10}")
+
+    for name, render in (('serializer + json', with_serializer), ('fast renderer', with_fast_renderer)):
+        elapsed, body = best_of(args.repeat, render)
+        gzipped = len(gzip.compress(body, compresslevel=6))
+        brotlied = f"{len(brotli.compress(body, quality=5)) // 1024}KB" if brotli else '-'
+        print(f"{name:<20} {elapsed:>8.1f}ms {len(body) // 1024:>8}KB {gzipped // 1024:>8}KB {brotlied:>10}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
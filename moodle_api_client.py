@@ -23,10 +23,10 @@ class MoodleAPIClient:
         self.username = username
         self.password = password
         self.session = requests.Session()
-        self.session_cookies = None
+        self.token = None
     
     def login(self):
-        """Login to Moodle and get session cookies."""
+        """Login to Moodle and get an API token."""
         if not self.username or not self.password:
             raise ValueError("Username and password are required for login")
         
@@ -42,7 +42,8 @@ class MoodleAPIClient:
             
             data = response.json()
             if data.get('status') == 'success':
-                self.session_cookies = data.get('session')
+                self.token = data.get('token')
+                self.session.headers['X-Moodle-Token'] = self.token
                 return True
             else:
                 print(f"Login failed: {data.get('message')}")
@@ -51,25 +52,28 @@ class MoodleAPIClient:
             print(f"Error during login: {e}")
             return False
     
+    def _credentials(self, payload):
+        """Add username/password to a payload unless an API token is in use."""
+        if self.token:
+            return payload
+        
+        if not self.username or not self.password:
+            raise ValueError("Username and password are required")
+        
+        payload.update({
+            "username": self.username,
+            "password": self.password
+        })
+        return payload
+    
     def get_course_pdfs(self, course_id):
         """Get PDF files from a course."""
         url = f"{self.api_base}/moodle-pdfs/"
         
-        # Use session cookies if available, otherwise use username/password
-        if self.session_cookies:
-            payload = {
-                "course_id": course_id,
-                "session": self.session_cookies
-            }
-        else:
-            if not self.username or not self.password:
-                raise ValueError("Username and password are required")
-            
-            payload = {
-                "course_id": course_id,
-                "username": self.username,
-                "password": self.password
-            }
+        # Use the API token if available, otherwise use username/password
+        payload = self._credentials({
+            "course_id": course_id
+        })
         
         try:
             response = self.session.post(url, json=payload, timeout=60)
@@ -84,15 +88,10 @@ class MoodleAPIClient:
         """Get resources from a course URL."""
         url = f"{self.api_base}/auth-resources/"
         
-        if not self.username or not self.password:
-            raise ValueError("Username and password are required")
-        
-        payload = {
+        payload = self._credentials({
             "url": course_url,
-            "username": self.username,
-            "password": self.password,
             "download_file": False
-        }
+        })
         
         try:
             response = self.session.post(url, json=payload, timeout=60)
@@ -103,22 +102,24 @@ class MoodleAPIClient:
             print(f"Error getting course resources: {e}")
             return None
     
-    def download_file(self, course_url, output_path):
-        """Download a file from a course URL."""
-        url = f"{self.api_base}/auth-resources/"
+    def download_file(self, course_url, output_path, files=None):
+        """Download a file from a course URL.
         
-        if not self.username or not self.password:
-            raise ValueError("Username and password are required")
+        When `files` is given ("all", a list of indexes, or a dict with
+        index/name/type keys) every selected file arrives in a single ZIP
+        archive written to output_path.
+        """
+        url = f"{self.api_base}/auth-resources/"
         
-        payload = {
+        payload = self._credentials({
             "url": course_url,
-            "username": self.username,
-            "password": self.password,
             "download_file": True
-        }
+        })
+        if files:
+            payload["files"] = files
         
         try:
-            response = self.session.post(url, json=payload, timeout=60)
+            response = self.session.post(url, json=payload, timeout=60, stream=True)
             response.raise_for_status()
             
             # Check if it's a file download
@@ -144,7 +145,8 @@ class MoodleAPIClient:
             
             # Save the file
             with open(output_path, 'wb') as f:
-                f.write(response.content)
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
             
             print(f"File downloaded to {output_path}")
             return True
@@ -191,12 +193,141 @@ class MoodleAPIClient:
             print(f"Error getting departments: {e}")
             return None
 
+class MoodleDirectClient:
+    """Drop-in replacement for MoodleAPIClient that scrapes Moodle in-process.
+    
+    Methods return the same shapes as the API endpoints, without needing a
+    running API server.
+    """
+    
+    def __init__(self, username=None, password=None, moodle_url='https://elearning.univ-bba.dz'):
+        """Initialize the client."""
+        from scraper.engine import MoodleEngine
+        
+        self.engine = MoodleEngine(username, password, moodle_url)
+        self.token = None
+    
+    def login(self):
+        """Login to Moodle."""
+        result = self.engine.login()
+        if not result['success']:
+            print(f"Login failed: {result['message']}")
+        return result['success']
+    
+    def _course_files(self, course_id):
+        try:
+            result = self.engine.course_files(course_id)
+        except Exception as e:
+            print(f"Error getting course files: {e}")
+            return None
+        if not result.get('success'):
+            print(f"Error getting course files: {result.get('message')}")
+            return None
+        return result
+    
+    def get_course_pdfs(self, course_id):
+        """Get PDFs from a course."""
+        result = self._course_files(course_id)
+        if result is None:
+            return None
+        return {
+            'status': 'success',
+            'message': result.get('message'),
+            'course_name': result.get('course_name'),
+            'count': len(result.get('pdfs', [])),
+            'pdfs': result.get('pdfs', [])
+        }
+    
+    def get_course_resources(self, course_url):
+        """Get resources from a course URL."""
+        from scraper.engine import course_id_from_url, resources_from_pdfs
+        
+        course_id = course_id_from_url(course_url)
+        if not course_id:
+            print(f"Not a Moodle course URL: {course_url}")
+            return None
+        result = self._course_files(course_id)
+        if result is None:
+            return None
+        resources = resources_from_pdfs(result.get('pdfs', []))
+        return {
+            'status': 'success',
+            'course_url': course_url,
+            'authenticated': True,
+            'count': len(resources),
+            'data': resources
+        }
+    
+    def download_file(self, course_url, output_path, files=None):
+        """Download a file from a course URL, or several files as one ZIP when `files` is given."""
+        resources = self.get_course_resources(course_url)
+        if not resources or not resources['data']:
+            print("Error downloading file: no files found in the course")
+            return False
+        
+        try:
+            if files:
+                count = self.engine.download_archive(resources['data'], output_path, files)
+                print(f"Archived {count} files to {output_path}")
+                return count > 0
+            
+            first = resources['data'][0]
+            result = self.engine.download(first['pdf_url'], os.path.dirname(os.path.abspath(output_path)),
+                                          first['pdf_name'] or 'document')
+            if not result['success']:
+                print(f"Error downloading file: {result['message']}")
+                return False
+            if os.path.isfile(result['path']):
+                os.replace(result['path'], output_path)
+            return True
+        except Exception as e:
+            print(f"Error downloading file: {e}")
+            return False
+    
+    def get_category_courses(self, category_id):
+        """Get courses in a category."""
+        from scraper.utils_improved import extract_aalinks
+        
+        links = extract_aalinks(f"{self.engine.url}/course/index.php?categoryid={category_id}")
+        return {
+            'status': 'success',
+            'category_id': category_id,
+            'count': len(links),
+            'data': links
+        }
+    
+    def get_all_courses(self):
+        """Get all courses."""
+        result = self.engine.enrolled_courses()
+        if not result.get('success'):
+            print(f"Error getting all courses: {result.get('message')}")
+            return None
+        return {
+            'status': 'success',
+            'message': result['message'],
+            'count': len(result['courses']),
+            'courses': result['courses']
+        }
+    
+    def get_departments(self):
+        """Get all departments."""
+        from scraper.utils_improved import extract_departments
+        
+        departments = extract_departments()
+        return {
+            'status': 'success',
+            'count': len(departments),
+            'data': departments
+        }
+
 def main():
     """Main function."""
     parser = argparse.ArgumentParser(description='Moodle API Client')
     parser.add_argument('--api-base', default='http://localhost:8000/api', help='Base URL of the API')
     parser.add_argument('--username', required=True, help='Your Moodle username')
     parser.add_argument('--password', required=True, help='Your Moodle password')
+    parser.add_argument('--direct', action='store_true', help='Scrape Moodle in-process instead of going through the API server')
+    parser.add_argument('--moodle-url', default='https://elearning.univ-bba.dz', help='Base URL of Moodle (with --direct)')
     
     subparsers = parser.add_subparsers(dest='command', help='Command to run')
     
@@ -215,6 +346,7 @@ def main():
     download_parser = subparsers.add_parser('download', help='Download a file from a course URL')
     download_parser.add_argument('course_url', help='The URL of the course')
     download_parser.add_argument('output_path', help='The path to save the file')
+    download_parser.add_argument('--files', help="Download several files as one ZIP: 'all', '0,2,5', 'name:TD*' or 'type:pdf'")
     
     # Get category courses command
     category_courses_parser = subparsers.add_parser('category-courses', help='Get courses in a category')
@@ -229,32 +361,35 @@ def main():
     args = parser.parse_args()
     
     # Create the client
-    client = MoodleAPIClient(api_base=args.api_base, username=args.username, password=args.password)
+    if args.direct:
+        client = MoodleDirectClient(username=args.username, password=args.password, moodle_url=args.moodle_url)
+    else:
+        client = MoodleAPIClient(api_base=args.api_base, username=args.username, password=args.password)
     
     # Execute the command
     if args.command == 'login':
         if client.login():
             print("Login successful")
-            print(f"Session cookies: {json.dumps(client.session_cookies, indent=2)}")
+            print(f"API token: {client.token}")
         else:
             print("Login failed")
     
     elif args.command == 'course-pdfs':
         pdfs = client.get_course_pdfs(args.course_id)
         if pdfs:
-            print(json.dumps(pdfs, indent=2))
+            print(json.dumps(pdfs, indent=2, default=dict))
         else:
             print("Failed to get course PDFs")
     
     elif args.command == 'course-resources':
         resources = client.get_course_resources(args.course_url)
         if resources:
-            print(json.dumps(resources, indent=2))
+            print(json.dumps(resources, indent=2, default=dict))
         else:
             print("Failed to get course resources")
     
     elif args.command == 'download':
-        if client.download_file(args.course_url, args.output_path):
+        if client.download_file(args.course_url, args.output_path, files=args.files):
             print(f"File downloaded to {args.output_path}")
         else:
             print("Failed to download file")
@@ -262,21 +397,21 @@ def main():
     elif args.command == 'category-courses':
         courses = client.get_category_courses(args.category_id)
         if courses:
-            print(json.dumps(courses, indent=2))
+            print(json.dumps(courses, indent=2, default=dict))
         else:
             print("Failed to get category courses")
     
     elif args.command == 'all-courses':
         courses = client.get_all_courses()
         if courses:
-            print(json.dumps(courses, indent=2))
+            print(json.dumps(courses, indent=2, default=dict))
         else:
             print("Failed to get all courses")
     
     elif args.command == 'departments':
         departments = client.get_departments()
         if departments:
-            print(json.dumps(departments, indent=2))
+            print(json.dumps(departments, indent=2, default=dict))
         else:
             print("Failed to get departments")
     
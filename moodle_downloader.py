@@ -8,6 +8,7 @@ import json
 import os
 import re
 import sys
+import zipfile
 import requests
 from urllib.parse import urlparse, parse_qs
 
@@ -51,11 +52,65 @@ def download_file(session, url, output_dir='.'):
             for chunk in response.iter_content(chunk_size=8192):
                 f.write(chunk)
         
+        # Moodle folder archives are unpacked into a directory of their own
+        if 'download_folder.php' in url and zipfile.is_zipfile(file_path):
+            return unpack_folder_archive(file_path)
+        
         return file_path
     except Exception as e:
         print(f"Error downloading file: {e}")
         return None
 
+def unpack_folder_archive(archive_path):
+    """Extract a Moodle folder archive next to it and remove the archive."""
+    folder_path = os.path.splitext(archive_path)[0]
+    with zipfile.ZipFile(archive_path) as archive:
+        archive.extractall(folder_path)
+    os.remove(archive_path)
+    return folder_path
+
+def download_moodle_files_direct(url, username, password, output_dir='.'):
+    """Download files from a Moodle course or category in-process, without the API server."""
+    from scraper.engine import MoodleEngine
+
+    id_value = extract_id_from_url(url)
+    if not id_value or ('course/view.php' not in url and 'course/index.php' not in url):
+        print("Unsupported URL type. Please provide a Moodle course or category URL.")
+        return
+
+    base_url = f"{urlparse(url).scheme}://{urlparse(url).netloc}"
+    engine = MoodleEngine(username, password, base_url)
+
+    login_result = engine.login()
+    if not login_result['success']:
+        print(f"Login failed: {login_result['message']}")
+        return
+
+    def report(pdf, result):
+        if result['success']:
+            print(f"Downloaded to {result['path']}")
+        else:
+            print(f"Failed to download {pdf.get('name')}: {result['message']}")
+
+    if 'course/view.php' in url:
+        course_ids = [(id_value, os.path.join(output_dir, f"course_{id_value}"))]
+    else:
+        courses_result = engine.category_courses(id_value)
+        if not courses_result.get('success'):
+            print(f"Failed to get courses: {courses_result.get('message')}")
+            return
+        category_path = os.path.join(output_dir, f"category_{id_value}")
+        course_ids = [
+            (course['id'], os.path.join(category_path, f"course_{course['id']}"))
+            for course in courses_result.get('courses', [])
+        ]
+        print(f"Found {len(course_ids)} courses in category {id_value}")
+
+    for course_id, course_path in course_ids:
+        print(f"Fetching files from course {course_id}...")
+        mirror_result = engine.mirror_course(course_id, course_path, on_file=report)
+        print(mirror_result['message'])
+
 def download_moodle_files(url, username, password, output_dir='.', api_base='http://127.0.0.1:8008/api'):
     """Download files from a Moodle course or category."""
     # Determine if it's a course or category URL
@@ -260,10 +315,14 @@ def main():
     parser.add_argument('password', help='Your Moodle password')
     parser.add_argument('-o', '--output-dir', default='.', help='Output directory for downloaded files')
     parser.add_argument('-a', '--api-base', default='http://127.0.0.1:8008/api', help='Base URL of the API')
+    parser.add_argument('--direct', action='store_true', help='Scrape Moodle in-process instead of going through the API server')
     
     args = parser.parse_args()
     
-    download_moodle_files(args.url, args.username, args.password, args.output_dir, args.api_base)
+    if args.direct:
+        download_moodle_files_direct(args.url, args.username, args.password, args.output_dir)
+    else:
+        download_moodle_files(args.url, args.username, args.password, args.output_dir, args.api_base)
 
 if __name__ == '__main__':
     main()
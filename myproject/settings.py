@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'scraper.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,10 +77,24 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# SQLite tuned for many concurrent crawler writes: WAL lets readers run alongside the writer,
+# synchronous=NORMAL is safe under WAL, writers wait up to `timeout` seconds for the lock
+# instead of failing with "database is locked", and IMMEDIATE transactions take the write
+# lock up front so they cannot deadlock upgrading from a read
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=134217728;'
+                'PRAGMA temp_store=MEMORY'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -124,4 +140,103 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-ALLOWED_HOSTS = ['*']
\ No newline at end of file
+ALLOWED_HOSTS = ['*']
+
+# Moodle scraper settings
+
+# Lifetime in seconds of the API tokens issued by /api/moodle-login/, and how many live
+# tokens (each holding a Moodle session) are kept before the oldest are revoked
+MOODLE_TOKEN_TTL = 30 * 60
+MOODLE_MAX_TOKENS = 1000
+
+# Seconds a session's access to a course, checked on its course page before shared listings
+# and cached files of the course are served, is trusted without asking Moodle again
+MOODLE_ACCESS_TTL = 10 * 60
+
+# Directory and lifetime in seconds of the on-disk cache of downloaded course files
+MOODLE_FILE_CACHE_DIR = '/tmp/moodle_files'
+MOODLE_FILE_CACHE_TTL = 24 * 60 * 60
+
+# Total size in bytes of the cached files; the least recently used are removed beyond it
+MOODLE_FILE_CACHE_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+# Let the front-end server send cached files: None, 'x-sendfile' (Apache/lighttpd)
+# or 'x-accel-redirect' (nginx, with MOODLE_SENDFILE_PREFIX mapped to the cache directory)
+MOODLE_SENDFILE_BACKEND = None
+MOODLE_SENDFILE_PREFIX = '/protected/moodle_files/'
+
+# Per-user enrolled course listings: served as-is for MOODLE_COURSES_CACHE_TTL seconds,
+# then served stale while refreshing in the background until MOODLE_COURSES_STALE_TTL
+MOODLE_COURSES_CACHE_TTL = 5 * 60
+MOODLE_COURSES_STALE_TTL = 60 * 60
+
+# Category tree served by /api/tree/: fresh for MOODLE_TREE_CACHE_TTL seconds, served stale
+# while recrawling until MOODLE_TREE_STALE_TTL, crawled with MOODLE_TREE_WORKERS concurrent fetches
+MOODLE_TREE_CACHE_TTL = 6 * 60 * 60
+MOODLE_TREE_STALE_TTL = 7 * 24 * 60 * 60
+MOODLE_TREE_WORKERS = 8
+# Seconds after a load during which ?refresh= requests are ignored
+MOODLE_TREE_REFRESH_INTERVAL = 5 * 60
+
+# Catalogue of departments, categories, courses and files stored by the crawls: listings
+# younger than MOODLE_CATALOGUE_TTL seconds are served from the database, rows are
+# upserted MOODLE_CATALOGUE_BATCH_SIZE at a time
+MOODLE_CATALOGUE_TTL = 6 * 60 * 60
+MOODLE_CATALOGUE_BATCH_SIZE = 500
+
+# Catalogue and job writes are queued and committed by one background thread, up to
+# MOODLE_DB_WRITE_BATCH writes per transaction, waiting at most MOODLE_DB_WRITE_DELAY seconds
+MOODLE_DB_WRITE_BATCH = 100
+MOODLE_DB_WRITE_DELAY = 0.05
+
+# Cache warmer (`python manage.py warm_cache`): every MOODLE_WARMER_INTERVAL seconds, recrawl
+# up to MOODLE_WARMER_TOP of the most requested courses, sending at most MOODLE_WARMER_RATE
+# requests per second to Moodle. Request scores halve every MOODLE_REQUEST_HALF_LIFE seconds.
+MOODLE_WARMER_USERNAME = os.environ.get('MOODLE_WARMER_USERNAME')
+MOODLE_WARMER_PASSWORD = os.environ.get('MOODLE_WARMER_PASSWORD')
+MOODLE_WARMER_TOP = 20
+MOODLE_WARMER_RATE = 1.0
+MOODLE_WARMER_BURST = 10
+MOODLE_WARMER_INTERVAL = 15 * 60
+MOODLE_REQUEST_HALF_LIFE = 24 * 60 * 60
+
+# HTML parsing of course and resource pages: MOODLE_PARSE_WORKERS processes parse pages of
+# at least MOODLE_PARSE_MIN_SIZE characters outside the GIL; 0 parses in the crawling thread
+MOODLE_PARSE_WORKERS = 0
+MOODLE_PARSE_MIN_SIZE = 32 * 1024
+
+# Moodle requests of the crawler: (connect, read) timeouts per phase, and hedging: with
+# MOODLE_HEDGING, a GET or HEAD slower than the p95 of its phase is sent again and the first
+# answer wins, for at most MOODLE_HEDGE_BUDGET extra requests per request (MOODLE_HEDGE_BURST at once)
+MOODLE_FETCH_TIMEOUTS = {
+    'login': (5, 30),
+    'page': (5, 30),
+    'resource': (5, 20),
+    'probe': (5, 10),
+}
+MOODLE_HEDGING = False
+MOODLE_HEDGE_BUDGET = 0.05
+MOODLE_HEDGE_BURST = 5
+
+# API responses: JSON is encoded with orjson when it is installed, and responses of at least
+# MOODLE_COMPRESS_MIN_SIZE bytes are compressed (brotli when installed and accepted, else gzip)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'scraper.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+MOODLE_COMPRESS_MIN_SIZE = 1024
+MOODLE_BROTLI_QUALITY = 5
+
+# Listing pagination: `limit`/`cursor` page through the catalogue, MOODLE_PAGE_SIZE items per
+# page unless the client asks for a `limit`, which may not exceed MOODLE_MAX_PAGE_SIZE
+MOODLE_PAGE_SIZE = 100
+MOODLE_MAX_PAGE_SIZE = 500
+
+# Background crawl and export jobs (/api/jobs/): finished jobs and their archives, written
+# to MOODLE_JOB_DIR, are kept MOODLE_JOB_TTL seconds; idle event streams get a keepalive
+# comment every MOODLE_JOB_KEEPALIVE seconds
+MOODLE_JOB_DIR = '/tmp/moodle_jobs'
+MOODLE_JOB_TTL = 60 * 60
+MOODLE_JOB_KEEPALIVE = 15
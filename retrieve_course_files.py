@@ -13,6 +13,35 @@ def debug(msg):
     """Simple debug printer."""
     print(f'[DEBUG] {msg}', file=sys.stderr)
 
+def print_download(pdf, result):
+    """Report the result of one direct download."""
+    if result['success']:
+        print(f"Downloaded {result['name']} to {result['path']}")
+    else:
+        print(f"Error downloading {result['name']}: {result['message']}")
+
+def retrieve_course_files_direct(course_url, username, password, output_dir='.'):
+    """Retrieve files from a Moodle course URL in-process, without the API server."""
+    from urllib.parse import urlparse
+    from scraper.engine import MoodleEngine, course_id_from_url
+
+    course_id = course_id_from_url(course_url)
+    if not course_id:
+        print(f"Not a Moodle course URL: {course_url}")
+        return
+
+    print(f"Retrieving resources from {course_url}...")
+
+    parsed_url = urlparse(course_url)
+    engine = MoodleEngine(username, password, f"{parsed_url.scheme}://{parsed_url.netloc}")
+    login_result = engine.login()
+    if not login_result['success']:
+        print(f"Login failed: {login_result['message']}")
+        return
+
+    result = engine.mirror_course(course_id, output_dir, on_file=print_download)
+    print(result['message'])
+
 def retrieve_course_files(course_url, username, password, output_dir='.', api_base='http://127.0.0.1:8008/api'):
     """Retrieve files from a Moodle course URL."""
     # Create the output directory if it doesn't exist
@@ -151,10 +180,14 @@ def main():
     parser.add_argument('password', help='Your Moodle password')
     parser.add_argument('-o', '--output-dir', default='.', help='Output directory for downloaded files')
     parser.add_argument('-a', '--api-base', default='http://127.0.0.1:8008/api', help='Base URL of the API')
+    parser.add_argument('--direct', action='store_true', help='Scrape Moodle in-process instead of going through the API server')
     
     args = parser.parse_args()
     
-    retrieve_course_files(args.course_url, args.username, args.password, args.output_dir, args.api_base)
+    if args.direct:
+        retrieve_course_files_direct(args.course_url, args.username, args.password, args.output_dir)
+    else:
+        retrieve_course_files(args.course_url, args.username, args.password, args.output_dir, args.api_base)
 
 if __name__ == '__main__':
     main()
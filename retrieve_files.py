@@ -13,6 +13,28 @@ def debug(msg):
     """Simple debug printer."""
     print(f'[DEBUG] {msg}', file=sys.stderr)
 
+def print_download(pdf, result):
+    """Report the result of one direct download."""
+    if result['success']:
+        print(f"Downloaded {result['name']} to {result['path']}")
+    else:
+        print(f"Error downloading {result['name']}: {result['message']}")
+
+def retrieve_files_direct(course_id, username, password, output_dir='.', moodle_url='https://elearning.univ-bba.dz'):
+    """Retrieve files from a Moodle course in-process, without the API server."""
+    from scraper.engine import MoodleEngine
+
+    print(f"Retrieving files from course {course_id}...")
+
+    engine = MoodleEngine(username, password, moodle_url)
+    login_result = engine.login()
+    if not login_result['success']:
+        print(f"Login failed: {login_result['message']}")
+        return
+
+    result = engine.mirror_course(course_id, output_dir, on_file=print_download)
+    print(result['message'])
+
 def retrieve_files(course_id, username, password, output_dir='.', api_base='http://127.0.0.1:8008/api'):
     """Retrieve files from a Moodle course."""
     # Create the output directory if it doesn't exist
@@ -108,10 +130,15 @@ def main():
     parser.add_argument('password', help='Your Moodle password')
     parser.add_argument('-o', '--output-dir', default='.', help='Output directory for downloaded files')
     parser.add_argument('-a', '--api-base', default='http://127.0.0.1:8008/api', help='Base URL of the API')
+    parser.add_argument('--direct', action='store_true', help='Scrape Moodle in-process instead of going through the API server')
+    parser.add_argument('-m', '--moodle-url', default='https://elearning.univ-bba.dz', help='Base URL of Moodle (with --direct)')
     
     args = parser.parse_args()
     
-    retrieve_files(args.course_id, args.username, args.password, args.output_dir, args.api_base)
+    if args.direct:
+        retrieve_files_direct(args.course_id, args.username, args.password, args.output_dir, args.moodle_url)
+    else:
+        retrieve_files(args.course_id, args.username, args.password, args.output_dir, args.api_base)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+import weakref
+
+import requests
+
+from . import fetch
+
+logger = logging.getLogger(__name__)
+
+# Seconds a session's access to a course is trusted once Moodle confirmed it
+DEFAULT_ACCESS_TTL = 10 * 60
+
+# Where Moodle sends users who may not open a course page
+LOGIN_PATH = '/login/index.php'
+ENROL_PATH = '/enrol/index.php'
+
+# Courses each session was seen to open, with the time of the check
+_verified = weakref.WeakKeyDictionary()
+_verified_lock = threading.Lock()
+
+
+def _remember(session, url, course_id):
+    with _verified_lock:
+        _verified.setdefault(session, {})[(url, str(course_id))] = time.monotonic()
+
+
+def verified_courses(session, url):
+    """
+    Return the IDs of the courses the session was verified for within MOODLE_ACCESS_TTL
+    """
+    # Imported here: the command line engine uses this module without Django settings
+    from django.conf import settings
+
+    ttl = getattr(settings, 'MOODLE_ACCESS_TTL', DEFAULT_ACCESS_TTL) if settings.configured else DEFAULT_ACCESS_TTL
+    now = time.monotonic()
+    with _verified_lock:
+        checks = dict(_verified.get(session, {}))
+    return {course_id for (site, course_id), checked_at in checks.items() if site == url and now - checked_at < ttl}
+
+
+def verify_course_access(session, url, course_id):
+    """
+    Check with Moodle that a session may see a course
+
+    Stored listings and cached files are shared by every user, so they are
+    only served to a session that can open the course page itself. Only the
+    status of the page is read, without following redirects: Moodle sends
+    sessions that are not logged in to the login page, and users who are not
+    enrolled to the enrolment page. Successful checks are remembered for the
+    session for MOODLE_ACCESS_TTL seconds.
+
+    Args:
+        session (requests.Session): The caller's session
+        url (str): The Moodle URL
+        course_id (str): The course ID
+
+    Returns:
+        dict: `success`, `message`, and `status`, the HTTP status to refuse the caller with
+    """
+    if session is not None and str(course_id) in verified_courses(session, url):
+        return {'success': True, 'message': 'Access verified', 'status': 200}
+
+    if session is None:
+        return {'success': False, 'message': 'Not logged in', 'status': 401}
+
+    course_url = f"{url}/course/view.php?id={course_id}"
+    try:
+        response = fetch.get(session, course_url, 'probe', allow_redirects=False, stream=True)
+        response.close()
+    except requests.RequestException as e:
+        logger.warning(f"Could not verify access to course {course_id}: {e}")
+        return {'success': False, 'message': f"Could not verify access to course {course_id}: {e}", 'status': 502}
+
+    location = response.headers.get('Location', '')
+    if response.status_code == 200:
+        _remember(session, url, course_id)
+        return {'success': True, 'message': 'Access verified', 'status': 200}
+    if response.is_redirect and LOGIN_PATH in location:
+        return {'success': False, 'message': 'Not logged in or session expired', 'status': 401}
+    if response.is_redirect and ENROL_PATH in location:
+        return {'success': False, 'message': f"Not enrolled in course {course_id}", 'status': 403}
+    if response.status_code == 404:
+        return {'success': False, 'message': f"Course {course_id} not found", 'status': 404}
+
+    logger.warning(f"Unexpected answer {response.status_code} when checking access to course {course_id}")
+    return {'success': False, 'message': f"Could not verify access to course {course_id}", 'status': 403}
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ScraperConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scraper'
+
+    def ready(self):
+        from . import fetch, parse_pool
+
+        fetch.configure(
+            hedging=getattr(settings, 'MOODLE_HEDGING', False),
+            timeouts=getattr(settings, 'MOODLE_FETCH_TIMEOUTS', None),
+            budget=getattr(settings, 'MOODLE_HEDGE_BUDGET', fetch.DEFAULT_HEDGE_BUDGET),
+            burst=getattr(settings, 'MOODLE_HEDGE_BURST', fetch.DEFAULT_HEDGE_BURST)
+        )
+        parse_pool.configure(
+            getattr(settings, 'MOODLE_PARSE_WORKERS', 0),
+            getattr(settings, 'MOODLE_PARSE_MIN_SIZE', parse_pool.DEFAULT_MIN_OFFLOAD_SIZE)
+        )
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Keys currently being refreshed in the background, so a burst of requests starts one refresh
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def put(key, value, stale_ttl):
+    """
+    Store a freshly loaded value, as get_or_refresh() would
+
+    Returns:
+        dict: The cache entry, with `value` and `fetched_at` keys
+    """
+    entry = {'value': value, 'fetched_at': time.time()}
+    cache.set(key, entry, timeout=stale_ttl)
+    return entry
+
+
+def peek(key):
+    """
+    Return the cached value whatever its age, or None
+    """
+    entry = cache.get(key)
+    return entry['value'] if entry is not None else None
+
+
+def _load(key, loader, stale_ttl):
+    value = loader()
+    entry = {'value': value, 'fetched_at': time.time()}
+
+    # Failed results (`success` False) are returned but never cached
+    if isinstance(value, dict) and value.get('success') is False:
+        return entry
+
+    return put(key, value, stale_ttl)
+
+
+def _refresh(key, loader, stale_ttl):
+    try:
+        _load(key, loader, stale_ttl)
+        logger.info(f"Refreshed cache entry {key}")
+    except Exception as e:
+        logger.error(f"Background refresh of {key} failed: {str(e)}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def refresh_in_background(key, loader, stale_ttl):
+    """
+    Reload a cache entry in a daemon thread unless a refresh is already running
+    """
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+
+    threading.Thread(target=_refresh, args=(key, loader, stale_ttl), daemon=True).start()
+    return True
+
+
+def refresh_now(key, loader, stale_ttl, min_interval):
+    """
+    Reload a cache entry inline, as asked for by a client, unless that would hammer the source
+
+    The reload is skipped while another refresh of the key runs, or when the
+    entry was loaded less than `min_interval` seconds ago.
+
+    Returns:
+        dict: The new cache entry, or None if the refresh was skipped
+    """
+    entry = cache.get(key)
+    if entry is not None and time.time() - entry['fetched_at'] < min_interval:
+        return None
+
+    with _refreshing_lock:
+        if key in _refreshing:
+            return None
+        _refreshing.add(key)
+
+    try:
+        return put(key, loader(), stale_ttl)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def get_or_refresh(key, loader, ttl, stale_ttl):
+    """
+    Read a value from the Django cache, serving stale copies while they refresh
+
+    Entries younger than `ttl` are returned as they are. Older entries are still
+    returned until `stale_ttl`, but trigger a background reload so the next
+    request gets fresh data. Missing or expired entries are loaded inline.
+
+    Args:
+        key (str): The cache key
+        loader (callable): Returns the value; a dict with `success` False is not cached
+        ttl (int): Age in seconds after which an entry is refreshed
+        stale_ttl (int): Age in seconds after which an entry is no longer served
+
+    Returns:
+        dict: `value`, `fetched_at` (timestamp of the load) and `stale` (True
+            when a background refresh was triggered)
+    """
+    entry = cache.get(key)
+
+    if entry is not None:
+        age = time.time() - entry['fetched_at']
+        if age < ttl:
+            return dict(entry, stale=False)
+        if age < stale_ttl:
+            refresh_in_background(key, loader, stale_ttl)
+            return dict(entry, stale=True)
+
+    return dict(_load(key, loader, stale_ttl), stale=False)
+
+
+def invalidate(key):
+    cache.delete(key)
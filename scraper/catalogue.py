@@ -0,0 +1,652 @@
+import hashlib
+import json
+import logging
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Category, Change, Course, Department, File, Listing, Resource
+from .records import FOLDER_ARCHIVE, CourseFile, Link, type_tag
+
+logger = logging.getLogger(__name__)
+
+# Rows written per INSERT ... ON CONFLICT statement
+DEFAULT_BATCH_SIZE = 500
+
+# Age in seconds after which stored listings are crawled again
+DEFAULT_CATALOGUE_TTL = 6 * 60 * 60
+
+# Half-life in seconds of the request score of a course
+DEFAULT_REQUEST_HALF_LIFE = 24 * 60 * 60
+
+# Placeholder entries returned by the scrapers when a page could not be read
+PLACEHOLDER_IDS = ('auth_required', 'not_found', 'error')
+
+# Listing keys of the departments' and front page courses' content hashes, kept for conditional requests
+DEPARTMENTS_LISTING = 'departments'
+FRONT_PAGE_LISTING = 'front-page'
+
+# Kinds of the entries of the course change log
+RESOURCE_ADDED = 'resource_added'
+RESOURCE_REMOVED = 'resource_removed'
+RESOURCE_RENAMED = 'resource_renamed'
+FILE_ADDED = 'file_added'
+FILE_REMOVED = 'file_removed'
+FILE_CHANGED = 'file_changed'
+
+MODULE_ID_PATTERN = re.compile(r'/mod/\w+/view\.php\?(?:.*&)?id=(\d+)')
+COURSE_ID_PATTERN = re.compile(r'course/view\.php\?(?:.*&)?id=(\d+)')
+
+
+def url_hash(url):
+    """
+    Return the SHA-256 of a URL, the indexed lookup key of resources and files
+    """
+    return hashlib.sha256((url or '').encode('utf-8')).hexdigest()
+
+
+def category_listing(category_id):
+    return f"category:{category_id}"
+
+
+def files_listing(course_id):
+    return f"files:{course_id}"
+
+
+def content_hash(listing):
+    """
+    Return the SHA-256 of a listing's content: the same items, in the same order, always hash the same
+    """
+    encoded = json.dumps(listing, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=dict)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def departments_hash(departments):
+    """
+    Return the content hash store_departments() records for an extract_departments() result, or None if it stores nothing
+    """
+    rows = [[department['id'], department['name'], department['url']]
+            for department in departments if department.get('id') not in PLACEHOLDER_IDS]
+    return content_hash(rows) if rows else None
+
+
+def front_page_hash(courses):
+    """
+    Return the content hash record_front_page() records for a scrape_elearning_courses() result, or None if it records nothing
+    """
+    rows = [course for course in courses if COURSE_ID_PATTERN.search(course.get('url') or '')]
+    return content_hash(rows) if rows else None
+
+
+def category_courses_hash(courses):
+    """
+    Return the content hash of the {id, name, url} courses of a category
+    """
+    return content_hash([[course['id'], course['name'], course['url']] for course in courses])
+
+
+def category_links_hash(links):
+    """
+    Return the content hash store_category_links() records for an extract_aalinks() result, or None if it stores nothing
+    """
+    courses = _links_courses(links)
+    return category_courses_hash(courses) if courses else None
+
+
+def course_files_hash(pdfs_result):
+    """
+    Return the content hash store_course_files() records for a get_course_pdfs() result
+    """
+    return content_hash({'course_name': pdfs_result.get('course_name'), 'pdfs': pdfs_result.get('pdfs', [])})
+
+
+def _record_listings(site, hashes, now):
+    """
+    Record the content hashes of freshly crawled listings
+
+    `changed_at` only moves for the listings whose hash differs from the stored one.
+
+    Args:
+        site (str): The Moodle URL
+        hashes (dict): Listing key to content hash
+        now (datetime): The crawl time
+
+    Returns:
+        list: Keys of the listings that are new or changed
+    """
+    stored = {listing.key: listing for listing in Listing.objects.filter(site=site, key__in=list(hashes))}
+    changed = [key for key, value in hashes.items() if key not in stored or stored[key].content_hash != value]
+    _upsert(Listing, [
+        Listing(site=site, key=key, content_hash=value, checked_at=now,
+                changed_at=now if key in changed else stored[key].changed_at)
+        for key, value in hashes.items()
+    ], ['site', 'key'], ['content_hash', 'changed_at', 'checked_at'])
+    return changed
+
+
+def listing_version(site, key):
+    """
+    Return the stored version of a listing
+
+    Returns:
+        dict: `content_hash`, `changed_at` and `checked_at`, or None if the listing was never stored
+    """
+    return Listing.objects.filter(site=site, key=key).values('content_hash', 'changed_at', 'checked_at').first()
+
+
+def files_changed_at(site, course_ids):
+    """
+    Return when the stored file listing of each course last changed
+
+    Returns:
+        dict: Course ID to a Unix timestamp, for the courses whose files were ever stored
+    """
+    keys = {files_listing(course_id): str(course_id) for course_id in course_ids}
+    return {
+        keys[listing['key']]: int(listing['changed_at'].timestamp())
+        for listing in Listing.objects.filter(site=site, key__in=list(keys)).values('key', 'changed_at')
+    }
+
+
+def is_fresh(crawled_at, max_age=None):
+    """
+    Tell whether a listing crawled at `crawled_at` can still be served without going to Moodle
+    """
+    if crawled_at is None:
+        return False
+    if max_age is None:
+        max_age = getattr(settings, 'MOODLE_CATALOGUE_TTL', DEFAULT_CATALOGUE_TTL)
+    return timezone.now() - crawled_at < timedelta(seconds=max_age)
+
+
+def _upsert(model, objs, unique_fields, update_fields):
+    """
+    Insert rows, updating `update_fields` of the rows that already exist, in batches
+    """
+    if objs:
+        model.objects.bulk_create(
+            objs,
+            batch_size=getattr(settings, 'MOODLE_CATALOGUE_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields
+        )
+
+
+def store_departments(site, departments):
+    """
+    Replace the stored departments of a site with a fresh extract_departments() result
+
+    Returns:
+        int: Number of departments stored
+    """
+    now = timezone.now()
+    rows = {
+        department['id']: Department(site=site, moodle_id=department['id'], name=department['name'],
+                                     url=department['url'], crawled_at=now)
+        for department in departments if department.get('id') not in PLACEHOLDER_IDS
+    }
+    if not rows:
+        return 0
+
+    with transaction.atomic():
+        _upsert(Department, list(rows.values()), ['site', 'moodle_id'], ['name', 'url', 'crawled_at'])
+        Department.objects.filter(site=site, crawled_at__lt=now).delete()
+        _record_listings(site, {DEPARTMENTS_LISTING: departments_hash(departments)}, now)
+
+    return len(rows)
+
+
+def record_front_page(site, courses):
+    """
+    Record the content hash of a scrape_elearning_courses() result
+
+    The front page courses have no IDs, so only the hash is kept, for the
+    validators of the next scrape.
+
+    Returns:
+        bool: True if a hash was recorded
+    """
+    listing_hash = front_page_hash(courses)
+    if listing_hash is None:
+        return False
+    _record_listings(site, {FRONT_PAGE_LISTING: listing_hash}, timezone.now())
+    return True
+
+
+def departments(site, max_age=None):
+    """
+    Return the stored departments in the extract_departments() format, or None if they are missing or stale
+    """
+    rows = list(Department.objects.filter(site=site))
+    if not rows or not is_fresh(min(row.crawled_at for row in rows), max_age):
+        return None
+    return [{'id': row.moodle_id, 'name': row.name, 'url': row.url} for row in rows]
+
+
+def _store_category_courses(site, category_courses, now):
+    """
+    Upsert the courses of several categories and mark their listings as crawled
+
+    Args:
+        site (str): The Moodle URL
+        category_courses (dict): Category ID to list of {id, name, url} courses
+        now (datetime): The crawl time
+    """
+    courses = {}
+    for category_id, entries in category_courses.items():
+        for course in entries:
+            courses.setdefault(course['id'], Course(
+                site=site, moodle_id=course['id'], category_moodle_id=category_id,
+                name=course['name'], url=course['url'], crawled_at=now
+            ))
+
+    _upsert(Course, list(courses.values()), ['site', 'moodle_id'], ['category_moodle_id', 'name', 'url', 'crawled_at'])
+    Category.objects.filter(site=site, moodle_id__in=list(category_courses)).update(courses_crawled_at=now)
+    _record_listings(site, {
+        category_listing(category_id): category_courses_hash(entries) for category_id, entries in category_courses.items()
+    }, now)
+
+
+def store_category_tree(site, tree):
+    """
+    Store the categories and courses of a crawl_category_tree() result
+
+    Categories whose page failed to load keep their stored courses.
+
+    Returns:
+        int: Number of categories stored
+    """
+    now = timezone.now()
+    nodes = [node for node_id, node in tree['categories'].items() if node_id != tree.get('root') and node.get('name')]
+    categories = [
+        Category(site=site, moodle_id=node['id'], parent_moodle_id=node.get('parent') or '',
+                 name=node['name'], crawled_at=now)
+        for node in nodes
+    ]
+    for category in categories:
+        if category.parent_moodle_id == tree.get('root'):
+            category.parent_moodle_id = ''
+
+    with transaction.atomic():
+        _upsert(Category, categories, ['site', 'moodle_id'], ['parent_moodle_id', 'name', 'crawled_at'])
+        _store_category_courses(site, {node['id']: node['courses'] for node in nodes if 'error' not in node}, now)
+
+    return len(categories)
+
+
+def store_category_links(site, category_id, links):
+    """
+    Store the courses of one category from an extract_aalinks() result
+
+    Returns:
+        int: Number of courses stored
+    """
+    courses = _links_courses(links)
+    if not courses:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        _upsert(Category, [Category(site=site, moodle_id=str(category_id), name=f"Category {category_id}", crawled_at=now)],
+                ['site', 'moodle_id'], ['crawled_at'])
+        _store_category_courses(site, {str(category_id): courses}, now)
+
+    return len(courses)
+
+
+def _links_courses(links):
+    courses = []
+    for link in links:
+        course_match = COURSE_ID_PATTERN.search(link.get('href', ''))
+        if course_match and 'error' not in link:
+            courses.append({'id': course_match.group(1), 'name': link['text'], 'url': link['href']})
+    return courses
+
+
+def category_courses(site, category_id, max_age=None):
+    """
+    Return the stored courses of a category as extract_aalinks() links, or None if missing or stale
+    """
+    category = Category.objects.filter(site=site, moodle_id=str(category_id)).first()
+    if category is None or not is_fresh(category.courses_crawled_at, max_age):
+        return None
+
+    courses = Course.objects.filter(site=site, category_moodle_id=str(category_id))
+    return [Link(text=course.name, href=course.url, course_id=course.moodle_id) for course in courses]
+
+
+def _page(rows, limit, key):
+    """
+    Split the `limit + 1` rows of a keyset query into the page and the key the next page starts after
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], key(rows[limit - 1])
+
+
+def category_courses_page(site, category_id, after=None, limit=100):
+    """
+    Return one page of the stored courses of a category, in storage order
+
+    Pages are read with the (site, category) index, after the ID of the last
+    course of the previous page, so every page costs the same whatever the
+    size of the category.
+
+    Returns:
+        dict: `links`, `crawled_at` of the listing and `next_after` (None on the
+            last page), or None if the category courses were never crawled
+    """
+    category = Category.objects.filter(site=site, moodle_id=str(category_id)).first()
+    if category is None or category.courses_crawled_at is None:
+        return None
+
+    courses = Course.objects.filter(site=site, category_moodle_id=str(category_id)).order_by('id')
+    if after is not None:
+        courses = courses.filter(id__gt=after)
+    courses, next_after = _page(courses[:limit + 1], limit, lambda course: course.id)
+
+    return {
+        'links': [Link(text=course.name, href=course.url, course_id=course.moodle_id) for course in courses],
+        'crawled_at': category.courses_crawled_at,
+        'next_after': next_after
+    }
+
+
+def courses_page(site, after=None, limit=100):
+    """
+    Return one page of the public courses of a site, in storage order
+
+    Only courses found on the category pages guests see are listed: courses
+    the catalogue only knows from a logged-in user's file crawl are left out.
+    The page's `changed_at` is the last change of the category and file
+    listings its courses were stored from.
+
+    Returns:
+        dict: `courses` ({id, name, shortname, url, category_id} dicts), `next_after`,
+            the `content_hash` of the page and its `changed_at` (None for an empty page)
+    """
+    courses = Course.objects.filter(site=site).exclude(category_moodle_id='').order_by('id')
+    if after is not None:
+        courses = courses.filter(id__gt=after)
+    courses, next_after = _page(courses[:limit + 1], limit, lambda course: course.id)
+
+    rows = [
+        {'id': course.moodle_id, 'name': course.name, 'shortname': course.shortname,
+         'url': course.url, 'category_id': course.category_moodle_id}
+        for course in courses
+    ]
+    keys = {category_listing(course.category_moodle_id) for course in courses}
+    keys.update(files_listing(course.moodle_id) for course in courses)
+    changed_at = Listing.objects.filter(site=site, key__in=list(keys)).aggregate(Max('changed_at'))['changed_at__max']
+
+    return {
+        'courses': rows,
+        'next_after': next_after,
+        'content_hash': content_hash({'courses': rows, 'next_after': next_after}),
+        'changed_at': changed_at
+    }
+
+
+def store_course_files(site, course_id, pdfs_result):
+    """
+    Replace the stored resources and files of a course with a get_course_pdfs() result
+
+    Files keep their order on the course page, so `files` selectors by index
+    pick the same entries from stored and freshly crawled listings.
+
+    Returns:
+        int: Number of files stored
+    """
+    now = timezone.now()
+    course_id = str(course_id)
+    pdfs = pdfs_result.get('pdfs', [])
+    listing_hash = course_files_hash(pdfs_result)
+
+    with transaction.atomic():
+        # The stored listing is only compared with the crawl when its content hash differs
+        version = listing_version(site, files_listing(course_id))
+        if version is None or version['content_hash'] != listing_hash:
+            old_files = list(File.objects.filter(resource__course__site=site, resource__course__moodle_id=course_id)
+                             .select_related('resource'))
+            old_resources = {file.resource.url_hash: file.resource for file in old_files}
+        else:
+            old_files = old_resources = None
+
+        _upsert(Course, [Course(
+            site=site, moodle_id=course_id, name=pdfs_result.get('course_name') or f"Course {course_id}",
+            url=f"{site}/course/view.php?id={course_id}", crawled_at=now, files_crawled_at=now
+        )], ['site', 'moodle_id'], ['name', 'crawled_at', 'files_crawled_at'])
+        course = Course.objects.get(site=site, moodle_id=course_id)
+
+        resources = {}
+        for pdf in pdfs:
+            resource_url = pdf.get('resource_url') or pdf.get('url') or ''
+            module_match = MODULE_ID_PATTERN.search(resource_url)
+            resources.setdefault(url_hash(resource_url), Resource(
+                course=course, moodle_id=module_match.group(1) if module_match else '',
+                name=pdf.get('resource_name') or pdf.get('name') or '', url=resource_url,
+                url_hash=url_hash(resource_url), crawled_at=now
+            ))
+        _upsert(Resource, list(resources.values()), ['course', 'url_hash'], ['moodle_id', 'name', 'url', 'crawled_at'])
+        resource_ids = dict(course.resources.filter(url_hash__in=list(resources)).values_list('url_hash', 'id'))
+
+        files = {}
+        for position, pdf in enumerate(pdfs):
+            resource_hash = url_hash(pdf.get('resource_url') or pdf.get('url') or '')
+            files.setdefault((resource_hash, url_hash(pdf.get('url'))), File(
+                resource_id=resource_ids[resource_hash], name=pdf.get('name') or '', url=pdf.get('url') or '',
+                url_hash=url_hash(pdf.get('url')), type=pdf.get('type') or '', position=position,
+                members=pdf.get('files', []), crawled_at=now
+            ))
+        _upsert(File, list(files.values()), ['resource', 'url_hash'], ['name', 'url', 'type', 'position', 'members', 'crawled_at'])
+
+        # Whatever the crawl no longer lists is gone from the course
+        File.objects.filter(resource__course=course, crawled_at__lt=now).delete()
+        course.resources.filter(crawled_at__lt=now).delete()
+        _record_listings(site, {files_listing(course_id): listing_hash}, now)
+
+        if old_files is not None:
+            changes = _course_changes(site, course_id, old_resources, old_files, resources, files, now)
+            Change.objects.bulk_create(changes)
+            if changes:
+                logger.info(f"Logged {len(changes)} changes of course {course_id}")
+
+    logger.info(f"Stored {len(files)} files in {len(resources)} resources of course {course_id}")
+    return len(files)
+
+
+def _course_changes(site, course_id, old_resources, old_files, resources, files, now):
+    """
+    Compare the stored resources and files of a course with a crawl of it
+
+    Args:
+        site (str): The Moodle URL
+        course_id (str): The course ID
+        old_resources (dict): URL hash to the stored Resource
+        old_files (list): The stored Files, with their resource
+        resources (dict): URL hash to the crawled Resource
+        files (dict): (resource URL hash, file URL hash) to the crawled File
+        now (datetime): The crawl time
+
+    Returns:
+        list: The unsaved Change entries, resources before files
+    """
+    def change(kind, resource, file=None, previous=''):
+        return Change(
+            site=site, course_moodle_id=course_id, kind=kind, resource_name=resource.name, resource_url=resource.url,
+            file_name=file.name if file else '', file_url=file.url if file else '', previous=previous or '', created_at=now
+        )
+
+    changes = []
+    for resource_hash, resource in resources.items():
+        old = old_resources.get(resource_hash)
+        if old is None:
+            changes.append(change(RESOURCE_ADDED, resource))
+        elif old.name != resource.name:
+            changes.append(change(RESOURCE_RENAMED, resource, previous=old.name))
+    changes.extend(change(RESOURCE_REMOVED, old) for resource_hash, old in old_resources.items() if resource_hash not in resources)
+
+    stored = {(file.resource.url_hash, file.url_hash): file for file in old_files}
+    for key, file in files.items():
+        old = stored.get(key)
+        if old is None:
+            changes.append(change(FILE_ADDED, resources[key[0]], file))
+        elif (old.name, old.type, old.members) != (file.name, file.type, file.members):
+            changes.append(change(FILE_CHANGED, resources[key[0]], file, previous=old.name))
+    changes.extend(change(FILE_REMOVED, old.resource, old) for key, old in stored.items() if key not in files)
+
+    return changes
+
+
+def changes(site, after=0, limit=100, course_ids=None):
+    """
+    Return the change log entries following the entry `after`, oldest first
+
+    Args:
+        site (str): The Moodle URL
+        after (int): ID of the last entry the client has seen, 0 for the whole log
+        limit (int): Maximum number of entries
+        course_ids (list): Only the changes of these courses, None for every course
+
+    Returns:
+        dict: `changes`, `last_id` (of the last entry returned, or `after`) and
+            `has_more` when further entries follow
+    """
+    entries = Change.objects.filter(site=site, id__gt=after).order_by('id')
+    if course_ids is not None:
+        entries = entries.filter(course_moodle_id__in=[str(course_id) for course_id in course_ids])
+    entries = list(entries[:limit + 1])
+
+    return {
+        'changes': [
+            {key: value for key, value in (
+                ('course_id', entry.course_moodle_id), ('kind', entry.kind),
+                ('resource_name', entry.resource_name), ('resource_url', entry.resource_url),
+                ('file_name', entry.file_name), ('file_url', entry.file_url), ('previous', entry.previous),
+                ('changed_at', int(entry.created_at.timestamp()))
+            ) if value != ''}
+            for entry in entries[:limit]
+        ],
+        'last_id': entries[:limit][-1].id if entries else after,
+        'has_more': len(entries) > limit
+    }
+
+
+def course_files(site, course_id, max_age=None):
+    """
+    Return the stored files of a course in the get_course_pdfs() format
+
+    Returns:
+        dict: `course_name`, `pdfs` and `crawled_at`, or None if the course
+            files were never crawled or are stale
+    """
+    course = Course.objects.filter(site=site, moodle_id=str(course_id)).first()
+    if course is None or not is_fresh(course.files_crawled_at, max_age):
+        return None
+
+    pdfs = [_course_file(file) for file in File.objects.filter(resource__course=course).select_related('resource')]
+
+    return {'course_name': course.name, 'pdfs': pdfs, 'crawled_at': course.files_crawled_at}
+
+
+def course_files_page(site, course_id, after=None, limit=100):
+    """
+    Return one page of the stored files of a course, in course page order
+
+    Pages resume after the ID of the last file of the previous page, at its
+    current position: files keep their ID across recrawls, so a file added or
+    removed before it does not make the next page skip or repeat files. Pages
+    stay in the order of get_course_pdfs() and of `files` index selectors.
+
+    Returns:
+        dict: `course_name`, `pdfs`, `crawled_at` and `next_after` (None on the
+            last page), or None if the course files were never crawled or the
+            file `after` is no longer listed
+    """
+    course = Course.objects.filter(site=site, moodle_id=str(course_id)).first()
+    if course is None or course.files_crawled_at is None:
+        return None
+
+    files = File.objects.filter(resource__course=course).select_related('resource').order_by('position', 'id')
+    if after is not None:
+        position = File.objects.filter(id=after, resource__course=course).values_list('position', flat=True).first()
+        if position is None:
+            return None
+        files = files.filter(Q(position__gt=position) | Q(position=position, id__gt=after))
+    files, next_after = _page(files[:limit + 1], limit, lambda file: file.id)
+
+    return {
+        'course_name': course.name,
+        'pdfs': [_course_file(file) for file in files],
+        'crawled_at': course.files_crawled_at,
+        'next_after': next_after
+    }
+
+
+def _course_file(file):
+    return CourseFile(
+        name=file.name,
+        url=file.url,
+        resource_name=file.resource.name,
+        resource_url=file.resource.url,
+        type=type_tag(file.type),
+        files=file.members if file.type == FOLDER_ARCHIVE else None
+    )
+
+
+def record_content_hash(url, content_hash, size):
+    """
+    Attach the hash and size of a downloaded body to the stored files with that URL
+
+    A file whose body differs from the one downloaded before is logged as changed.
+
+    Returns:
+        int: Number of files updated
+    """
+    files = File.objects.filter(url_hash=url_hash(url))
+    with transaction.atomic():
+        Change.objects.bulk_create([
+            Change(
+                site=file.resource.course.site, course_moodle_id=file.resource.course.moodle_id, kind=FILE_CHANGED,
+                resource_name=file.resource.name, resource_url=file.resource.url, file_name=file.name,
+                file_url=file.url, previous=file.content_hash, created_at=timezone.now()
+            )
+            for file in files.exclude(content_hash='').exclude(content_hash=content_hash).select_related('resource__course')
+        ])
+        return files.update(content_hash=content_hash, size=size)
+
+
+def decayed_score(score, last_requested_at, now=None, half_life=None):
+    """
+    Return a request score decayed from `last_requested_at` to `now`
+    """
+    if last_requested_at is None:
+        return 0.0
+    if half_life is None:
+        half_life = getattr(settings, 'MOODLE_REQUEST_HALF_LIFE', DEFAULT_REQUEST_HALF_LIFE)
+    elapsed = max(0.0, ((now or timezone.now()) - last_requested_at).total_seconds())
+    return score * 0.5 ** (elapsed / half_life)
+
+
+def record_course_request(site, course_id, requested_at):
+    """
+    Count a request for the files of a course in its decayed request score
+
+    Runs a read-modify-write, so it is queued through db_writer, whose single
+    thread serializes the updates. Only courses already in the catalogue are
+    counted: no placeholder row is created for an unknown course ID.
+    """
+    course = Course.objects.filter(site=site, moodle_id=str(course_id)).first()
+    if course is None:
+        logger.debug(f"Not counting a request for course {course_id}, which is not in the catalogue")
+        return
+
+    course.request_score = decayed_score(course.request_score, course.last_requested_at, requested_at) + 1
+    course.last_requested_at = max(requested_at, course.last_requested_at or requested_at)
+    course.save(update_fields=['request_score', 'last_requested_at'])
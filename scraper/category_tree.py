@@ -0,0 +1,261 @@
+import logging
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import fetch
+from .pagination import collect_pages, listing_url
+from .parsing import parse_html
+
+logger = logging.getLogger(__name__)
+
+# Pseudo category holding the top-level categories of course/index.php
+ROOT_ID = '0'
+
+# Headers to mimic a browser request, as for the other public pages
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+CATEGORY_ID_PATTERN = re.compile(r'categoryid=([0-9]+)')
+COURSE_ID_PATTERN = re.compile(r'[?&]id=([0-9]+)')
+
+
+def category_page_url(url, category_id):
+    """
+    URL of a category listing, asking Moodle for every course on one page
+    """
+    if str(category_id) == ROOT_ID:
+        return f"{url}/course/index.php"
+    return listing_url(f"{url}/course/index.php?categoryid={category_id}")
+
+
+def crawler_session(max_workers):
+    """
+    Anonymous session with a connection pool large enough for the crawler threads
+    """
+    session = requests.Session()
+    session.headers.update(BROWSER_HEADERS)
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def parse_category_page(soup, category_id, url):
+    """
+    Read the name, direct subcategories and courses of a category page
+
+    Args:
+        soup (BeautifulSoup): The parsed category page
+        category_id (str): The category the page belongs to
+        url (str): The Moodle URL
+
+    Returns:
+        dict: `name`, `children` (list of {id, name}) and `courses` (list of {id, name, url})
+    """
+
+    name = None
+    if category_id != ROOT_ID:
+        heading = soup.select_one('h1')
+        name = heading.text.strip() if heading else f"Category {category_id}"
+
+    children = []
+    seen_categories = {category_id}
+    for category in soup.select('div.category[data-categoryid]'):
+        # Nested categories that Moodle already expanded belong to their own parent
+        if category.find_parent('div', class_='category') is not None:
+            continue
+        child_id = category.get('data-categoryid')
+        if child_id in seen_categories:
+            continue
+        seen_categories.add(child_id)
+        link = category.select_one('.categoryname a') or category.select_one('a')
+        children.append({
+            'id': child_id,
+            'name': link.text.strip() if link else f"Category {child_id}"
+        })
+
+    # Older themes print plain subcategory links without data attributes
+    if not children:
+        for link in soup.select('.subcategories a[href*="categoryid="], .course_category_tree a[href*="categoryid="]'):
+            child_match = CATEGORY_ID_PATTERN.search(link.get('href', ''))
+            if child_match and child_match.group(1) not in seen_categories:
+                seen_categories.add(child_match.group(1))
+                children.append({'id': child_match.group(1), 'name': link.text.strip()})
+
+    courses = []
+    seen_courses = set()
+    for link in soup.select('.coursebox .coursename a, .courses a.aalink[href*="/course/view.php"]'):
+        href = link.get('href', '')
+        course_match = COURSE_ID_PATTERN.search(href)
+        if not course_match or course_match.group(1) in seen_courses:
+            continue
+        seen_courses.add(course_match.group(1))
+        courses.append({
+            'id': course_match.group(1),
+            'name': link.text.strip(),
+            'url': f"{url}/course/view.php?id={course_match.group(1)}"
+        })
+
+    return {'name': name, 'children': children, 'courses': courses}
+
+
+def fetch_category(session, url, category_id, timeout=30):
+    """
+    Fetch and parse one category page
+
+    Returns:
+        dict: The parsed page (see parse_category_page) with `id`, `url` and
+            `fetched_at` keys, or with an `error` key when the page failed
+    """
+    page_url = category_page_url(url, category_id)
+    node = {'id': category_id, 'url': page_url, 'fetched_at': time.time()}
+
+    try:
+        logger.info(f"Fetching category page: {page_url}")
+        response = fetch.get(session, page_url, 'page', timeout=timeout)
+        response.raise_for_status()
+        pages = collect_pages(session, response.url, parse_html(response.text), timeout=timeout)
+
+        node.update(parse_category_page(pages[0], category_id, url))
+        for page_soup in pages[1:]:
+            more = parse_category_page(page_soup, category_id, url)
+            for key in ('children', 'courses'):
+                known = {entry['id'] for entry in node[key]}
+                node[key].extend(entry for entry in more[key] if entry['id'] not in known)
+    except Exception as e:
+        logger.error(f"Error fetching category {category_id}: {str(e)}")
+        node.update({'name': None, 'children': [], 'courses': [], 'error': str(e)})
+
+    return node
+
+
+def crawl_category_tree(url='https://elearning.univ-bba.dz', root_id=ROOT_ID, session=None, max_workers=8,
+                        previous=None, timeout=30):
+    """
+    Walk the category hierarchy below a category, fetching pages concurrently
+
+    Every fetched page immediately schedules its subcategories, so up to
+    `max_workers` pages are in flight at any time instead of one level at a
+    time. Categories are stored flat, keyed by ID, with the IDs of their children.
+
+    Args:
+        url (str): The Moodle URL
+        root_id (str): The category to start from; ROOT_ID walks the whole site
+        session (requests.Session, optional): Session to crawl with (an
+            anonymous one is created when omitted)
+        max_workers (int): Maximum number of concurrent page fetches
+        previous (dict, optional): An earlier tree; its nodes outside the
+            crawled subtree are kept, so one branch can be refreshed on its own
+        timeout (int): Timeout in seconds for each request
+
+    Returns:
+        dict: Tree with `success`, `message`, `url`, `root`, `categories`
+            (ID to node) and `crawled_at` keys
+    """
+    session = session or crawler_session(max_workers)
+    root_id = str(root_id)
+    categories = dict(previous['categories']) if previous else {}
+
+    old_root = categories.get(root_id)
+
+    # Forget the old subtree so categories moved or deleted since disappear
+    stale = [root_id]
+    while stale:
+        old_node = categories.pop(stale.pop(), None)
+        if old_node:
+            stale.extend(old_node.get('children', []))
+
+    started = time.time()
+    errors = 0
+    listed_names = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(fetch_category, session, url, root_id, timeout)}
+        scheduled = {root_id}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = future.result()
+                errors += 'error' in node
+
+                child_names = {child['id']: child['name'] for child in node['children']}
+                listed_names.update(child_names)
+                node['children'] = list(child_names)
+                categories[node['id']] = node
+
+                for child_id in child_names:
+                    if child_id in scheduled:
+                        continue
+                    scheduled.add(child_id)
+                    pending.add(executor.submit(fetch_category, session, url, child_id, timeout))
+
+    # The name listed by the parent is more reliable than the heading of the category page
+    for node in categories.values():
+        for child_id in node['children']:
+            child = categories.get(child_id)
+            if child is not None:
+                child['parent'] = node['id']
+                if listed_names.get(child_id):
+                    child['name'] = listed_names[child_id]
+
+    # A refreshed branch keeps its place and listed name in the rest of the tree
+    if old_root is not None and root_id in categories:
+        categories[root_id]['parent'] = old_root.get('parent')
+        categories[root_id]['name'] = old_root.get('name') or categories[root_id]['name']
+
+    logger.info(f"Crawled {len(scheduled)} categories in {time.time() - started:.1f}s ({errors} failed)")
+
+    return {
+        'success': True,
+        'message': f"Crawled {len(scheduled)} categories ({errors} failed)",
+        'url': url,
+        'root': previous['root'] if previous else root_id,
+        'categories': categories,
+        'crawled_at': time.time()
+    }
+
+
+def nest_category_tree(tree, category_id=None, include_courses=True):
+    """
+    Turn the flat tree into nested dicts for the API response
+
+    Args:
+        tree (dict): Tree returned by crawl_category_tree
+        category_id (str, optional): Subtree to return (defaults to the root)
+        include_courses (bool): Include the course lists
+
+    Returns:
+        dict: The nested category, or None if it is not in the tree
+    """
+    categories = tree['categories']
+
+    def build(node_id, path):
+        node = categories.get(node_id)
+        if node is None or node_id in path:
+            return None
+        nested = {
+            'id': node['id'],
+            'name': node.get('name'),
+            'url': node['url'],
+            'course_count': len(node['courses']),
+            'fetched_at': int(node['fetched_at'])
+        }
+        if node.get('error'):
+            nested['error'] = node['error']
+        if include_courses:
+            nested['courses'] = node['courses']
+        children = (build(child_id, path | {node_id}) for child_id in node['children'])
+        nested['children'] = [child for child in children if child is not None]
+        return nested
+
+    return build(str(category_id or tree['root']), frozenset())
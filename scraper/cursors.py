@@ -0,0 +1,119 @@
+import base64
+import json
+
+from django.conf import settings
+
+# Listings are paginated when the client sends `limit` or `cursor`; these bound the page size
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(listing, after, scope=None):
+    """
+    Return the opaque cursor of the page following the key `after` of a listing
+
+    The cursor names its listing and its scope (the course or category
+    listed), so a cursor of one endpoint, course or category is refused by the others.
+    """
+    payload = json.dumps({'l': listing, 's': scope, 'a': after}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def next_cursor(listing, after, scope=None):
+    """
+    Return the cursor of the next page, or None after the last page
+    """
+    return encode_cursor(listing, after, scope) if after is not None else None
+
+
+def decode_cursor(listing, cursor, scope=None):
+    """
+    Return the key a cursor of `listing` and `scope` resumes after
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to another listing or scope
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if payload['l'] != listing or payload.get('s') != scope:
+            raise ValueError
+        return int(payload['a'])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Invalid cursor')
+
+
+def page_request(params, listing, scope=None):
+    """
+    Read the `cursor` and `limit` parameters of a listing request
+
+    Args:
+        params: The query parameters or request body
+        listing (str): The listing the cursor must belong to
+        scope (str, optional): The course or category the cursor must belong to
+
+    Returns:
+        dict: `after` (None for the first page) and `limit`, or None if the
+            client did not ask for pages
+
+    Raises:
+        ValueError: If the cursor or limit is invalid
+    """
+    cursor = params.get('cursor')
+    limit = params.get('limit')
+    if not cursor and limit in (None, ''):
+        return None
+
+    return {'after': decode_cursor(listing, cursor, scope) if cursor else None, 'limit': parse_limit(limit)}
+
+
+def parse_limit(limit):
+    """
+    Read a `limit` parameter, MOODLE_PAGE_SIZE when it is missing
+
+    Raises:
+        ValueError: If the limit is not an integer between 1 and MOODLE_MAX_PAGE_SIZE
+    """
+    max_size = getattr(settings, 'MOODLE_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+    if limit in (None, ''):
+        limit = getattr(settings, 'MOODLE_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if not 1 <= limit <= max_size:
+        raise ValueError(f"limit must be between 1 and {max_size}")
+    return limit
+
+
+def parse_fields(value, allowed):
+    """
+    Read a `fields` selector: a comma separated string or a list of field names
+
+    Args:
+        value: The raw selector, None when every field is wanted
+        allowed (tuple): The fields of the listing's items
+
+    Returns:
+        tuple: The selected fields, or None for every field
+
+    Raises:
+        ValueError: If a field is not one of `allowed`
+    """
+    if value in (None, ''):
+        return None
+    names = value if isinstance(value, list) else str(value).split(',')
+    fields = tuple(dict.fromkeys(str(name).strip() for name in names if str(name).strip()))
+
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}; available: {', '.join(allowed)}")
+    return fields or None
+
+
+def select_fields(items, fields):
+    """
+    Keep only the selected fields of each item; fields an item does not have are left out
+    """
+    if fields is None:
+        return items
+    return [{name: item[name] for name in fields if name in item} for item in items]
@@ -0,0 +1,121 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Writes committed per transaction, and how long a write may wait for others to join it
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_DELAY = 0.05
+
+
+class BatchWriter:
+    """
+    Single background thread that commits queued database writes in groups
+
+    SQLite allows one writer at a time, so request threads and crawl workers
+    writing on their own would queue up on the database lock and each pay for
+    a commit. Here they only enqueue the write; the writer thread runs up to
+    `batch_size` of them in one transaction. Each write runs in its own
+    savepoint, so a failing write is logged and rolled back alone.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a write; `func(*args, **kwargs)` runs later in the writer thread
+        """
+        self._start()
+        self._queue.put((func, args, kwargs))
+
+    def flush(self, timeout=None):
+        """
+        Wait until every write queued so far is committed
+
+        Returns:
+            bool: False if the timeout expired first
+        """
+        if self._thread is None:
+            return True
+
+        # A marker without a write, signalled once everything queued before it is committed
+        done = threading.Event()
+        self._queue.put((None, (done,), {}))
+        return done.wait(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush, 5)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            markers = []
+
+            try:
+                close_old_connections()
+                with transaction.atomic():
+                    for func, args, kwargs in batch:
+                        if func is None:
+                            markers.extend(args)
+                            continue
+                        try:
+                            with transaction.atomic():
+                                func(*args, **kwargs)
+                        except Exception as e:
+                            logger.error(f"Database write {getattr(func, '__name__', func)} failed: {str(e)}")
+                logger.debug(f"Committed {len(batch) - len(markers)} queued database writes")
+            except Exception as e:
+                logger.error(f"Could not commit {len(batch)} queued database writes: {str(e)}")
+            finally:
+                for marker in markers:
+                    marker.set()
+
+
+writer = BatchWriter(
+    batch_size=getattr(settings, 'MOODLE_DB_WRITE_BATCH', DEFAULT_BATCH_SIZE),
+    max_delay=getattr(settings, 'MOODLE_DB_WRITE_DELAY', DEFAULT_MAX_DELAY)
+)
+
+
+def submit(func, *args, **kwargs):
+    """
+    Queue a write for the shared writer thread, see BatchWriter.submit
+    """
+    writer.submit(func, *args, **kwargs)
+
+
+def flush(timeout=None):
+    """
+    Wait for the shared writer thread to commit every queued write
+    """
+    return writer.flush(timeout)
@@ -0,0 +1,539 @@
+import fnmatch
+import logging
+import os
+import re
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from . import fetch
+from .access import ENROL_PATH, LOGIN_PATH
+from .moodle_auth import get_direct_file_url, is_folder_archive_url
+from .parsing import parse_html
+from .sniffing import SniffedResponse
+
+logger = logging.getLogger(__name__)
+
+# Selectors that pick every resource for a multi-file download
+ALL_FILES = ('all', '*')
+
+
+def guess_filename(resource_name, download_url, file_response, content_type):
+    """
+    Work out the filename for a downloaded file
+
+    Args:
+        resource_name (str): Fallback name taken from the course page
+        download_url (str): The URL the download was requested from
+        file_response (requests.Response): The file response
+        content_type (str): The response content type
+
+    Returns:
+        str: The filename, with an extension added when it was missing
+    """
+    filename = resource_name
+    content_disposition = file_response.headers.get('Content-Disposition', '')
+
+    if 'filename=' in content_disposition:
+        filename_match = re.search(r'filename="?([^"]+)"?', content_disposition)
+        if filename_match:
+            filename = filename_match.group(1)
+    elif download_url.split('/')[-1].split('?')[0]:
+        filename = download_url.split('/')[-1].split('?')[0]
+
+    # Add file extension if missing
+    if '.' not in filename:
+        if 'pdf' in content_type.lower():
+            filename += '.pdf'
+        elif 'word' in content_type.lower():
+            filename += '.docx'
+        elif 'excel' in content_type.lower():
+            filename += '.xlsx'
+        elif 'powerpoint' in content_type.lower():
+            filename += '.pptx'
+        elif 'text' in content_type.lower():
+            filename += '.txt'
+
+    return filename
+
+
+def _open_sniffed(session, url, timeout):
+    file_response = fetch.get(session, url, 'resource', stream=True, timeout=timeout, allow_redirects=True)
+    file_response.raise_for_status()
+    return SniffedResponse(file_response)
+
+
+def open_resource_download(session, download_url, resource_name='document', timeout=30):
+    """
+    Open a streaming download for a course resource
+
+    Resolves the direct file URL, and when Moodle answers with an HTML page
+    instead of the file, follows the first download link found in that page.
+    Only the first bytes of each body are read to tell HTML from a file; the
+    returned response continues streaming the same connection.
+
+    Args:
+        session (requests.Session): The authenticated session
+        download_url (str): The resource or file URL
+        resource_name (str): Fallback name used for the file
+        timeout (int): Timeout in seconds for each request
+
+    Returns:
+        dict: Result containing success status, message, the open streaming
+            response, its content type and the filename. `html` is True when
+            only an HTML page without a download link could be found.
+    """
+    try:
+        # First, try to get the direct file URL
+        direct_url_result = get_direct_file_url(download_url, session)
+        file_response = direct_url_result.get('response')
+
+        if file_response is not None:
+            # The URL already answered with the file itself, keep streaming that connection
+            logger.info(f"Reusing the open download from: {direct_url_result.get('url')}")
+        elif direct_url_result.get('success'):
+            direct_url = direct_url_result.get('url')
+            logger.info(f"Got direct file URL: {direct_url}")
+
+            # Try downloading with the direct URL
+            file_response = _open_sniffed(session, direct_url, timeout)
+
+            # Check if we got HTML instead of a file
+            if file_response.is_html:
+                logger.warning("Received HTML from direct URL. Falling back to original URL.")
+                file_response.close()
+                file_response = _open_sniffed(session, download_url, timeout)
+        else:
+            # Try with the original URL
+            logger.info(f"No direct URL found, using original URL: {download_url}")
+            file_response = _open_sniffed(session, download_url, timeout)
+
+        # Check if we got HTML instead of a file
+        if file_response.is_html:
+            logger.warning("Received HTML instead of file. Trying to extract file URL from HTML...")
+
+            # Try to find a download link in the HTML
+            soup = parse_html(file_response.read_text())
+            download_links = soup.select('a[href*=".pdf"], a[href*="pluginfile.php"], a[href*="webservice"], a[href*=".docx"], a[href*=".xlsx"], a[href*=".pptx"]')
+
+            if not download_links:
+                logger.warning("Could not find download link in HTML")
+                return {
+                    'success': False,
+                    'html': True,
+                    'message': 'Could not find download link in HTML'
+                }
+
+            new_url = download_links[0].get('href')
+            if not new_url.startswith('http'):
+                new_url = urljoin(download_url, new_url)
+
+            logger.info(f"Found download link in HTML: {new_url}")
+
+            # Try downloading again with the new URL
+            file_response = _open_sniffed(session, new_url, timeout)
+
+        content_type = file_response.content_type
+        logger.info(f"File content type: {content_type}")
+
+        filename = guess_filename(resource_name, download_url, file_response, content_type)
+        logger.info(f"Using filename: {filename}")
+
+        return {
+            'success': True,
+            'message': 'Download opened',
+            'response': file_response,
+            'content_type': content_type,
+            'filename': filename
+        }
+    except Exception as e:
+        logger.error(f"Error downloading file: {e}")
+        return {
+            'success': False,
+            'message': f"Error downloading file: {str(e)}"
+        }
+
+
+def can_download(session, url):
+    """
+    Ask Moodle, with a HEAD request on the caller's session, whether it may download a file
+
+    Cached files are shared by every user, so a cached copy is only served to
+    a session that Moodle still lets through to the file itself.
+
+    Returns:
+        bool: True if Moodle answers with the file rather than a login or enrolment page
+    """
+    try:
+        response = fetch.head(session, url, allow_redirects=True)
+    except requests.RequestException as e:
+        logger.warning(f"Could not check access to {url}: {e}")
+        return False
+
+    return response.status_code == 200 and LOGIN_PATH not in response.url and ENROL_PATH not in response.url
+
+
+def _resource_filename(resource):
+    return resource.get('pdf_name') or resource.get('resource_name') or ''
+
+
+def _resource_extension(resource):
+    for candidate in (resource.get('pdf_name'), urlparse(resource.get('pdf_url') or '').path):
+        extension = os.path.splitext(candidate or '')[1]
+        if extension:
+            return extension.lstrip('.').lower()
+    return ''
+
+
+def parse_files_selector(selector):
+    """
+    Normalise the `files` selector of a multi-file download
+
+    Accepted forms are "all", a list of indexes, a comma separated string of
+    indexes ("0,2,5"), "name:<pattern>", "type:<extension>", or a dict with
+    any of the `index`, `name` and `type` keys.
+
+    Args:
+        selector: The raw selector from the request
+
+    Returns:
+        dict: The selector as a dict with `index`, `name` and `type` keys,
+            or None if every file is selected
+
+    Raises:
+        ValueError: If the selector is malformed
+    """
+    if selector is True or (isinstance(selector, str) and selector.strip().lower() in ALL_FILES):
+        return None
+
+    if isinstance(selector, list):
+        selector = {'index': selector}
+    elif isinstance(selector, str):
+        kind, _, value = selector.partition(':')
+        if value and kind in ('name', 'type'):
+            selector = {kind: value}
+        else:
+            selector = {'index': [part for part in selector.split(',') if part.strip()]}
+
+    if not isinstance(selector, dict):
+        raise ValueError("files must be 'all', a list of indexes, or an object with index, name or type")
+
+    indexes = selector.get('index')
+    if indexes is not None:
+        if not isinstance(indexes, list):
+            indexes = [indexes]
+        try:
+            indexes = {int(index) for index in indexes}
+        except (TypeError, ValueError):
+            raise ValueError('files index values must be integers')
+
+    types = selector.get('type')
+    if isinstance(types, str):
+        types = [types]
+
+    return {
+        'index': indexes,
+        'name': selector.get('name'),
+        'type': {t.lower().lstrip('.') for t in types} if types else None
+    }
+
+
+def select_resources(resources, selector):
+    """
+    Pick the resources matching a `files` selector
+
+    Args:
+        resources (list): Resource dicts with pdf_url/pdf_name/resource_name keys
+        selector: The raw `files` selector, see parse_files_selector
+
+    Returns:
+        list: The selected resources, in course order
+
+    Raises:
+        ValueError: If the selector is malformed
+    """
+    selector = parse_files_selector(selector)
+    if selector is None:
+        return list(resources)
+
+    selected = []
+    for index, resource in enumerate(resources):
+        if selector['index'] is not None and index not in selector['index']:
+            continue
+
+        if selector['name']:
+            pattern = selector['name'].lower()
+            name = _resource_filename(resource).lower()
+            if not (fnmatch.fnmatch(name, pattern) or pattern in name):
+                continue
+
+        if selector['type'] and _resource_extension(resource) not in selector['type']:
+            continue
+
+        selected.append(resource)
+
+    return selected
+
+
+def _member_path(name):
+    """
+    Reduce a name sent by Moodle to a relative archive path, without `..`, `.` or a leading `/`
+    """
+    return '/'.join(part for part in name.replace('\\', '/').split('/') if part.strip() not in ('', '.', '..'))
+
+
+def _member_basename(filename):
+    return os.path.basename(_member_path(filename)) or 'document'
+
+
+def _unique_name(filename, used_names):
+    base, extension = os.path.splitext(filename)
+    candidate = filename
+    counter = 2
+    while candidate.lower() in used_names:
+        candidate = f"{base} ({counter}){extension}"
+        counter += 1
+    used_names.add(candidate.lower())
+    return candidate
+
+
+class _ZipStream:
+    """
+    Write-only, non-seekable file object that collects what zipfile writes
+
+    zipfile falls back to data descriptors when the output cannot seek, so
+    each member can be written while its download is still running.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _open_member(session, resource, file_cache, timeout, revalidate):
+    download_url = resource.get('pdf_url') or resource.get('resource_url')
+
+    if file_cache is not None:
+        cached_entry = file_cache.lookup(download_url)
+        if cached_entry and (not revalidate or can_download(session, download_url)):
+            return {
+                'success': True,
+                'cached': cached_entry,
+                'filename': cached_entry['filename'],
+                'url': download_url
+            }
+
+    download = open_resource_download(session, download_url, _resource_filename(resource) or 'document', timeout)
+    download['url'] = download_url
+    return download
+
+
+def _member_chunks(download, file_cache, chunk_size):
+    if download.get('cached'):
+        with open(download['cached']['path'], 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+        return
+
+    file_response = download['response']
+    if file_cache is not None:
+        yield from file_cache.tee(download['url'], file_response, download['filename'], download['content_type'],
+                                  chunk_size)
+        return
+
+    try:
+        yield from file_response.iter_content(chunk_size=chunk_size)
+    finally:
+        file_response.close()
+
+
+def _folder_member_chunks(folder_archive, info, chunk_size):
+    with folder_archive.open(info) as source:
+        yield from iter(lambda: source.read(chunk_size), b'')
+
+
+def _spool_archive(download, file_cache, chunk_size):
+    """
+    Get a folder archive onto disk so its central directory can be read
+    """
+    if download.get('cached'):
+        return open(download['cached']['path'], 'rb')
+
+    if file_cache is not None:
+        entry = file_cache.store(download['url'], download['response'], download['filename'],
+                                 download['content_type'], chunk_size)
+        return open(entry['path'], 'rb')
+
+    spool = tempfile.TemporaryFile()
+    try:
+        for chunk in download['response'].iter_content(chunk_size=chunk_size):
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    finally:
+        download['response'].close()
+
+    spool.seek(0)
+    return spool
+
+
+def _folder_name(resource, download):
+    name = resource.get('resource_name') or os.path.splitext(download['filename'])[0]
+    return name.replace('/', '_').replace('\\', '_').strip() or 'folder'
+
+
+def _write_member(archive, output, member_name, chunks, errors, progress):
+    """
+    Copy one member into the archive, yielding the archive bytes as they are produced
+
+    A download that fails halfway leaves a truncated member, but the archive
+    itself stays valid: the member is closed and the failure is listed in errors.txt.
+    """
+    with archive.open(member_name, 'w') as member:
+        try:
+            for chunk in chunks:
+                member.write(chunk)
+                progress('bytes', member_name, len(chunk))
+                data = output.drain()
+                if data:
+                    yield data
+        except Exception as e:
+            logger.warning(f"Download of {member_name} failed after it was started: {e}")
+            errors.append(f"{member_name}: incomplete, the download failed: {e}")
+            progress('error', member_name, str(e))
+
+
+def stream_zip(session, resources, prefetch=3, chunk_size=64 * 1024, timeout=30, file_cache=None, progress=None,
+               revalidate=True):
+    """
+    Stream several course files as one ZIP archive
+
+    The archive is produced while the files are downloading: the next
+    `prefetch` downloads are resolved and opened in background threads while
+    the current one is copied into the archive chunk by chunk. Moodle folder
+    archives are unpacked into a directory named after the folder. Files that
+    cannot be downloaded, or whose download fails halfway, are listed in an
+    `errors.txt` member. Member names sent by Moodle are reduced to relative
+    paths, so none can point outside the extraction directory.
+
+    Args:
+        session (requests.Session): The authenticated session
+        resources (list): Resource dicts to include, in archive order
+        prefetch (int): Number of downloads opened ahead of the current one
+        chunk_size (int): Size of the chunks read from each download
+        timeout (int): Timeout in seconds for each request
+        file_cache (FileCache, optional): Cache to read files from and to fill
+            with the files that had to be downloaded
+        progress (callable, optional): Called as progress(event, name, value):
+            ('file', member name, None) when a member is started,
+            ('bytes', member name, size) for each chunk copied into it, and
+            ('error', resource file name, message) for files left out
+        revalidate (bool): Check with can_download() that the session may
+            download each cached file before using it; False when the resources
+            come from a course the session was verified for
+
+    Yields:
+        bytes: Consecutive pieces of the ZIP archive
+    """
+    output = _ZipStream()
+    used_names = set()
+    errors = []
+    pending = deque()
+    queue = iter(resources)
+    executor = ThreadPoolExecutor(max_workers=max(prefetch, 1))
+    progress = progress or (lambda event, name, value: None)
+
+    def submit_next():
+        resource = next(queue, None)
+        if resource is None:
+            return
+        future = executor.submit(_open_member, session, resource, file_cache, timeout, revalidate)
+        pending.append((resource, future))
+
+    try:
+        for _ in range(max(prefetch, 1)):
+            submit_next()
+
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            while pending:
+                resource, future = pending.popleft()
+                submit_next()
+
+                try:
+                    download = future.result()
+                except Exception as e:
+                    download = {'success': False, 'message': str(e)}
+                if not download.get('success'):
+                    errors.append(f"{_resource_filename(resource)}: {download.get('message')}")
+                    progress('error', _resource_filename(resource), download.get('message'))
+                    continue
+
+                if is_folder_archive_url(download.get('url')):
+                    # Re-stream the members of Moodle's folder ZIP under the folder name
+                    folder_name = _folder_name(resource, download)
+                    try:
+                        spool = _spool_archive(download, file_cache, chunk_size)
+                    except Exception as e:
+                        errors.append(f"{_resource_filename(resource)}: {e}")
+                        progress('error', _resource_filename(resource), str(e))
+                        continue
+
+                    with spool:
+                        try:
+                            folder_archive = zipfile.ZipFile(spool)
+                        except zipfile.BadZipFile as e:
+                            errors.append(f"{_resource_filename(resource)}: {e}")
+                            progress('error', _resource_filename(resource), str(e))
+                            continue
+
+                        with folder_archive:
+                            for info in folder_archive.infolist():
+                                path = _member_path(info.filename)
+                                if info.is_dir() or not path:
+                                    continue
+
+                                member_name = _unique_name(f"{folder_name}/{path}", used_names)
+                                logger.info(f"Adding {member_name} to archive")
+                                progress('file', member_name, None)
+
+                                chunks = _folder_member_chunks(folder_archive, info, chunk_size)
+                                yield from _write_member(archive, output, member_name, chunks, errors, progress)
+                    continue
+
+                member_name = _unique_name(_member_basename(download['filename']), used_names)
+                logger.info(f"Adding {member_name} to archive")
+                progress('file', member_name, None)
+
+                yield from _write_member(archive, output, member_name, _member_chunks(download, file_cache, chunk_size),
+                                         errors, progress)
+
+            if errors:
+                archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+
+        yield output.drain()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for _, future in pending:
+            if future.done() and not future.cancelled() and future.exception() is None \
+                    and future.result().get('response') is not None:
+                future.result()['response'].close()
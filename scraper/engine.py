@@ -0,0 +1,171 @@
+import logging
+import os
+import re
+import zipfile
+
+from .downloads import _unique_name, open_resource_download, select_resources, stream_zip
+from .moodle_auth import get_authenticated_session, get_category_courses, get_course_pdfs, is_folder_archive_url
+from .records import ResourceLink
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = 'https://elearning.univ-bba.dz'
+
+
+def course_id_from_url(course_url):
+    """
+    Extract the course ID from a `course/view.php?id=N` URL, or None
+    """
+    course_match = re.search(r'course/view\.php\?(?:.*&)?id=([0-9]+)', course_url or '')
+    return course_match.group(1) if course_match else None
+
+
+def resources_from_pdfs(pdfs):
+    """
+    Convert get_course_pdfs entries to the resource records used by the API and ZIP export
+    """
+    return [ResourceLink.from_course_file(pdf) for pdf in pdfs]
+
+
+class MoodleEngine:
+    """
+    The scraping and downloading engine, used in-process without the Django API
+
+    Only the Django-free modules of the app are imported, so command line tools
+    can crawl and mirror courses directly, without a running server or a JSON
+    round-trip per file. The Moodle session is authenticated once and reused.
+    """
+
+    def __init__(self, username=None, password=None, url=DEFAULT_URL, session=None):
+        self.username = username
+        self.password = password
+        self.url = url
+        self.session = session
+
+    def login(self):
+        """
+        Authenticate with Moodle unless the engine already has a session
+
+        Returns:
+            dict: Result containing success status and message
+        """
+        session, login_error = get_authenticated_session(self.username, self.password, self.url, self.session)
+        if session is None:
+            return {'success': False, 'message': login_error}
+
+        self.session = session
+        return {'success': True, 'message': 'Login successful'}
+
+    def _require_session(self):
+        if self.session is None:
+            login_result = self.login()
+            if not login_result['success']:
+                raise RuntimeError(login_result['message'])
+        return self.session
+
+    def course_files(self, course_id):
+        """
+        List the files of a course, see moodle_auth.get_course_pdfs
+        """
+        return get_course_pdfs(course_id, url=self.url, session=self._require_session())
+
+    def category_courses(self, category_id):
+        """
+        List the courses of a category, see moodle_auth.get_category_courses
+        """
+        return get_category_courses(category_id, url=self.url, session=self._require_session())
+
+    def enrolled_courses(self):
+        """
+        List the courses the user is enrolled in, see moodle_ajax.get_enrolled_courses
+        """
+        from .moodle_ajax import get_enrolled_courses
+
+        return get_enrolled_courses(url=self.url, session=self._require_session())
+
+    def download(self, file_url, output_dir, name='document', used_names=None):
+        """
+        Stream one course file to disk
+
+        Moodle folder archives are unpacked into a directory named after the file.
+
+        Args:
+            file_url (str): The resource or file URL
+            output_dir (str): Directory to write to
+            name (str): Fallback filename
+            used_names (set, optional): Lowercase names already written to output_dir
+
+        Returns:
+            dict: Result containing success status, message and the written `path`
+        """
+        download = open_resource_download(self._require_session(), file_url, name)
+        if not download.get('success'):
+            return {'success': False, 'message': download.get('message'), 'path': None}
+
+        os.makedirs(output_dir, exist_ok=True)
+        used_names = used_names if used_names is not None else set()
+        filename = _unique_name(os.path.basename(download['filename']) or name, used_names)
+        path = os.path.join(output_dir, filename)
+
+        try:
+            with open(path, 'wb') as f:
+                for chunk in download['response'].iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+        finally:
+            download['response'].close()
+
+        if is_folder_archive_url(file_url) and zipfile.is_zipfile(path):
+            folder_path = os.path.splitext(path)[0]
+            with zipfile.ZipFile(path) as archive:
+                archive.extractall(folder_path)
+            os.remove(path)
+            path = folder_path
+
+        return {'success': True, 'message': f"Downloaded {filename}", 'path': path}
+
+    def download_archive(self, resources, output_path, files='all'):
+        """
+        Write the selected resources into one ZIP archive, see downloads.stream_zip
+
+        Returns:
+            int: Number of resources selected
+        """
+        selected = select_resources(resources, files)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'wb') as f:
+            for chunk in stream_zip(self._require_session(), selected):
+                f.write(chunk)
+        return len(selected)
+
+    def mirror_course(self, course_id, output_dir, on_file=None):
+        """
+        Download every file of a course into a directory
+
+        Args:
+            course_id (str): The course ID
+            output_dir (str): Directory to write to
+            on_file (callable, optional): Called with (file entry, download result) after each file
+
+        Returns:
+            dict: Result containing success status, message, course name and one result per file
+        """
+        pdfs_result = self.course_files(course_id)
+        if not pdfs_result.get('success'):
+            return {'success': False, 'message': pdfs_result.get('message'), 'files': []}
+
+        used_names = set()
+        results = []
+        for pdf in pdfs_result.get('pdfs', []):
+            result = self.download(pdf.get('url'), output_dir, pdf.get('name') or 'document', used_names)
+            result['name'] = pdf.get('name')
+            results.append(result)
+            if on_file is not None:
+                on_file(pdf, result)
+
+        downloaded = sum(1 for result in results if result['success'])
+        return {
+            'success': True,
+            'message': f"Downloaded {downloaded} of {len(results)} files from course {course_id}",
+            'course_name': pdfs_result.get('course_name'),
+            'files': results
+        }
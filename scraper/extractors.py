@@ -0,0 +1,265 @@
+import logging
+import re
+from urllib.parse import parse_qs, urlencode, urljoin, urlparse
+
+from .parsing import parse_html
+from .resolver import describe_link
+
+logger = logging.getLogger(__name__)
+
+# Page extractors: raw HTML in, compact records of plain tuples and strings out.
+# They hold no soup objects, so parse_pool can run them in worker processes and
+# only the records travel back. URLs are returned as found in the page, the
+# callers make them absolute.
+
+
+def folder_archive_url(folder_soup, folder_url):
+    """
+    Find the "Download folder" archive URL on a folder page
+
+    Moodle only shows the download button when the folder allows it, so the
+    archive URL is built from that button's form (or link) rather than guessed.
+
+    Args:
+        folder_soup (BeautifulSoup): The parsed folder page
+        folder_url (str): The URL of the folder page
+
+    Returns:
+        str: The absolute `mod/folder/download_folder.php` URL, or None if the
+            folder cannot be downloaded as a whole
+    """
+    download_form = folder_soup.select_one('form[action*="download_folder.php"]')
+    if download_form is not None:
+        params = {
+            hidden_input.get('name'): hidden_input.get('value', '')
+            for hidden_input in download_form.select('input[type="hidden"][name]')
+        }
+        action = urljoin(folder_url, download_form.get('action'))
+        if 'id' not in params and 'id=' not in action:
+            folder_id = parse_qs(urlparse(folder_url).query).get('id')
+            if not folder_id:
+                return None
+            params['id'] = folder_id[0]
+        return f"{action}{'&' if '?' in action else '?'}{urlencode(params)}" if params else action
+
+    download_link = folder_soup.select_one('a[href*="download_folder.php"]')
+    if download_link is not None:
+        return urljoin(folder_url, download_link.get('href'))
+
+    return None
+
+
+def course_links(html):
+    """
+    Read the resource links of a course page, as get_course_pdfs walks them
+
+    Returns:
+        tuple: (course name or None, list of (href, text, hints) tuples), where
+            hints is the describe_link() dict of the link
+    """
+    soup = parse_html(html)
+    heading = soup.select_one('h1')
+
+    # Resource and folder links, then aalinks and direct file links not already listed
+    resource_links = soup.select('a[href*="/mod/resource/view.php"], a[href*="/mod/folder/view.php"]')
+    for link in soup.select('a.aalink') + soup.select('a[href*=".pdf"], a[href*="pluginfile.php"]'):
+        if link not in resource_links:
+            resource_links.append(link)
+
+    return (
+        heading.text.strip() if heading else None,
+        [(link.get('href'), link.text.strip(), describe_link(link)) for link in resource_links]
+    )
+
+
+def resource_page_files(html, resource_url, folder_archives=True):
+    """
+    Find the files behind a resource or folder page, as get_course_pdfs reads them
+
+    Returns:
+        tuple: (folder links as (href, text) tuples, folder archive URL or None,
+            file URL or None). Folder pages with file links only fill the first
+            two; other pages only the file URL.
+    """
+    soup = parse_html(html)
+
+    if '/mod/folder/view.php' in resource_url:
+        folder_links = [(link.get('href'), link.text.strip()) for link in soup.select('a[href*=".pdf"], a[href*="pluginfile.php"]')]
+        if folder_links:
+            return folder_links, folder_archive_url(soup, resource_url) if folder_archives else None, None
+
+    # Look for PDF links - try different patterns
+    pdf_links = (
+        soup.select('a[href*=".pdf"]') or
+        soup.select('a[href*="pluginfile.php"]') or
+        soup.select('iframe[src*=".pdf"]') or
+        soup.select('object[data*=".pdf"]') or
+        soup.select('embed[src*=".pdf"]') or
+        # Also look for resource links that might lead to PDFs
+        soup.select('a[href*="/mod/resource/view.php"]')
+    )
+
+    # Embedded resources display the PDF inline, or offer a download button
+    if not pdf_links and soup.select_one('div.resourcecontent'):
+        pdf_links = (
+            soup.select('object[type="application/pdf"]') or
+            soup.select('iframe[src*="pluginfile.php"]') or
+            soup.select('embed[type="application/pdf"]') or
+            soup.select('a.resourcelinkdetails')
+        )
+
+    file_url = None
+    if pdf_links:
+        pdf_element = pdf_links[0]
+        file_url = pdf_element.get('href') or pdf_element.get('src') or pdf_element.get('data')
+
+    # A redirect to a file wins over the links of the page
+    meta_refresh = soup.select_one('meta[http-equiv="refresh"]')
+    if meta_refresh and 'content' in meta_refresh.attrs:
+        url_match = re.search(r'URL=([^"]+)', meta_refresh['content'])
+        if url_match:
+            redirect_url = url_match.group(1)
+            if redirect_url.lower().endswith('.pdf') or 'pluginfile.php' in redirect_url:
+                return [], None, redirect_url
+
+    # Otherwise look for a download button
+    if not pdf_links:
+        for button in soup.select('a.btn, button.btn, a[role="button"]'):
+            button_text = button.text.lower()
+            if 'download' in button_text or 'télécharger' in button_text:
+                if button.get('href'):
+                    return [], None, button.get('href')
+
+    return [], None, file_url
+
+
+def direct_file_link(html):
+    """
+    Find the file link of a resource page, as get_direct_file_url looks for it
+
+    Returns:
+        tuple: (file URL or None, description of where it was found,
+            number of links on the page)
+    """
+    soup = parse_html(html)
+    link_count = len(soup.select('a[href]'))
+
+    # Look for common file link patterns
+    file_links = soup.select('a[href*=".pdf"], a[href*="pluginfile.php"], a[href*="webservice"], a[href*=".docx"], a[href*=".xlsx"], a[href*=".pptx"], a[href*="mod/resource/view.php"]')
+    if file_links:
+        return file_links[0].get('href'), 'Found direct file URL in HTML', link_count
+
+    iframes = soup.select('iframe[src*="pluginfile.php"], iframe[src*="webservice"]')
+    if iframes:
+        return iframes[0].get('src'), 'Found direct file URL in iframe', link_count
+
+    objects = soup.select('object[data*="pluginfile.php"], object[data*="webservice"]')
+    if objects:
+        return objects[0].get('data'), 'Found direct file URL in object', link_count
+
+    for button in soup.select('a.resourcelinkdetails, a.btn-primary, a.btn-secondary, a.btn-default, a.btn'):
+        if ('download' in button.text.lower() or 'télécharger' in button.text.lower()) and button.get('href'):
+            return button.get('href'), 'Found direct file URL in download button', link_count
+
+    resource_frame = soup.select_one('div.resourceworkaround')
+    if resource_frame:
+        resource_object = resource_frame.select_one('object, iframe, embed')
+        if resource_object and (resource_object.get('data') or resource_object.get('src')):
+            return resource_object.get('data') or resource_object.get('src'), 'Found direct file URL in resource frame', link_count
+
+    resource_content = soup.select_one('div.resourcecontent')
+    if resource_content:
+        content_links = resource_content.select('a[href]')
+        if content_links:
+            return content_links[0].get('href'), 'Found direct file URL in resource content', link_count
+
+        content_objects = resource_content.select('object, iframe, embed')
+        if content_objects and (content_objects[0].get('data') or content_objects[0].get('src')):
+            return content_objects[0].get('data') or content_objects[0].get('src'), 'Found direct file URL in resource content object', link_count
+
+    return None, None, link_count
+
+
+def course_resource_links(html):
+    """
+    Read the resource links of a course page, as extract_course_resources walks them
+
+    Returns:
+        tuple: (status, links). status is 'login' when the page is a login
+            form, 'content' or 'empty' when no resource link was found (with or
+            without a course content section), else 'ok'. links is a list of
+            (href, onclick, text, hints) tuples.
+    """
+    soup = parse_html(html)
+
+    if soup.select_one('form#login'):
+        return 'login', []
+
+    # Try different selectors for resource links
+    resource_links = (
+        soup.select('a.aalink[href*="resource/view.php"]') or
+        soup.select('a[href*="resource/view.php"]') or
+        soup.select('a[onclick*="resource/view.php"]') or
+        soup.select('a[href*="pluginfile.php"]') or
+        soup.select('a[href*=".pdf"]')
+    )
+
+    # Fall back to links whose text suggests a downloadable file
+    if not resource_links:
+        file_keywords = ['fichier', 'file', 'document', 'pdf', 'download', 'télécharger']
+        resource_links = [
+            link for link in soup.find_all('a', href=True)
+            if any(keyword in link.text.lower() for keyword in file_keywords)
+        ]
+
+    if not resource_links:
+        return ('content' if soup.select_one('.course-content') else 'empty'), []
+
+    return 'ok', [
+        (link.get('href'), link.get('onclick'), link.text.strip(), describe_link(link))
+        for link in resource_links
+    ]
+
+
+def resource_page_pdf(html):
+    """
+    Find the PDF behind a resource page, as extract_course_resources reads it
+
+    Returns:
+        tuple: (kind, URL, name). kind is 'file' with the URL and the link text
+            (None when empty), 'skip' when the PDF element has no URL, or
+            'none' when the page has no PDF.
+    """
+    soup = parse_html(html)
+
+    pdf_links = (
+        soup.select('a[href*=".pdf"]') or
+        soup.select('a[href*="pluginfile.php"]') or
+        soup.select('iframe[src*=".pdf"]') or
+        soup.select('object[data*=".pdf"]') or
+        soup.select('embed[src*=".pdf"]')
+    )
+
+    if pdf_links:
+        pdf_element = pdf_links[0]
+        pdf_url = pdf_element.get('href') or pdf_element.get('src') or pdf_element.get('data')
+        if not pdf_url:
+            return 'skip', None, None
+        return 'file', pdf_url, pdf_element.text.strip() or None
+
+    # The page itself may redirect to a PDF
+    meta_refresh = soup.select_one('meta[http-equiv="refresh"]')
+    if meta_refresh:
+        content = meta_refresh.get('content', '')
+        if 'url=' in content.lower():
+            redirect_url = content.split('url=')[1].strip()
+            if redirect_url.lower().endswith('.pdf') or 'pluginfile.php' in redirect_url:
+                return 'file', redirect_url, None
+
+    # Look for download buttons or links
+    for link in soup.find_all('a', href=True):
+        link_text = link.text.lower()
+        if ('download' in link_text or 'télécharger' in link_text) and link.get('href'):
+            return 'file', link.get('href'), link.text.strip() or None
+
+    return 'none', None, None
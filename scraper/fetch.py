@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds of each phase of a crawl
+DEFAULT_TIMEOUTS = {
+    'login': (5, 30),
+    'page': (5, 30),
+    'resource': (5, 20),
+    'probe': (5, 10),
+}
+
+# Share of requests that may be duplicated: each request earns this many hedge
+# tokens, up to DEFAULT_HEDGE_BURST, and each hedge spends one
+DEFAULT_HEDGE_BUDGET = 0.05
+DEFAULT_HEDGE_BURST = 5
+
+# Latencies kept per phase, and how many are needed before their p95 triggers hedges
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+
+# Never hedge sooner than this, in seconds, whatever the observed p95
+MIN_HEDGE_DELAY = 0.05
+
+_timeouts = dict(DEFAULT_TIMEOUTS)
+_hedging = False
+_budget = DEFAULT_HEDGE_BUDGET
+_burst = DEFAULT_HEDGE_BURST
+_tokens = 0.0
+_latencies = {}
+_counts = {}
+_pool = None
+_workers = 16
+_lock = threading.Lock()
+
+
+def configure(hedging=False, timeouts=None, budget=DEFAULT_HEDGE_BUDGET, burst=DEFAULT_HEDGE_BURST, workers=16):
+    """
+    Set the timeouts of each phase and turn hedged requests on or off
+
+    Observed latencies and hedge tokens are reset.
+
+    Args:
+        hedging (bool): Duplicate slow GET and HEAD requests
+        timeouts (dict): Phase name to (connect, read) timeouts, merged into the defaults
+        budget (float): Hedges allowed per request, on average
+        burst (int): Hedges that may be spent at once
+        workers (int): Threads running hedged requests
+    """
+    global _hedging, _budget, _burst, _tokens, _latencies, _counts, _pool, _workers
+
+    with _lock:
+        old_pool = _pool
+        _timeouts.clear()
+        _timeouts.update(DEFAULT_TIMEOUTS)
+        _timeouts.update({phase: tuple(value) for phase, value in (timeouts or {}).items()})
+        _hedging = bool(hedging)
+        _budget = budget
+        _burst = burst
+        _tokens = float(burst)
+        _latencies = {}
+        _counts = {}
+        _workers = max(2, int(workers))
+        _pool = None
+
+    if old_pool is not None:
+        old_pool.shutdown(wait=False)
+
+
+def timeout(phase):
+    """
+    Return the (connect, read) timeouts of a phase
+    """
+    return _timeouts.get(phase, _timeouts['page'])
+
+
+def _get_pool():
+    global _pool
+
+    with _lock:
+        if _pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _pool = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix='hedged-fetch')
+        return _pool
+
+
+def _record(phase, elapsed, hedged=False):
+    global _tokens
+
+    with _lock:
+        _latencies.setdefault(phase, deque(maxlen=LATENCY_WINDOW)).append(elapsed)
+        counts = _counts.setdefault(phase, {'requests': 0, 'hedges': 0, 'hedge_wins': 0})
+        if not hedged:
+            counts['requests'] += 1
+            _tokens = min(_burst, _tokens + _budget)
+
+
+def _p95(samples):
+    """
+    Return the 95th percentile of sorted latencies, or None if there are too few of them
+    """
+    if len(samples) < MIN_SAMPLES:
+        return None
+    return samples[int(len(samples) * 0.95) - 1]
+
+
+def _hedge_delay(phase):
+    """
+    Return how long to wait for an answer before hedging, or None while the phase has too few samples
+    """
+    with _lock:
+        samples = sorted(_latencies.get(phase, ()))
+    p95 = _p95(samples)
+    return None if p95 is None else max(MIN_HEDGE_DELAY, p95)
+
+
+def _spend_hedge_token(phase):
+    global _tokens
+
+    with _lock:
+        if _tokens < 1:
+            return False
+        _tokens -= 1
+        _counts[phase]['hedges'] += 1
+        return True
+
+
+def stats():
+    """
+    Return the request count, hedges and p50/p95 latency in milliseconds of each phase
+    """
+    with _lock:
+        phases = {phase: (sorted(samples), dict(_counts[phase])) for phase, samples in _latencies.items()}
+
+    report = {}
+    for phase, (samples, counts) in phases.items():
+        p95 = _p95(samples)
+        report[phase] = dict(counts, p50_ms=int(samples[len(samples) // 2] * 1000),
+                             p95_ms=int(p95 * 1000) if p95 is not None else None)
+    return report
+
+
+def _timed(session, method, url, phase, kwargs, hedged=False):
+    started = time.monotonic()
+    try:
+        return session.request(method, url, **kwargs)
+    finally:
+        _record(phase, time.monotonic() - started, hedged)
+
+
+def _close_late(future):
+    # The slower of two hedged requests is not needed once the other answered
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def request(session, method, url, phase='page', **kwargs):
+    """
+    Send a request with the timeouts of its phase, hedging it when it is slow
+
+    With hedging on, a GET or HEAD that has not answered within the p95
+    latency observed for its phase is sent a second time, and whichever
+    answers first is returned. Hedges are limited by the hedge budget, so a
+    slow Moodle gets at most a few percent more requests. Streamed requests
+    and the login phase are never hedged: a second login attempt would
+    replace the session cookie and login token of the first.
+
+    Args:
+        session (requests.Session): The session to send with
+        method (str): The HTTP method
+        url (str): The URL
+        phase (str): The crawl phase, which selects the timeouts (page, resource, probe, login)
+        **kwargs: Further arguments for session.request
+
+    Returns:
+        requests.Response: The first response
+
+    Raises:
+        requests.RequestException: If the request, and its hedge, failed
+    """
+    kwargs.setdefault('timeout', timeout(phase))
+    delay = None
+    if _hedging and phase != 'login' and method in ('GET', 'HEAD') and not kwargs.get('stream'):
+        delay = _hedge_delay(phase)
+    if delay is None:
+        return _timed(session, method, url, phase, kwargs)
+
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    pool = _get_pool()
+    primary = pool.submit(_timed, session, method, url, phase, kwargs)
+    done, _ = wait([primary], timeout=delay)
+    if done or not _spend_hedge_token(phase):
+        return primary.result()
+
+    logger.info(f"No answer from {url} after {int(delay * 1000)}ms, hedging the request")
+    hedge = pool.submit(_timed, session, method, url, phase, kwargs, True)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                error = error or future.exception()
+                continue
+            for other in (primary, hedge):
+                if other is not future:
+                    other.add_done_callback(_close_late)
+            if future is hedge:
+                with _lock:
+                    _counts[phase]['hedge_wins'] += 1
+            return future.result()
+    raise error
+
+
+def get(session, url, phase='page', **kwargs):
+    return request(session, 'GET', url, phase, **kwargs)
+
+
+def head(session, url, phase='probe', **kwargs):
+    # Like session.head, redirects are only followed when asked for
+    kwargs.setdefault('allow_redirects', False)
+    return request(session, 'HEAD', url, phase, **kwargs)
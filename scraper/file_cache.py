@@ -0,0 +1,338 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Default location and lifetime of cached course files
+DEFAULT_CACHE_DIR = '/tmp/moodle_files'
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+# Total size in bytes of the cached files; the least recently used ones are removed beyond it
+DEFAULT_CACHE_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+
+class FileCache:
+    """
+    On-disk cache of downloaded course files keyed by their Moodle URL
+
+    Each file is stored as `<key>.bin` next to a `<key>.json` metadata file
+    holding the filename, content type, size and a content hash used as ETag.
+    Cached files are plain files on disk, so they can be served with
+    sendfile or handed to the front-end web server. Entries are shared by
+    every user and carry no access control: a hit may only be served to a
+    session verified for the file's course, or checked with
+    downloads.can_download().
+
+    The modification time of the metadata file records the last hit. Every
+    stored file purges the expired entries, then removes the least recently
+    used ones until the cached files fit in `max_size` bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, ttl=DEFAULT_CACHE_TTL, max_size=DEFAULT_CACHE_MAX_SIZE):
+        self.directory = str(directory)
+        self.ttl = ttl
+        self.max_size = max_size
+
+    def key_for(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        return (os.path.join(self.directory, f"{key}.bin"),
+                os.path.join(self.directory, f"{key}.json"))
+
+    def lookup(self, url):
+        """
+        Find a fresh cached copy of a file
+
+        Args:
+            url (str): The URL the file was downloaded from
+
+        Returns:
+            dict: Cache entry with path, filename, content_type, size, etag and
+                mtime keys, or None on a miss
+        """
+        if not url:
+            return None
+
+        data_path, meta_path = self._paths(self.key_for(url))
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            stat = os.stat(data_path)
+        except (OSError, ValueError):
+            return None
+
+        if self._expired(entry):
+            self._remove(data_path, meta_path)
+            return None
+
+        if stat.st_size != entry.get('size'):
+            return None
+
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+
+        entry['path'] = data_path
+        entry['mtime'] = stat.st_mtime
+        return entry
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.time() - entry.get('stored_at', 0) > self.ttl
+
+    def _remove(self, *paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def purge(self, keep=None):
+        """
+        Remove expired entries and abandoned partial files, then the least
+        recently used entries while the cache is over `max_size`
+
+        Args:
+            keep (str, optional): Key of an entry that is never evicted, such as the one just stored
+
+        Returns:
+            int: Number of entries removed
+        """
+        entries = []
+        removed = 0
+
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith('.part'):
+                # Left behind by a process that died while writing
+                try:
+                    if self.ttl is not None and time.time() - os.stat(path).st_mtime > self.ttl:
+                        self._remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith('.json'):
+                continue
+
+            key = name[:-len('.json')]
+            data_path, meta_path = self._paths(key)
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                used_at = os.stat(meta_path).st_mtime
+                size = os.stat(data_path).st_size
+            except (OSError, ValueError):
+                continue
+
+            if self._expired(entry):
+                self._remove(data_path, meta_path)
+                removed += 1
+            else:
+                entries.append((used_at, key, size))
+
+        total = sum(size for _, _, size in entries)
+        if self.max_size is not None and total > self.max_size:
+            for _, key, size in sorted(entries):
+                if total <= self.max_size:
+                    break
+                if key == keep:
+                    continue
+                data_path, meta_path = self._paths(key)
+                self._remove(data_path, meta_path)
+                total -= size
+                removed += 1
+
+        if removed:
+            logger.info(f"Purged {removed} files from the file cache ({total} bytes left)")
+        return removed
+
+    def open_writer(self, url, filename, content_type):
+        """
+        Start writing a file into the cache
+
+        Args:
+            url (str): The URL the file is downloaded from
+            filename (str): The filename to serve the file under
+            content_type (str): The content type of the file
+
+        Returns:
+            CacheWriter: File-like writer; call commit() once the body is complete
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        return CacheWriter(self, self.key_for(url), url, filename, content_type)
+
+    def store(self, url, file_response, filename, content_type, chunk_size=64 * 1024):
+        """
+        Stream a download into the cache without holding it in memory
+
+        Args:
+            url (str): The URL the file was downloaded from
+            file_response (requests.Response): Open streaming response
+            filename (str): The filename to serve the file under
+            content_type (str): The content type of the file
+            chunk_size (int): Size of the chunks read from the response
+
+        Returns:
+            dict: The cache entry for the stored file
+        """
+        writer = self.open_writer(url, filename, content_type)
+        try:
+            for chunk in file_response.iter_content(chunk_size=chunk_size):
+                writer.write(chunk)
+        except Exception:
+            writer.discard()
+            raise
+        finally:
+            file_response.close()
+
+        return writer.commit()
+
+    def tee(self, url, file_response, filename, content_type, chunk_size=64 * 1024, on_stored=None):
+        """
+        Yield the chunks of a download while writing them into the cache
+
+        The file is only committed once the whole body went through, so a
+        failed download or a client that hangs up leaves nothing in the cache.
+
+        Args:
+            url (str): The URL the file is downloaded from
+            file_response (requests.Response): Open streaming response
+            filename (str): The filename to serve the file under
+            content_type (str): The content type of the file
+            chunk_size (int): Size of the chunks read from the response
+            on_stored (callable, optional): Called with the cache entry once the file is stored
+
+        Yields:
+            bytes: The chunks of the file
+        """
+        writer = self.open_writer(url, filename, content_type)
+        try:
+            for chunk in file_response.iter_content(chunk_size=chunk_size):
+                writer.write(chunk)
+                yield chunk
+        except BaseException:
+            writer.discard()
+            raise
+        finally:
+            file_response.close()
+
+        entry = writer.commit()
+        if on_stored is not None:
+            on_stored(entry)
+
+
+class CacheWriter:
+    """
+    Write a single file into a FileCache, hashing it on the way
+
+    The body goes to a temporary file that is atomically renamed into place by
+    commit(), so readers never see a partial file.
+    """
+
+    def __init__(self, cache, key, url, filename, content_type):
+        self.cache = cache
+        self.key = key
+        self.url = url
+        self.filename = filename
+        self.content_type = content_type
+        self._hash = hashlib.sha256()
+        self._size = 0
+        fd, self._tmp_path = tempfile.mkstemp(dir=cache.directory, suffix='.part')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        self._file.write(data)
+        self._hash.update(data)
+        self._size += len(data)
+        return len(data)
+
+    def commit(self):
+        self._file.close()
+        data_path, meta_path = self.cache._paths(self.key)
+        entry = {
+            'url': self.url,
+            'filename': self.filename,
+            'content_type': self.content_type,
+            'size': self._size,
+            'etag': self._hash.hexdigest(),
+            'stored_at': time.time()
+        }
+
+        os.replace(self._tmp_path, data_path)
+        fd, tmp_meta = tempfile.mkstemp(dir=self.cache.directory, suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_meta, meta_path)
+
+        logger.info(f"Cached {self.filename} ({self._size} bytes) at {data_path}")
+        entry['path'] = data_path
+        entry['mtime'] = os.stat(data_path).st_mtime
+        self.cache.purge(keep=self.key)
+        return entry
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+def describe_file(path, filename=None, content_type='application/octet-stream'):
+    """
+    Build a cache-style entry for a file that already exists on disk
+
+    The ETag is derived from the size and modification time, so the file does
+    not have to be read.
+
+    Args:
+        path (str): Path to the file
+        filename (str, optional): Name to serve the file under (defaults to its basename)
+        content_type (str): The content type of the file
+
+    Returns:
+        dict: Entry with path, filename, content_type, size, etag and mtime keys
+    """
+    stat = os.stat(path)
+    return {
+        'path': str(path),
+        'filename': filename or os.path.basename(path),
+        'content_type': content_type,
+        'size': stat.st_size,
+        'etag': f"{stat.st_size:x}-{int(stat.st_mtime * 1000):x}",
+        'mtime': stat.st_mtime
+    }
+
+
+class FileRange:
+    """
+    Read-only view over a byte range of an open file, used for Range requests
+    """
+
+    def __init__(self, file, start, length):
+        self._file = file
+        self._remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,304 @@
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+from . import catalogue, db_writer
+from .access import verify_course_access
+from .downloads import select_resources, stream_zip
+from .moodle_auth import iter_course_pdfs
+from .records import ResourceLink
+
+logger = logging.getLogger(__name__)
+
+# Seconds a finished job, its events and its archive are kept for late clients
+DEFAULT_JOB_TTL = 60 * 60
+
+# Where export jobs write their archives
+DEFAULT_JOB_DIR = os.path.join(tempfile.gettempdir(), 'moodle_jobs')
+
+# Byte progress is reported at most this often, in seconds
+PROGRESS_INTERVAL = 0.5
+
+# Events after which a job emits nothing more
+FINAL_EVENTS = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job once a client asked to cancel it
+    """
+
+
+class Job:
+    """
+    A crawl or export running in a background thread, and the events it emitted
+
+    Events are numbered from 1 so clients can resume a stream after the last
+    event they saw (the SSE `Last-Event-ID`).
+    """
+
+    def __init__(self, kind):
+        self.id = secrets.token_urlsafe(16)
+        self.kind = kind
+        self.status = 'running'
+        self.created_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.path = None
+        self._events = []
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+
+    def emit(self, event, **data):
+        """
+        Record an event and wake up the clients waiting for it
+        """
+        with self._changed:
+            self._events.append({'id': len(self._events) + 1, 'event': event, 'data': data, 'time': time.time()})
+            if event in FINAL_EVENTS:
+                self.status = event
+                self.finished_at = time.time()
+            self._changed.notify_all()
+
+    def events_after(self, last_id, timeout=None):
+        """
+        Return the events newer than `last_id`, waiting up to `timeout` seconds for one
+
+        Returns:
+            list: The new events, empty if none came in time
+        """
+        with self._changed:
+            if len(self._events) <= last_id and self.finished_at is None:
+                self._changed.wait(timeout)
+            return self._events[last_id:]
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        """
+        Stop the job here if it was cancelled
+
+        Raises:
+            JobCancelled: If a client cancelled the job
+        """
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def snapshot(self):
+        """
+        Return the job state as the jobs endpoint shows it
+        """
+        with self._changed:
+            last = self._events[-1] if self._events else None
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'created_at': int(self.created_at),
+                'finished_at': int(self.finished_at) if self.finished_at else None,
+                'event_count': len(self._events),
+                'last_event': last,
+                'result': self.result
+            }
+
+
+class JobStore:
+    """
+    In-process registry of jobs, keyed by unguessable IDs
+
+    Anyone holding a job ID may follow and cancel the job, like an API token.
+    Finished jobs are forgotten, and their archives deleted, `ttl` seconds
+    after they end.
+    """
+
+    def __init__(self, ttl=DEFAULT_JOB_TTL):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, kind, target, *args):
+        """
+        Start `target(job, *args)` in a background thread
+
+        Returns:
+            Job: The new job
+        """
+        job = Job(kind)
+        with self._lock:
+            self._purge_finished_locked()
+            self._jobs[job.id] = job
+
+        threading.Thread(target=self._run, args=(job, target, args), name=f"job-{kind}", daemon=True).start()
+        logger.info(f"Started {kind} job {job.id}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge_finished_locked()
+            return self._jobs.get(job_id)
+
+    def _run(self, job, target, args):
+        try:
+            job.result = target(job, *args)
+            final_event, data = 'done', {'result': job.result}
+        except JobCancelled:
+            logger.info(f"{job.kind} job {job.id} cancelled")
+            _remove(job.path)
+            final_event, data = 'cancelled', {}
+        except Exception as e:
+            logger.error(f"{job.kind} job {job.id} failed: {e}")
+            _remove(job.path)
+            final_event, data = 'failed', {'message': str(e)}
+        finally:
+            # The thread's database connection is not reused once the job is over
+            connection.close()
+
+        job.emit(final_event, **data)
+
+    def _purge_finished_locked(self):
+        expired_before = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < expired_before:
+                _remove(job.path)
+                del self._jobs[job_id]
+
+
+def _remove(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def eta(done, total, elapsed):
+    """
+    Estimate the seconds left from the work done so far, or None before anything is done
+    """
+    if not done or total is None or elapsed <= 0:
+        return None
+    return max(0, int((total - done) * elapsed / done))
+
+
+def crawl_course(job, course_id, url, session, refresh=False):
+    """
+    List the files of a course, reporting each resource as it is resolved
+
+    Emits `phase`, `course`, `resource` (one per file), `resource_error` and
+    `progress` events (resources resolved, total and ETA). The job fails
+    unless Moodle confirms the session may see the course.
+
+    Returns:
+        dict: `course_name`, `count` and the `pdfs` records
+    """
+    job.emit('phase', phase='listing')
+    access = verify_course_access(session, url, course_id)
+    if not access['success']:
+        raise RuntimeError(access['message'])
+
+    started = time.monotonic()
+    stored = None if refresh else catalogue.course_files(url, course_id)
+
+    if stored is not None:
+        job.emit('course', course_id=str(course_id), course_name=stored['course_name'], cached=True)
+        for pdf in stored['pdfs']:
+            job.emit('resource', **pdf)
+        db_writer.submit(catalogue.record_course_request, url, course_id, timezone.now())
+        return {'course_name': stored['course_name'], 'count': len(stored['pdfs']), 'pdfs': stored['pdfs']}
+
+    course_name = None
+    total = None
+    pdfs = []
+    for event, value in iter_course_pdfs(course_id, url=url, session=session):
+        job.check()
+        if event == 'failed':
+            raise RuntimeError(value)
+        if event == 'course':
+            course_name = value
+            job.emit('course', course_id=str(course_id), course_name=course_name, cached=False)
+        elif event == 'resources':
+            total = value
+            job.emit('phase', phase='resolving', total=total)
+        elif event == 'file':
+            pdfs.append(value)
+            job.emit('resource', **value)
+        elif event == 'error':
+            resource_name, resource_url, message = value
+            job.emit('resource_error', resource_name=resource_name, resource_url=resource_url, message=message)
+        elif event == 'progress':
+            job.emit('progress', resolved=value, total=total, eta=eta(value, total, time.monotonic() - started))
+
+    db_writer.submit(catalogue.store_course_files, url, course_id, {'course_name': course_name, 'pdfs': pdfs})
+    db_writer.submit(catalogue.record_course_request, url, course_id, timezone.now())
+    return {'course_name': course_name, 'count': len(pdfs), 'pdfs': pdfs}
+
+
+def export_course(job, course_id, url, session, files_selector='all', file_cache=None, directory=DEFAULT_JOB_DIR):
+    """
+    Crawl a course, then download the selected files into one ZIP archive on disk
+
+    After the crawl events, emits `phase` (downloading), `file` when a file is
+    added, `file_error` for files left out, and throttled `bytes` events with
+    the bytes written, files done, rate and ETA.
+
+    Returns:
+        dict: `course_name`, `files`, `bytes` and `errors` of the archive
+    """
+    listing = crawl_course(job, course_id, url, session)
+    selected = select_resources([ResourceLink.from_course_file(pdf) for pdf in listing['pdfs']], files_selector)
+    if not selected:
+        raise RuntimeError('No files match the files selector')
+
+    os.makedirs(directory, exist_ok=True)
+    job.path = os.path.join(directory, f"{job.id}.zip")
+    job.emit('phase', phase='downloading', total=len(selected))
+
+    started = time.monotonic()
+    state = {'bytes': 0, 'files': 0, 'errors': 0, 'reported_at': 0.0}
+
+    def report(force=False):
+        now = time.monotonic()
+        if not force and now - state['reported_at'] < PROGRESS_INTERVAL:
+            return
+        state['reported_at'] = now
+        elapsed = now - started
+        done = state['files'] + state['errors']
+        # Files still to come are assumed to be as large as the average one so far
+        average = state['bytes'] / max(state['files'], 1)
+        job.emit('bytes', bytes=state['bytes'], files_done=done, files_total=len(selected),
+                 rate=int(state['bytes'] / elapsed) if elapsed > 0 else None,
+                 eta=eta(state['bytes'], state['bytes'] + average * (len(selected) - done), elapsed))
+
+    def progress(event, name, value):
+        job.check()
+        if event == 'file':
+            state['files'] += 1
+            job.emit('file', name=name)
+        elif event == 'bytes':
+            state['bytes'] += value
+            report()
+        elif event == 'error':
+            state['errors'] += 1
+            job.emit('file_error', name=name, message=value)
+
+    # crawl_course verified the session for the course, so cached files need no further check
+    archive = stream_zip(session, selected, file_cache=file_cache, progress=progress, revalidate=False)
+    try:
+        with open(job.path, 'wb') as f:
+            for data in archive:
+                f.write(data)
+    finally:
+        archive.close()
+
+    report(force=True)
+    return {
+        'course_name': listing['course_name'],
+        'files': state['files'],
+        'bytes': os.path.getsize(job.path),
+        'errors': state['errors'],
+        'archive_name': f"course_{course_id}.zip"
+    }
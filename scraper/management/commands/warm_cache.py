@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from scraper.file_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_SIZE, DEFAULT_CACHE_TTL, FileCache
+from scraper.warmer import DEFAULT_BURST, DEFAULT_RATE, TokenBucket, warm_round
+
+
+class Command(BaseCommand):
+    help = 'Crawl the most requested courses ahead of demand, within a global request budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=getattr(settings, 'MOODLE_WARMER_URL', 'https://elearning.univ-bba.dz'),
+                            help='The Moodle URL')
+        parser.add_argument('--username', default=getattr(settings, 'MOODLE_WARMER_USERNAME', None),
+                            help='Moodle account used for crawling (default: MOODLE_WARMER_USERNAME)')
+        parser.add_argument('--password', default=getattr(settings, 'MOODLE_WARMER_PASSWORD', None),
+                            help='Its password (default: MOODLE_WARMER_PASSWORD)')
+        parser.add_argument('--top', type=int, default=getattr(settings, 'MOODLE_WARMER_TOP', 20),
+                            help='Maximum number of courses crawled per round')
+        parser.add_argument('--rate', type=float, default=getattr(settings, 'MOODLE_WARMER_RATE', DEFAULT_RATE),
+                            help='Outbound requests per second')
+        parser.add_argument('--burst', type=int, default=getattr(settings, 'MOODLE_WARMER_BURST', DEFAULT_BURST),
+                            help='Requests that may be sent at once after an idle period')
+        parser.add_argument('--interval', type=int, default=getattr(settings, 'MOODLE_WARMER_INTERVAL', 15 * 60),
+                            help='Seconds between the start of two rounds')
+        parser.add_argument('--files', action='store_true',
+                            help='Also download the files of warmed courses into the file cache')
+        parser.add_argument('--once', action='store_true', help='Run a single round and exit')
+
+    def handle(self, *args, **options):
+        if not options['username'] or not options['password']:
+            raise CommandError('A Moodle username and password are required (--username/--password)')
+
+        bucket = TokenBucket(rate=options['rate'], capacity=options['burst'])
+        file_cache = None
+        if options['files']:
+            file_cache = FileCache(
+                directory=getattr(settings, 'MOODLE_FILE_CACHE_DIR', DEFAULT_CACHE_DIR),
+                ttl=getattr(settings, 'MOODLE_FILE_CACHE_TTL', DEFAULT_CACHE_TTL),
+                max_size=getattr(settings, 'MOODLE_FILE_CACHE_MAX_SIZE', DEFAULT_CACHE_MAX_SIZE)
+            )
+
+        while True:
+            started = time.monotonic()
+            result = warm_round(
+                options['url'], options['username'], options['password'], bucket,
+                limit=options['top'], file_cache=file_cache, deadline=started + options['interval']
+            )
+            if result['success']:
+                self.stdout.write(result['message'])
+            else:
+                self.stderr.write(f"Warming round failed: {result['message']}")
+
+            if options['once']:
+                return
+
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
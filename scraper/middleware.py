@@ -0,0 +1,77 @@
+import re
+
+from django.conf import settings
+from django.http import FileResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this, in bytes, are sent uncompressed
+DEFAULT_COMPRESS_MIN_SIZE = 1024
+
+# Brotli quality: 4-5 compress listings better than gzip at a similar CPU cost
+DEFAULT_BROTLI_QUALITY = 5
+
+# Archives are compressed already, and event streams must reach the client message by message
+UNCOMPRESSED_TYPES = ('application/zip', 'text/event-stream')
+
+# Downloaded files: compressed formats already, and served with byte ranges over the raw body
+BINARY_TYPES = ('application/pdf', 'application/octet-stream', 'application/msword')
+BINARY_TYPE_PREFIXES = ('application/vnd.', 'image/', 'audio/', 'video/')
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+
+def is_compressible(response):
+    """
+    Tell whether a response may be compressed
+
+    Files are left alone: ranges (206, `Content-Range`, `Accept-Ranges`) and
+    their strong ETags describe the bytes on disk, which compression would change.
+    """
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    if content_type in UNCOMPRESSED_TYPES or content_type in BINARY_TYPES or content_type.startswith(BINARY_TYPE_PREFIXES):
+        return False
+    if isinstance(response, FileResponse) or response.status_code == 206:
+        return False
+    return not any(response.has_header(header) for header in ('Content-Encoding', 'Content-Range', 'Accept-Ranges'))
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress large API responses with brotli when it is installed and accepted, gzip otherwise
+
+    Streamed listings (NDJSON) are gzipped chunk by chunk, so lines still reach
+    the client as they are written; brotli is only used for complete responses.
+    Downloaded files are sent as they are, see is_compressible().
+    """
+
+    def process_response(self, request, response):
+        if not is_compressible(response):
+            return response
+
+        if not response.streaming and len(response.content) < getattr(settings, 'MOODLE_COMPRESS_MIN_SIZE', DEFAULT_COMPRESS_MIN_SIZE):
+            return response
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is None or response.streaming or not re_accepts_brotli.search(accept_encoding):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        quality = getattr(settings, 'MOODLE_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY)
+        compressed_content = brotli.compress(response.content, quality=quality)
+        if len(compressed_content) >= len(response.content):
+            return response
+
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(compressed_content))
+        # A compressed representation only matches its ETag weakly (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(max_length=255)),
+                ('moodle_id', models.CharField(max_length=32)),
+                ('parent_moodle_id', models.CharField(blank=True, max_length=32)),
+                ('name', models.CharField(max_length=255)),
+                ('crawled_at', models.DateTimeField()),
+                ('courses_crawled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['site', 'parent_moodle_id'], name='category_parent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('site', 'moodle_id'), name='unique_category')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Course',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(max_length=255)),
+                ('moodle_id', models.CharField(max_length=32)),
+                ('category_moodle_id', models.CharField(blank=True, max_length=32)),
+                ('name', models.CharField(max_length=255)),
+                ('shortname', models.CharField(blank=True, max_length=255)),
+                ('url', models.URLField(max_length=1000)),
+                ('last_modified', models.BigIntegerField(blank=True, null=True)),
+                ('crawled_at', models.DateTimeField()),
+                ('files_crawled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['site', 'category_moodle_id'], name='course_category_idx')],
+                'constraints': [models.UniqueConstraint(fields=('site', 'moodle_id'), name='unique_course')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Department',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(max_length=255)),
+                ('moodle_id', models.CharField(max_length=500)),
+                ('name', models.CharField(max_length=255)),
+                ('url', models.URLField(max_length=1000)),
+                ('crawled_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('site', 'moodle_id'), name='unique_department')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Resource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('moodle_id', models.CharField(blank=True, db_index=True, max_length=32)),
+                ('name', models.CharField(max_length=500)),
+                ('url', models.URLField(max_length=1000)),
+                ('url_hash', models.CharField(max_length=64)),
+                ('crawled_at', models.DateTimeField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resources', to='scraper.course')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='File',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500)),
+                ('url', models.URLField(max_length=1000)),
+                ('url_hash', models.CharField(db_index=True, max_length=64)),
+                ('type', models.CharField(max_length=32)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('members', models.JSONField(blank=True, default=list)),
+                ('content_hash', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('crawled_at', models.DateTimeField()),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='scraper.resource')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resource',
+            constraint=models.UniqueConstraint(fields=('course', 'url_hash'), name='unique_resource'),
+        ),
+        migrations.AddConstraint(
+            model_name='file',
+            constraint=models.UniqueConstraint(fields=('resource', 'url_hash'), name='unique_file'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0002_course_request_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Listing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(max_length=255)),
+                ('key', models.CharField(max_length=64)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('changed_at', models.DateTimeField()),
+                ('checked_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('site', 'key'), name='unique_listing')],
+            },
+        ),
+    ]
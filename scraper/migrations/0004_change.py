@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0003_listing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(max_length=255)),
+                ('course_moodle_id', models.CharField(max_length=32)),
+                ('kind', models.CharField(max_length=32)),
+                ('resource_name', models.CharField(blank=True, max_length=500)),
+                ('resource_url', models.URLField(blank=True, max_length=1000)),
+                ('file_name', models.CharField(blank=True, max_length=500)),
+                ('file_url', models.URLField(blank=True, max_length=1000)),
+                ('previous', models.CharField(blank=True, max_length=500)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['site', 'course_moodle_id', 'id'], name='change_course_idx')],
+            },
+        ),
+    ]
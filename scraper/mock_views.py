@@ -5,9 +5,15 @@ from django.http import FileResponse
 import io
 import os
 import logging
+from pathlib import Path
+from .file_cache import describe_file
+from .views import cached_file_response
 
 logger = logging.getLogger(__name__)
 
+# Sample files served by the mock endpoint when present on disk
+MOCK_DOWNLOADS_DIR = Path(__file__).resolve().parent.parent / 'mock_downloads'
+
 class MockAuthResourcesAPIView(APIView):
     """
     Mock API view to simulate the behavior of the AuthenticatedResourcesAPIView
@@ -62,13 +68,18 @@ class MockAuthResourcesAPIView(APIView):
             # Get the first resource
             resource = resources[0]
             
-            # Create a mock file
-            file_content = io.BytesIO(b'This is a mock file content for testing purposes.')
-            
             # Return the file
             filename = resource['pdf_name']
             content_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
             
+            # Serve the sample file straight from disk when it exists
+            mock_path = MOCK_DOWNLOADS_DIR / filename
+            if mock_path.is_file():
+                return cached_file_response(request, describe_file(mock_path, filename, content_type))
+            
+            # Create a mock file
+            file_content = io.BytesIO(b'This is a mock file content for testing purposes.')
+            
             response = FileResponse(file_content, content_type=content_type)
             response['Content-Disposition'] = f'attachment; filename="{filename}"'
             return response
@@ -1,3 +1,178 @@
 from django.db import models
 
-# Create your models here.
+
+class Department(models.Model):
+    """
+    A department of the course index, as listed in its `jump` menu
+    """
+    site = models.CharField(max_length=255)
+    moodle_id = models.CharField(max_length=500)
+    name = models.CharField(max_length=255)
+    url = models.URLField(max_length=1000)
+    crawled_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['site', 'moodle_id'], name='unique_department'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Category(models.Model):
+    """
+    A Moodle course category; `parent_moodle_id` is empty for top-level categories
+    """
+    site = models.CharField(max_length=255)
+    moodle_id = models.CharField(max_length=32)
+    parent_moodle_id = models.CharField(max_length=32, blank=True)
+    name = models.CharField(max_length=255)
+    crawled_at = models.DateTimeField()
+    courses_crawled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = 'categories'
+        constraints = [
+            models.UniqueConstraint(fields=['site', 'moodle_id'], name='unique_category'),
+        ]
+        indexes = [
+            models.Index(fields=['site', 'parent_moodle_id'], name='category_parent_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Course(models.Model):
+    """
+    A Moodle course; `files_crawled_at` is set once its files have been listed
+
+    `request_score` counts requests for the course's files, decayed with a
+    half-life as of `last_requested_at`; the cache warmer crawls the hottest courses.
+    """
+    site = models.CharField(max_length=255)
+    moodle_id = models.CharField(max_length=32)
+    category_moodle_id = models.CharField(max_length=32, blank=True)
+    name = models.CharField(max_length=255)
+    shortname = models.CharField(max_length=255, blank=True)
+    url = models.URLField(max_length=1000)
+    last_modified = models.BigIntegerField(null=True, blank=True)
+    crawled_at = models.DateTimeField()
+    files_crawled_at = models.DateTimeField(null=True, blank=True)
+    request_score = models.FloatField(default=0)
+    last_requested_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['site', 'moodle_id'], name='unique_course'),
+        ]
+        indexes = [
+            models.Index(fields=['site', 'category_moodle_id'], name='course_category_idx'),
+            models.Index(fields=['site', 'last_requested_at'], name='course_requested_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Resource(models.Model):
+    """
+    An activity of a course (file resource, folder, link) holding one or more files
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='resources')
+    moodle_id = models.CharField(max_length=32, blank=True, db_index=True)
+    name = models.CharField(max_length=500)
+    url = models.URLField(max_length=1000)
+    url_hash = models.CharField(max_length=64)
+    crawled_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'url_hash'], name='unique_resource'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class File(models.Model):
+    """
+    A downloadable file of a resource, in the order the course page lists it
+
+    `content_hash` is the SHA-256 of the body, filled in once the file has been
+    downloaded through the file cache.
+    """
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='files')
+    name = models.CharField(max_length=500)
+    url = models.URLField(max_length=1000)
+    url_hash = models.CharField(max_length=64, db_index=True)
+    type = models.CharField(max_length=32)
+    position = models.PositiveIntegerField(default=0)
+    members = models.JSONField(default=list, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    crawled_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['resource', 'url_hash'], name='unique_file'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Listing(models.Model):
+    """
+    The content hash of a stored listing (departments, the courses of a category, the files of a course)
+
+    `changed_at` only moves when a crawl finds different content, so it and
+    the hash answer conditional requests; `checked_at` is the last crawl.
+    """
+    site = models.CharField(max_length=255)
+    key = models.CharField(max_length=64)
+    content_hash = models.CharField(max_length=64)
+    changed_at = models.DateTimeField()
+    checked_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['site', 'key'], name='unique_listing'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class Change(models.Model):
+    """
+    An entry of the append-only change log of a course, written when a crawl or download finds a difference
+
+    `previous` holds the former name of a renamed resource or file, or the
+    former content hash of a file whose body changed.
+    """
+    site = models.CharField(max_length=255)
+    course_moodle_id = models.CharField(max_length=32)
+    kind = models.CharField(max_length=32)
+    resource_name = models.CharField(max_length=500, blank=True)
+    resource_url = models.URLField(max_length=1000, blank=True)
+    file_name = models.CharField(max_length=500, blank=True)
+    file_url = models.URLField(max_length=1000, blank=True)
+    previous = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['site', 'course_moodle_id', 'id'], name='change_course_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.file_name or self.resource_name}"
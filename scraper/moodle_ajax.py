@@ -0,0 +1,315 @@
+import logging
+import re
+import threading
+import weakref
+
+from . import fetch
+from .parsing import parse_html
+
+logger = logging.getLogger(__name__)
+
+# `M.cfg = {..., "sesskey":"abc123", ...}` in every logged-in Moodle page
+SESSKEY_PATTERN = re.compile(r'"sesskey"\s*:\s*"([^"]+)"')
+SESSKEY_INPUT_PATTERN = re.compile(r'name="sesskey"\s+value="([^"]+)"')
+
+# Page fetched to read the sesskey when the caller does not already have one
+SESSKEY_PAGE = '/my/'
+
+# Sesskeys found so far, per authenticated session
+_sesskeys = weakref.WeakKeyDictionary()
+_sesskeys_lock = threading.Lock()
+
+
+class MoodleAjaxError(Exception):
+    """
+    Raised when Moodle rejects an AJAX call
+    """
+
+    def __init__(self, message, errorcode=None):
+        super().__init__(message)
+        self.errorcode = errorcode
+
+
+def find_sesskey(html):
+    """
+    Extract the sesskey from a logged-in Moodle page
+
+    Args:
+        html (str): The page HTML
+
+    Returns:
+        str: The sesskey, or None if the page does not contain one
+    """
+    match = SESSKEY_PATTERN.search(html) or SESSKEY_INPUT_PATTERN.search(html)
+    return match.group(1) if match else None
+
+
+class MoodleAjaxClient:
+    """
+    Client for Moodle's AJAX endpoint (`lib/ajax/service.php`) on an authenticated session
+
+    The endpoint takes a list of web service calls in one POST, so lookups that
+    would otherwise need several page scrapes are sent as a single batch. The
+    sesskey is read once per session and refreshed when Moodle rejects it.
+    """
+
+    def __init__(self, session, url='https://elearning.univ-bba.dz', sesskey=None, timeout=30):
+        self.session = session
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        if sesskey:
+            with _sesskeys_lock:
+                _sesskeys[session] = sesskey
+
+    def get_sesskey(self, refresh=False):
+        """
+        Return the sesskey of the session, fetching a page to read it if needed
+
+        Args:
+            refresh (bool): Ignore the remembered sesskey and read it again
+
+        Returns:
+            str: The sesskey
+
+        Raises:
+            MoodleAjaxError: If the session is not logged in
+        """
+        if not refresh:
+            with _sesskeys_lock:
+                sesskey = _sesskeys.get(self.session)
+            if sesskey:
+                return sesskey
+
+        page_url = f"{self.url}{SESSKEY_PAGE}"
+        logger.info(f"Fetching sesskey from: {page_url}")
+        response = fetch.get(self.session, page_url, 'page', timeout=self.timeout)
+
+        sesskey = find_sesskey(response.text)
+        if not sesskey or 'login/index.php' in response.url:
+            raise MoodleAjaxError('Not logged in or session expired', 'requirelogin')
+
+        with _sesskeys_lock:
+            _sesskeys[self.session] = sesskey
+        return sesskey
+
+    def _post(self, calls, sesskey):
+        methodnames = ','.join(methodname for methodname, _ in calls)
+        payload = [
+            {'index': index, 'methodname': methodname, 'args': args or {}}
+            for index, (methodname, args) in enumerate(calls)
+        ]
+
+        response = fetch.request(
+            self.session, 'POST', f"{self.url}/lib/ajax/service.php", 'page',
+            params={'sesskey': sesskey, 'info': methodnames},
+            json=payload,
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def batch(self, calls):
+        """
+        Send several web service calls in one request
+
+        Args:
+            calls (list): (methodname, args) tuples
+
+        Returns:
+            list: One dict per call, in order, with `success`, `data` and
+                `message`/`errorcode` keys
+
+        Raises:
+            MoodleAjaxError: If the whole batch is rejected (e.g. the session expired)
+        """
+        if not calls:
+            return []
+
+        logger.info(f"Calling {len(calls)} Moodle AJAX method(s): {', '.join(name for name, _ in calls)}")
+        body = self._post(calls, self.get_sesskey())
+
+        # A batch-level error means the sesskey or session is no longer valid
+        if isinstance(body, dict) and body.get('error'):
+            if body.get('errorcode') == 'invalidsesskey':
+                logger.info('Sesskey rejected, reading a fresh one')
+                body = self._post(calls, self.get_sesskey(refresh=True))
+
+            if isinstance(body, dict) and body.get('error'):
+                raise MoodleAjaxError(body.get('error') if isinstance(body.get('error'), str) else 'AJAX request failed',
+                                      body.get('errorcode'))
+
+        results = []
+        for item in body:
+            if item.get('error'):
+                exception = item.get('exception') or {}
+                results.append({
+                    'success': False,
+                    'data': None,
+                    'message': exception.get('message', 'AJAX call failed'),
+                    'errorcode': exception.get('errorcode')
+                })
+            else:
+                results.append({
+                    'success': True,
+                    'data': item.get('data'),
+                    'message': 'OK'
+                })
+
+        return results
+
+    def call(self, methodname, **args):
+        """
+        Send a single web service call
+
+        Args:
+            methodname (str): The web service function, such as `core_course_get_contents`
+            **args: The function arguments
+
+        Returns:
+            The `data` of the call
+
+        Raises:
+            MoodleAjaxError: If the call fails
+        """
+        result = self.batch([(methodname, args)])[0]
+        if not result['success']:
+            raise MoodleAjaxError(result['message'], result.get('errorcode'))
+        return result['data']
+
+    def get_enrolled_courses(self, classification='all', limit=0, offset=0, sort='fullname'):
+        """
+        List the courses the user is enrolled in, as shown on the dashboard
+
+        Args:
+            classification (str): Timeline classification (`all`, `inprogress`, `future`, `past`, ...)
+            limit (int): Maximum number of courses, 0 for all
+            offset (int): Number of courses to skip
+            sort (str): Sort order of the courses
+
+        Returns:
+            list: Course dicts as returned by Moodle
+        """
+        data = self.call(
+            'core_course_get_enrolled_courses_by_timeline_classification',
+            classification=classification,
+            limit=limit,
+            offset=offset,
+            sort=sort
+        )
+        return data.get('courses', [])
+
+    def get_courses_by_field(self, field='', value=''):
+        """
+        Look up courses by `id`, `ids`, `shortname`, `idnumber` or `category`
+
+        Returns:
+            list: Course dicts as returned by Moodle
+        """
+        data = self.call('core_course_get_courses_by_field', field=field, value=str(value))
+        return data.get('courses', [])
+
+    def get_course_contents(self, course_ids):
+        """
+        Fetch the sections and modules of several courses in one request
+
+        Args:
+            course_ids (list): The course IDs
+
+        Returns:
+            dict: Course ID to its list of sections; courses Moodle refused map to None
+        """
+        course_ids = [int(course_id) for course_id in course_ids]
+        results = self.batch([('core_course_get_contents', {'courseid': course_id}) for course_id in course_ids])
+
+        contents = {}
+        for course_id, result in zip(course_ids, results):
+            if not result['success']:
+                logger.warning(f"Could not get contents of course {course_id}: {result['message']}")
+            contents[course_id] = result['data'] if result['success'] else None
+        return contents
+
+
+def _course_summary(course, url):
+    return {
+        'id': str(course.get('id')),
+        'name': course.get('fullname') or course.get('shortname') or f"Course {course.get('id')}",
+        'shortname': course.get('shortname'),
+        'category': course.get('coursecategory'),
+        'url': course.get('viewurl') or f"{url}/course/view.php?id={course.get('id')}",
+        'last_access': course.get('timeaccess')
+    }
+
+
+def _scrape_dashboard_courses(session, url, timeout):
+    response = fetch.get(session, f"{url}{SESSKEY_PAGE}", 'page', timeout=timeout)
+    soup = parse_html(response.text)
+
+    courses = {}
+    for link in soup.select('a[href*="/course/view.php?id="]'):
+        course_id = re.search(r'id=([0-9]+)', link.get('href', ''))
+        if course_id and course_id.group(1) not in courses:
+            courses[course_id.group(1)] = {'id': course_id.group(1), 'fullname': link.text.strip()}
+    return list(courses.values())
+
+
+def get_enrolled_courses(username=None, password=None, url='https://elearning.univ-bba.dz', session=None, timeout=30):
+    """
+    Retrieve the courses the user is enrolled in
+
+    The dashboard course list is read through the AJAX endpoint. When the AJAX
+    service is unavailable, the course links of the dashboard page are used
+    instead, without the `last_access` hints.
+
+    Args:
+        username (str, optional): The username for Moodle
+        password (str, optional): The password for Moodle
+        url (str): The Moodle URL
+        session (requests.Session, optional): An authenticated session to reuse instead of logging in
+        timeout (int): Timeout in seconds for each request
+
+    Returns:
+        dict: Result containing success status, message, and list of courses.
+            Each course carries a `last_access` timestamp when Moodle provides it.
+    """
+    from .moodle_auth import get_authenticated_session
+
+    try:
+        session, login_error = get_authenticated_session(username, password, url, session)
+
+        if session is None:
+            return {
+                'success': False,
+                'message': login_error,
+                'courses': []
+            }
+
+        client = MoodleAjaxClient(session, url, timeout=timeout)
+
+        try:
+            courses = client.get_enrolled_courses()
+        except MoodleAjaxError as e:
+            if e.errorcode == 'requirelogin':
+                raise
+            logger.warning(f"AJAX course listing failed ({e}), reading the dashboard instead")
+            courses = _scrape_dashboard_courses(session, client.url, timeout)
+
+        courses = [_course_summary(course, client.url) for course in courses]
+
+        return {
+            'success': True,
+            'message': f"Found {len(courses)} enrolled courses",
+            'courses': courses
+        }
+    except MoodleAjaxError as e:
+        return {
+            'success': False,
+            'message': str(e),
+            'courses': []
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error retrieving enrolled courses: {str(e)}")
+        return {
+            'success': False,
+            'message': f"Unexpected error: {str(e)}",
+            'courses': []
+        }
@@ -1,19 +1,16 @@
 import requests
 import logging
-import json
 import subprocess
 import os
 import re
 from pathlib import Path
 from urllib.parse import urljoin
 
-try:
-    from bs4 import BeautifulSoup
-except ImportError:
-    # Install BeautifulSoup if not available
-    import subprocess
-    subprocess.check_call(["pip", "install", "beautifulsoup4"])
-    from bs4 import BeautifulSoup
+from . import extractors, fetch, parse_pool, records
+from .pagination import collect_pages, listing_url
+from .parsing import parse_html
+from .resolver import ResourceResolver
+from .sniffing import SniffedResponse
 
 logger = logging.getLogger(__name__)
 
@@ -52,10 +49,9 @@ def moodle_login(username, password, url='https://elearning.univ-bba.dz'):
             login_url = f"{url}/login/index.php"
 
             # Get login page to extract token
-            response = session.get(login_url)
+            response = fetch.get(session, login_url, 'login')
 
             # Extract login token
-            import re
             token_match = re.search(r'name="logintoken" value="([^"]+)"', response.text)
             if not token_match:
                 return {
@@ -74,7 +70,7 @@ def moodle_login(username, password, url='https://elearning.univ-bba.dz'):
                 'anchor': ''
             }
 
-            login_response = session.post(login_url, data=login_data)
+            login_response = fetch.request(session, 'POST', login_url, 'login', data=login_data)
 
             # Check if login was successful
             if login_response.url != login_url and 'loginerrors' not in login_response.text:
@@ -110,39 +106,74 @@ def moodle_login(username, password, url='https://elearning.univ-bba.dz'):
             'cookies': None
         }
 
-def get_category_courses(category_id, username, password, url='https://elearning.univ-bba.dz'):
+def session_from_cookies(cookies):
+    """
+    Build a requests session from Moodle session cookies
+
+    Args:
+        cookies (dict): Cookies returned by a successful login
+
+    Returns:
+        requests.Session: A session carrying the cookies
+    """
+    session = requests.Session()
+    for key, value in (cookies or {}).items():
+        session.cookies.set(key, value)
+    return session
+
+
+def get_authenticated_session(username=None, password=None, url='https://elearning.univ-bba.dz', session=None):
+    """
+    Return an authenticated session, logging in only when none is supplied
+
+    Args:
+        username (str, optional): The username for Moodle
+        password (str, optional): The password for Moodle
+        url (str): The Moodle URL
+        session (requests.Session, optional): An already authenticated session
+
+    Returns:
+        tuple: (session, error message). The session is None when login failed.
+    """
+    if session is not None:
+        return session, None
+
+    login_result = moodle_login(username, password, url)
+
+    if not login_result.get('success'):
+        return None, login_result.get('message', 'Login failed')
+
+    return session_from_cookies(login_result.get('cookies')), None
+
+def get_category_courses(category_id, username=None, password=None, url='https://elearning.univ-bba.dz', session=None):
     """
     Retrieve courses from a Moodle category
 
     Args:
         category_id (str): The category ID to retrieve courses from
-        username (str): The username for Moodle
-        password (str): The password for Moodle
+        username (str, optional): The username for Moodle
+        password (str, optional): The password for Moodle
         url (str): The Moodle URL
+        session (requests.Session, optional): An authenticated session to reuse instead of logging in
 
     Returns:
         dict: Result containing success status, message, and list of courses
     """
     try:
-        # Login to Moodle
-        login_result = moodle_login(username, password, url)
+        # Login to Moodle unless we already have a session
+        session, login_error = get_authenticated_session(username, password, url, session)
 
-        if not login_result.get('success'):
+        if session is None:
             return {
                 'success': False,
-                'message': login_result.get('message', 'Login failed'),
+                'message': login_error,
                 'courses': []
             }
 
-        # Create a session with the provided cookies
-        session = requests.Session()
-        for key, value in login_result.get('cookies', {}).items():
-            session.cookies.set(key, value)
-
-        # Get the category page
-        category_url = f"{url}/course/index.php?categoryid={category_id}"
+        # Get the category page, asking for every course on one page
+        category_url = listing_url(f"{url}/course/index.php?categoryid={category_id}")
         logger.info(f"Fetching category page: {category_url}")
-        category_response = session.get(category_url)
+        category_response = fetch.get(session, category_url)
 
         # Log the response status and size
         logger.info(f"Category page response status: {category_response.status_code}")
@@ -165,13 +196,17 @@ def get_category_courses(category_id, username, password, url='https://elearning
 
         # Parse the category page
 
-        soup = BeautifulSoup(category_response.text, 'html.parser')
+        soup = parse_html(category_response.text)
 
         # Get category name
         category_name = soup.select_one('h1').text.strip() if soup.select_one('h1') else f"Category {category_id}"
 
-        # Find all course links
-        course_links = soup.select('a[href*="/course/view.php?id="]')
+        # Find all course links, on every page of the listing when Moodle still paginates it
+        course_links = [
+            link
+            for page_soup in collect_pages(session, category_response.url, soup)
+            for link in page_soup.select('a[href*="/course/view.php?id="]')
+        ]
 
         if not course_links:
             return {
@@ -186,6 +221,7 @@ def get_category_courses(category_id, username, password, url='https://elearning
 
         # Process each course link
         courses = []
+        seen_course_ids = set()
 
         for link in course_links:
             course_name = link.text.strip()
@@ -200,13 +236,17 @@ def get_category_courses(category_id, username, password, url='https://elearning
                 course_url = urljoin(url, course_url)
 
             # Extract course ID from URL
-            import re
             course_id_match = re.search(r'id=([0-9]+)', course_url)
             if not course_id_match:
                 continue
 
             course_id = course_id_match.group(1)
 
+            # The same course can be linked twice (name and image)
+            if course_id in seen_course_ids:
+                continue
+            seen_course_ids.add(course_id)
+
             # Add to the list of courses
             courses.append({
                 'id': course_id,
@@ -232,106 +272,91 @@ def get_category_courses(category_id, username, password, url='https://elearning
         }
 
 
-def get_course_pdfs(course_id, username, password, url='https://elearning.univ-bba.dz'):
+def is_folder_archive_url(url):
     """
-    Retrieve PDF files from a Moodle course
+    Tell whether a URL is Moodle's folder ZIP download
+    """
+    return 'download_folder.php' in (url or '')
+
+
+def iter_course_pdfs(course_id, username=None, password=None, url='https://elearning.univ-bba.dz', session=None, folder_archives=True):
+    """
+    Retrieve the files of a Moodle course, yielding each one as soon as it is resolved
 
     Args:
         course_id (str): The course ID to retrieve PDFs from
-        username (str): The username for Moodle
-        password (str): The password for Moodle
+        username (str, optional): The username for Moodle
+        password (str, optional): The password for Moodle
         url (str): The Moodle URL
-
-    Returns:
-        dict: Result containing success status, message, and list of PDF files
+        session (requests.Session, optional): An authenticated session to reuse instead of logging in
+        folder_archives (bool): List a folder as a single `folder_archive` entry pointing at
+            Moodle's folder ZIP download when the folder offers one, instead of one entry per file
+
+    Yields:
+        tuple: (event, value) pairs, in this order:
+            ('course', course name) once the course page has been read,
+            ('resources', number of resource links on the course page),
+            ('file', CourseFile) for every file found,
+            ('error', (resource name, resource URL, message)) for resources that could not be read,
+            ('progress', number of resources resolved so far) after each resource,
+            ('done', probe statistics, or None if the course lists no resources).
+            If the course cannot be listed, ('failed', message) ends the stream instead.
     """
     try:
-        # Login to Moodle
-        login_result = moodle_login(username, password, url)
+        # Login to Moodle unless we already have a session
+        session, login_error = get_authenticated_session(username, password, url, session)
 
-        if not login_result.get('success'):
-            return {
-                'success': False,
-                'message': login_result.get('message', 'Login failed'),
-                'pdfs': []
-            }
-
-        # Create a session with the provided cookies
-        session = requests.Session()
-        for key, value in login_result.get('cookies', {}).items():
-            session.cookies.set(key, value)
+        if session is None:
+            yield 'failed', login_error
+            return
 
         # Get the course page
         course_url = f"{url}/course/view.php?id={course_id}"
         logger.info(f"Fetching course page: {course_url}")
-        course_response = session.get(course_url)
+        course_response = fetch.get(session, course_url)
 
         # Log the response status and size
         logger.info(f"Course page response status: {course_response.status_code}")
         logger.info(f"Course page response size: {len(course_response.text)} bytes")
 
         if course_response.status_code != 200:
-            return {
-                'success': False,
-                'message': f"Failed to access course page. Status code: {course_response.status_code}",
-                'pdfs': []
-            }
+            yield 'failed', f"Failed to access course page. Status code: {course_response.status_code}"
+            return
 
         # Check if we're actually logged in
         if 'loginerrors' in course_response.text or 'login/index.php' in course_response.url:
-            return {
-                'success': False,
-                'message': "Not logged in or session expired",
-                'pdfs': []
-            }
-
-        # Parse the course page
-
-        soup = BeautifulSoup(course_response.text, 'html.parser')
-
-        # Get course name
-        course_name = soup.select_one('h1').text.strip() if soup.select_one('h1') else f"Course {course_id}"
-
-        # Find all resource links - look for various types of resource links
-        resource_links = soup.select('a[href*="/mod/resource/view.php"], a[href*="/mod/folder/view.php"]')
-
-        # Also look for links with aalink class (common in Moodle for resources)
-        aalink_resources = soup.select('a.aalink')
-        for link in aalink_resources:
-            if link not in resource_links:
-                resource_links.append(link)
+            yield 'failed', "Not logged in or session expired"
+            return
 
-        # Also look for direct PDF links in the course page
-        direct_pdf_links = soup.select('a[href*=".pdf"], a[href*="pluginfile.php"]')
+        # Users who are not enrolled get the enrolment page, which must not be listed as the course
+        if 'enrol/index.php' in course_response.url:
+            yield 'failed', f"Not enrolled in course {course_id}"
+            return
 
-        # Add direct PDF links to resource links for processing
-        for link in direct_pdf_links:
-            if link not in resource_links:
-                resource_links.append(link)
+        # Parse the course page into (href, text, hints) link records
+        course_name, resource_links = parse_pool.run(extractors.course_links, course_response.text)
+        course_name = course_name or f"Course {course_id}"
+        yield 'course', course_name
 
         # Log all found resource links for debugging
-        for link in resource_links:
-            href = link.get('href', '')
-            text = link.text.strip()
-            logger.info(f"Found resource link: {text} - {href}")
+        for href, text, hints in resource_links:
+            logger.info(f"Found resource link: {text} - {href or ''}")
 
         if not resource_links:
-            return {
-                'success': True,
-                'message': f"No resources found in course {course_id}",
-                'course_name': course_name,
-                'pdfs': []
-            }
+            yield 'done', None
+            return
 
         # Log the number of resources found
         logger.info(f"Found {len(resource_links)} resources in course {course_id}")
+        yield 'resources', len(resource_links)
 
         # Process each resource link to find PDFs
-        pdfs = []
+        resolver = ResourceResolver()
 
-        for link in resource_links:
-            resource_name = link.text.strip()
-            resource_url = link.get('href')
+        for index, (resource_url, resource_name, hints) in enumerate(resource_links):
+            # Every resource before this one has been resolved
+            if index:
+                yield 'progress', index
 
             # Skip if no URL
             if not resource_url:
@@ -345,10 +370,26 @@ def get_course_pdfs(course_id, username, password, url='https://elearning.univ-b
             if resource_url.lower().endswith('.pdf') or 'pluginfile.php' in resource_url or '/mod/resource/view.php' in resource_url:
                 # For resource links, we need to check if they directly download a PDF
                 if '/mod/resource/view.php' in resource_url:
-                    # Try a HEAD request first to see if it's a PDF
+                    # Use the course page markup and earlier crawls before probing the link
+                    resolution = resolver.infer(hints, resource_url, resource_name)
+
+                    if not resolution['probe'] and resolution['is_file']:
+                        yield 'file', records.CourseFile(
+                            name=resolution['name'],
+                            url=resource_url,
+                            resource_name=resource_name,
+                            resource_url=resource_url,
+                            type=records.RESOURCE_PDF
+                        )
+
+                        logger.info(f"Resolved resource without probing: {resource_url}")
+                        continue
+
+                # Try a HEAD request first to see if it's a PDF
+                if '/mod/resource/view.php' in resource_url and resolution['probe']:
                     try:
                         logger.info(f"Checking if resource is a direct PDF download: {resource_url}")
-                        head_response = session.head(resource_url, allow_redirects=True)
+                        head_response = fetch.head(session, resource_url, allow_redirects=True)
 
                         # Check the final URL after redirects
                         final_url = head_response.url
@@ -372,7 +413,6 @@ def get_course_pdfs(course_id, username, password, url='https://elearning.univ-b
 
                             # Try to get a better filename from Content-Disposition
                             if 'filename=' in content_disposition:
-                                import re
                                 filename_match = re.search(r'filename="?([^"]+)"?', content_disposition)
                                 if filename_match:
                                     pdf_name = filename_match.group(1)
@@ -380,18 +420,23 @@ def get_course_pdfs(course_id, username, password, url='https://elearning.univ-b
                             elif final_url.lower().endswith('.pdf'):
                                 pdf_name = final_url.split('/')[-1]
 
+                            resolver.record(resource_url, True, pdf_name, final_url, content_type, resolution['pattern'])
+
                             # Add to the list of PDFs
-                            pdfs.append({
-                                'name': pdf_name,
-                                'url': resource_url,  # Use the original URL for downloading
-                                'resource_name': resource_name,
-                                'resource_url': resource_url,
-                                'type': 'resource_pdf'
-                            })
+                            yield 'file', records.CourseFile(
+                                name=pdf_name,
+                                url=resource_url,  # Use the original URL for downloading
+                                resource_name=resource_name,
+                                resource_url=resource_url,
+                                type=records.RESOURCE_PDF
+                            )
 
                             # Log the resource PDF link
                             logger.info(f"Found resource that directly downloads a PDF: {resource_url}")
                             continue
+
+                        # Remember that this resource has to be resolved from its page
+                        resolver.record(resource_url, False, final_url=final_url, content_type=content_type, pattern=resolution['pattern'])
                     except Exception as e:
                         logger.error(f"Error checking if resource is a PDF: {str(e)}")
                         # Continue with normal processing
@@ -407,13 +452,13 @@ def get_course_pdfs(course_id, username, password, url='https://elearning.univ-b
                         pdf_name = pdf_url.split('/')[-1]
 
                     # Add to the list of PDFs
-                    pdfs.append({
-                        'name': pdf_name,
-                        'url': pdf_url,
-                        'resource_name': resource_name,
-                        'resource_url': resource_url,
-                        'type': 'direct_link'
-                    })
+                    yield 'file', records.CourseFile(
+                        name=pdf_name,
+                        url=pdf_url,
+                        resource_name=resource_name,
+                        resource_url=resource_url,
+                        type=records.DIRECT_LINK
+                    )
 
                     # Log the direct PDF link
                     logger.info(f"Found direct PDF link: {pdf_url}")
@@ -422,22 +467,34 @@ def get_course_pdfs(course_id, username, password, url='https://elearning.univ-b
             try:
                 # Fetch the resource page
                 logger.info(f"Fetching resource: {resource_url}")
-                resource_response = session.get(resource_url)
+                resource_response = fetch.get(session, resource_url, 'resource')
 
                 if resource_response.status_code != 200:
                     logger.warning(f"Failed to access resource {resource_name}. Status code: {resource_response.status_code}")
+                    yield 'error', (resource_name, resource_url, f"Status code: {resource_response.status_code}")
                     continue
 
-                # Parse the resource page
-                resource_soup = BeautifulSoup(resource_response.text, 'html.parser')
+                # Parse the resource page into its folder links or its file link
+                folder_links, archive_url, pdf_url = parse_pool.run(
+                    extractors.resource_page_files, resource_response.text, resource_url, folder_archives
+                )
+
+                # Prefer Moodle's own folder archive: one download instead of one per file
+                if archive_url:
+                    yield 'file', records.CourseFile(
+                        name=f"{resource_name}.zip",
+                        url=archive_url,
+                        resource_name=resource_name,
+                        resource_url=resource_url,
+                        type=records.FOLDER_ARCHIVE,
+                        files=[text for href, text in folder_links if href]
+                    )
 
-                # Check if this is a folder
-                if '/mod/folder/view.php' in resource_url:
-                    # This is a folder, look for PDF links in the folder
-                    folder_pdf_links = resource_soup.select('a[href*=".pdf"], a[href*="pluginfile.php"]')
+                    logger.info(f"Found folder archive: {archive_url}")
+                    continue
 
-                    for pdf_link in folder_pdf_links:
-                        pdf_url = pdf_link.get('href')
+                if folder_links:
+                    for pdf_url, pdf_name in folder_links:
                         if not pdf_url:
                             continue
 
@@ -446,8 +503,7 @@ def get_course_pdfs(course_id, username, password, url='https://elearning.univ-b
                             pdf_url = urljoin(url, pdf_url)
 
                         # Get the PDF name
-                        pdf_name = pdf_link.text.strip()
-                        if not pdf_name or pdf_name == '':
+                        if not pdf_name:
                             # If no text, try to get the filename from the URL
                             if pdf_url.lower().endswith('.pdf'):
                                 pdf_name = pdf_url.split('/')[-1]
@@ -455,81 +511,21 @@ def get_course_pdfs(course_id, username, password, url='https://elearning.univ-b
                                 pdf_name = f"File in {resource_name}"
 
                         # Add to the list of PDFs
-                        pdfs.append({
-                            'name': pdf_name,
-                            'url': pdf_url,
-                            'resource_name': resource_name,
-                            'resource_url': resource_url,
-                            'type': 'folder'
-                        })
+                        yield 'file', records.CourseFile(
+                            name=pdf_name,
+                            url=pdf_url,
+                            resource_name=resource_name,
+                            resource_url=resource_url,
+                            type=records.FOLDER
+                        )
 
                         # Log the folder PDF link
                         logger.info(f"Found PDF in folder: {pdf_url}")
 
                     # If we found PDFs in the folder, continue to the next resource
-                    if folder_pdf_links:
-                        continue
-
-                # Look for PDF links - try different patterns
-                pdf_links = (
-                    resource_soup.select('a[href*=".pdf"]') or
-                    resource_soup.select('a[href*="pluginfile.php"]') or
-                    resource_soup.select('iframe[src*=".pdf"]') or
-                    resource_soup.select('object[data*=".pdf"]') or
-                    resource_soup.select('embed[src*=".pdf"]') or
-                    # Also look for resource links that might lead to PDFs
-                    resource_soup.select('a[href*="/mod/resource/view.php"]')
-                )
-
-                # If we didn't find any PDF links but the page has a div with resourcecontent class
-                # (common for embedded resources), this might be a PDF displayed inline
-                if not pdf_links and resource_soup.select_one('div.resourcecontent'):
-                    # This might be an embedded PDF, check for object or iframe tags
-                    embedded_pdfs = (
-                        resource_soup.select('object[type="application/pdf"]') or
-                        resource_soup.select('iframe[src*="pluginfile.php"]') or
-                        resource_soup.select('embed[type="application/pdf"]')
-                    )
-
-                    if embedded_pdfs:
-                        pdf_links = embedded_pdfs
-                    else:
-                        # If still no PDF links found, check if there's a download button
-                        download_links = resource_soup.select('a.resourcelinkdetails')
-                        if download_links:
-                            pdf_links = download_links
-
-                # Also check for redirects to PDF files
-                meta_refresh = resource_soup.select_one('meta[http-equiv="refresh"]')
-                if meta_refresh and 'content' in meta_refresh.attrs:
-                    refresh_content = meta_refresh['content']
-                    url_match = re.search(r'URL=([^"]+)', refresh_content)
-                    if url_match:
-                        redirect_url = url_match.group(1)
-                        if redirect_url.lower().endswith('.pdf') or 'pluginfile.php' in redirect_url:
-                            # This is a redirect to a PDF
-                            pdf_links = [{'href': redirect_url}]
-
-                # If we still don't have PDF links, check for a direct download link
-                if not pdf_links:
-                    # Look for any button or link that might be a download button
-                    download_buttons = resource_soup.select('a.btn, button.btn, a[role="button"]')
-                    for button in download_buttons:
-                        button_text = button.text.lower()
-                        if 'download' in button_text or 'télécharger' in button_text:
-                            href = button.get('href')
-                            if href:
-                                pdf_links = [{'href': href}]
-                                break
-
-                if pdf_links:
-                    # Get the first PDF link
-                    pdf_element = pdf_links[0]
-                    pdf_url = pdf_element.get('href') or pdf_element.get('src') or pdf_element.get('data')
-
-                    if not pdf_url:
-                        continue
+                    continue
 
+                if pdf_url:
                     # Make sure URL is absolute
                     if not pdf_url.startswith('http'):
                         pdf_url = urljoin(url, pdf_url)
@@ -542,239 +538,105 @@ def get_course_pdfs(course_id, username, password, url='https://elearning.univ-b
                         pdf_name = pdf_url.split('/')[-1]
 
                     # Add to the list of PDFs
-                    pdfs.append({
-                        'name': pdf_name,
-                        'url': pdf_url,
-                        'resource_name': resource_name,
-                        'resource_url': resource_url,
-                        'type': 'resource'
-                    })
+                    yield 'file', records.CourseFile(
+                        name=pdf_name,
+                        url=pdf_url,
+                        resource_name=resource_name,
+                        resource_url=resource_url,
+                        type=records.RESOURCE
+                    )
 
                     # Log the resource PDF link
                     logger.info(f"Found PDF in resource: {pdf_url}")
             except Exception as e:
                 logger.error(f"Error processing resource {resource_name}: {str(e)}")
+                yield 'error', (resource_name, resource_url, str(e))
                 continue
 
-        return {
-            'success': True,
-            'message': f"Found {len(pdfs)} PDF files in course {course_id}",
-            'course_name': course_name,
-            'pdfs': pdfs
-        }
+        yield 'progress', len(resource_links)
+
+        probe_stats = resolver.stats()
+        logger.info(f"Resource probes issued: {probe_stats['probes_issued']}, skipped: {probe_stats['probes_skipped']}")
+
+        yield 'done', probe_stats
     except Exception as e:
         logger.error(f"Unexpected error retrieving PDFs: {str(e)}")
-        return {
-            'success': False,
-            'message': f"Unexpected error: {str(e)}",
-            'pdfs': []
-        }
+        yield 'failed', f"Unexpected error: {str(e)}"
 
 
-def upload_file_to_course(username, password, course_id, file_path, file_name=None, url='https://elearning.univ-bba.dz'):
+def get_course_pdfs(course_id, username=None, password=None, url='https://elearning.univ-bba.dz', session=None, folder_archives=True):
     """
-    Upload a file to a Moodle course
+    Retrieve PDF files from a Moodle course
 
-    Args:
-        username (str): The username for Moodle
-        password (str): The password for Moodle
-        course_id (str): The course ID to upload to
-        file_path (str): Path to the file to upload
-        file_name (str, optional): Name to use for the file (defaults to original filename)
-        url (str): The Moodle URL
+    Collects iter_course_pdfs(); see there for the arguments.
 
     Returns:
-        dict: Upload result containing success status and message
+        dict: Result containing success status, message, and the list of files as CourseFile records
     """
-    try:
-        if not file_name:
-            file_name = os.path.basename(file_path)
-
-        # Login to Moodle
-        login_result = moodle_login(username, password, url)
-
-        if not login_result.get('success'):
-            return {
-                'success': False,
-                'message': login_result.get('message', 'Login failed')
-            }
-
-        # Create a session with the provided cookies
-        session = requests.Session()
-        for key, value in login_result.get('cookies', {}).items():
-            session.cookies.set(key, value)
-
-        # Get the course page to find the section to upload to
-        course_url = f"{url}/course/view.php?id={course_id}"
-        course_response = session.get(course_url)
-
-        if course_response.status_code != 200:
-            return {
-                'success': False,
-                'message': f"Failed to access course page. Status code: {course_response.status_code}"
-            }
-
-        # Check if we're actually logged in
-        if 'loginerrors' in course_response.text or 'login/index.php' in course_response.url:
-            return {
-                'success': False,
-                'message': "Not logged in or session expired"
-            }
-
-        # Find the upload form or link
+    course_name = None
+    pdfs = []
 
-        soup = BeautifulSoup(course_response.text, 'html.parser')
-
-        # Look for the "Add an activity or resource" button
-        add_resource_links = soup.select('a.section-modchooser-link')
-
-        if not add_resource_links:
+    for event, value in iter_course_pdfs(course_id, username, password, url, session, folder_archives):
+        if event == 'failed':
             return {
                 'success': False,
-                'message': "Could not find 'Add an activity or resource' button. You might not have permission to add resources."
-            }
-
-        # Get the first section's add resource link
-        add_resource_url = add_resource_links[0].get('href')
-        if not add_resource_url.startswith('http'):
-            add_resource_url = f"{url}{add_resource_url}"
-
-        # Get the resource selection page
-        resource_selection_response = session.get(add_resource_url)
-
-        # Find the link to add a file resource
-        soup = BeautifulSoup(resource_selection_response.text, 'html.parser')
-        file_resource_link = soup.select_one('a[href*="resource"]')
-
-        if not file_resource_link:
-            return {
-                'success': False,
-                'message': "Could not find file resource option"
+                'message': value,
+                'pdfs': []
             }
-
-        file_resource_url = file_resource_link.get('href')
-        if not file_resource_url.startswith('http'):
-            file_resource_url = f"{url}{file_resource_url}"
-
-        # Get the file upload form
-        file_form_response = session.get(file_resource_url)
-
-        # Extract the form token
-        soup = BeautifulSoup(file_form_response.text, 'html.parser')
-        form_token = soup.select_one('input[name="sesskey"]')
-
-        if not form_token:
+        if event == 'course':
+            course_name = value
+        elif event == 'file':
+            pdfs.append(value)
+        elif event == 'done' and value is None:
             return {
-                'success': False,
-                'message': "Could not find form token"
+                'success': True,
+                'message': f"No resources found in course {course_id}",
+                'course_name': course_name,
+                'pdfs': []
             }
-
-        sesskey = form_token.get('value')
-
-        # Find the file upload area
-        file_manager_element = soup.select_one('div[data-fieldtype="filemanager"]')
-
-        if not file_manager_element:
+        elif event == 'done':
             return {
-                'success': False,
-                'message': "Could not find file upload area"
-            }
-
-        item_id = file_manager_element.get('id')
-
-        # Prepare the file upload request
-        upload_url = f"{url}/repository/repository_ajax.php?action=upload"
-
-        # Prepare the file upload form data
-        with open(file_path, 'rb') as f:
-            files = {
-                'repo_upload_file': (file_name, f, 'application/pdf')
+                'success': True,
+                'message': f"Found {len(pdfs)} PDF files in course {course_id}",
+                'course_name': course_name,
+                'pdfs': pdfs,
+                'probes': value
             }
 
-            form_data = {
-                'sesskey': sesskey,
-                'repo_id': '4',  # This might need to be adjusted based on the Moodle instance
-                'itemid': item_id,
-                'author': 'API Upload',
-                'title': file_name,
-                'filearea': 'content',
-                'filepath': '/',
-                'filename': file_name,
-                'ctx_id': course_id
-            }
 
-            # Upload the file
-            upload_response = session.post(upload_url, data=form_data, files=files)
+def upload_file_to_course(username, password, course_id, file_path, file_name=None, url='https://elearning.univ-bba.dz', session=None):
+    """
+    Upload a file to a Moodle course
 
-            if upload_response.status_code != 200:
-                return {
-                    'success': False,
-                    'message': f"File upload failed. Status code: {upload_response.status_code}"
-                }
+    Single-file shortcut for uploads.upload_files_to_course: the file is
+    streamed from disk and added to the course as a file resource.
 
-            # Parse the response
-            try:
-                upload_result = upload_response.json()
-
-                if 'error' in upload_result:
-                    return {
-                        'success': False,
-                        'message': f"File upload error: {upload_result['error']}"
-                    }
-
-                # Submit the form to save the resource
-                form_action = soup.select_one('form').get('action')
-
-                form_data = {
-                    'name': file_name,
-                    'introeditor[text]': f"Uploaded file: {file_name}",
-                    'introeditor[format]': '1',
-                    'introeditor[itemid]': item_id,
-                    'showdescription': '0',
-                    'display': '0',
-                    'showsize': '0',
-                    'showtype': '0',
-                    'showdate': '0',
-                    'filterfiles': '0',
-                    'printintro': '0',
-                    'showresourceoptions': '1',
-                    'sesskey': sesskey,
-                    'course': course_id,
-                    'section': '0',
-                    'module': '17',  # This might need to be adjusted
-                    'modulename': 'resource',
-                    'instance': '0',
-                    'add': 'resource',
-                    'update': '0',
-                    'return': '0',
-                    'sr': '0',
-                    'submitbutton': 'Save and return to course'
-                }
+    Args:
+        username (str): The username for Moodle
+        password (str): The password for Moodle
+        course_id (str): The course ID to upload to
+        file_path (str): Path to the file to upload
+        file_name (str, optional): Name to use for the file (defaults to original filename)
+        url (str): The Moodle URL
+        session (requests.Session, optional): An authenticated session to reuse instead of logging in
 
-                save_response = session.post(form_action, data=form_data)
+    Returns:
+        dict: Upload result containing success status and message
+    """
+    from .uploads import upload_files_to_course
 
-                if save_response.status_code != 200:
-                    return {
-                        'success': False,
-                        'message': f"Failed to save resource. Status code: {save_response.status_code}"
-                    }
+    if not file_name:
+        file_name = os.path.basename(file_path)
 
-                return {
-                    'success': True,
-                    'message': f"File '{file_name}' uploaded successfully to course {course_id}"
-                }
+    result = upload_files_to_course(
+        course_id, [file_path],
+        username=username, password=password, url=url, session=session,
+        module='resource', name=file_name, file_names=[file_name]
+    )
 
-            except json.JSONDecodeError:
-                return {
-                    'success': False,
-                    'message': "Failed to parse upload response"
-                }
-    except Exception as e:
-        logger.error(f"Unexpected error during file upload: {str(e)}")
-        return {
-            'success': False,
-            'message': f"Unexpected error: {str(e)}"
-        }
+    if result['success']:
+        result['message'] = f"File '{file_name}' uploaded successfully to course {course_id}"
+    return result
 
 
 def get_direct_file_url(resource_url, session):
@@ -806,12 +668,25 @@ def get_direct_file_url(resource_url, session):
                 'url': direct_url
             }
 
-        # Get the resource page
-        response = session.get(resource_url, timeout=30, allow_redirects=True)
+        # Get the resource page, only peeking at the first bytes until we know it is HTML
+        response = fetch.get(session, resource_url, 'resource', allow_redirects=True, stream=True)
         response.raise_for_status()
+        sniffed = SniffedResponse(response)
+
+        # If the URL serves the file itself, hand back the open response so it is not downloaded twice
+        if not sniffed.is_html:
+            logger.info(f"URL serves a {sniffed.content_type} file directly: {sniffed.url}")
+            return {
+                'success': True,
+                'message': 'URL serves the file directly',
+                'url': sniffed.url,
+                'response': sniffed
+            }
+
+        html = sniffed.read_text()
 
         # Log the HTML content for debugging
-        logger.info(f"Resource page HTML (first 500 chars): {response.text[:500]}")
+        logger.info(f"Resource page HTML (first 500 chars): {html[:500]}")
 
         # Check if we're redirected to a file
         if 'pluginfile.php' in response.url or 'webservice' in response.url:
@@ -823,126 +698,20 @@ def get_direct_file_url(resource_url, session):
             }
 
         # Parse the HTML to find the file URL
-        soup = BeautifulSoup(response.text, 'html.parser')
+        direct_url, found_in, link_count = parse_pool.run(extractors.direct_file_link, html)
+        logger.info(f"Found {link_count} links in the page")
 
-        # Look for common file link patterns
-        file_links = soup.select('a[href*=".pdf"], a[href*="pluginfile.php"], a[href*="webservice"], a[href*=".docx"], a[href*=".xlsx"], a[href*=".pptx"], a[href*="mod/resource/view.php"]')
-
-        # Log all found links for debugging
-        all_links = soup.select('a[href]')
-        logger.info(f"Found {len(all_links)} links in the page")
-        for link in all_links[:10]:  # Log first 10 links
-            href = link.get('href')
-            text = link.text.strip()
-            logger.info(f"Link: {text} - {href}")
-
-        if file_links:
-            direct_url = file_links[0].get('href')
+        if direct_url:
             if not direct_url.startswith('http'):
                 direct_url = urljoin(resource_url, direct_url)
 
-            logger.info(f"Found direct file URL in HTML: {direct_url}")
+            logger.info(f"{found_in}: {direct_url}")
             return {
                 'success': True,
-                'message': 'Found direct file URL in HTML',
+                'message': found_in,
                 'url': direct_url
             }
 
-        # Look for iframe sources
-        iframes = soup.select('iframe[src*="pluginfile.php"], iframe[src*="webservice"]')
-        if iframes:
-            direct_url = iframes[0].get('src')
-            if not direct_url.startswith('http'):
-                direct_url = urljoin(resource_url, direct_url)
-
-            logger.info(f"Found direct file URL in iframe: {direct_url}")
-            return {
-                'success': True,
-                'message': 'Found direct file URL in iframe',
-                'url': direct_url
-            }
-
-        # Look for resource object data
-        objects = soup.select('object[data*="pluginfile.php"], object[data*="webservice"]')
-        if objects:
-            direct_url = objects[0].get('data')
-            if not direct_url.startswith('http'):
-                direct_url = urljoin(resource_url, direct_url)
-
-            logger.info(f"Found direct file URL in object: {direct_url}")
-            return {
-                'success': True,
-                'message': 'Found direct file URL in object',
-                'url': direct_url
-            }
-
-        # Look for download buttons
-        download_buttons = soup.select('a.resourcelinkdetails, a.btn-primary, a.btn-secondary, a.btn-default, a.btn')
-        for button in download_buttons:
-            if 'download' in button.text.lower() or 'télécharger' in button.text.lower():
-                direct_url = button.get('href')
-                if not direct_url.startswith('http'):
-                    direct_url = urljoin(resource_url, direct_url)
-
-                logger.info(f"Found direct file URL in download button: {direct_url}")
-                return {
-                    'success': True,
-                    'message': 'Found direct file URL in download button',
-                    'url': direct_url
-                }
-
-        # Look for resource content frame
-        resource_frame = soup.select_one('div.resourceworkaround')
-        if resource_frame:
-            logger.info("Found resource content frame")
-            # Try to find the resource object or iframe inside
-            resource_object = resource_frame.select_one('object, iframe, embed')
-            if resource_object:
-                data_attr = resource_object.get('data') or resource_object.get('src')
-                if data_attr:
-                    if not data_attr.startswith('http'):
-                        data_attr = urljoin(resource_url, data_attr)
-
-                    logger.info(f"Found direct file URL in resource frame: {data_attr}")
-                    return {
-                        'success': True,
-                        'message': 'Found direct file URL in resource frame',
-                        'url': data_attr
-                    }
-
-        # Look for resource content div
-        resource_content = soup.select_one('div.resourcecontent')
-        if resource_content:
-            logger.info("Found resource content div")
-            # Try to find any links inside
-            content_links = resource_content.select('a[href]')
-            if content_links:
-                direct_url = content_links[0].get('href')
-                if not direct_url.startswith('http'):
-                    direct_url = urljoin(resource_url, direct_url)
-
-                logger.info(f"Found direct file URL in resource content: {direct_url}")
-                return {
-                    'success': True,
-                    'message': 'Found direct file URL in resource content',
-                    'url': direct_url
-                }
-
-            # Try to find any objects or iframes inside
-            content_objects = resource_content.select('object, iframe, embed')
-            if content_objects:
-                data_attr = content_objects[0].get('data') or content_objects[0].get('src')
-                if data_attr:
-                    if not data_attr.startswith('http'):
-                        data_attr = urljoin(resource_url, data_attr)
-
-                    logger.info(f"Found direct file URL in resource content object: {data_attr}")
-                    return {
-                        'success': True,
-                        'message': 'Found direct file URL in resource content object',
-                        'url': data_attr
-                    }
-
         # If we can't find a direct URL, return the original URL
         logger.warning(f"Could not find direct file URL in: {resource_url}")
         return {
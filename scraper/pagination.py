@@ -0,0 +1,117 @@
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+
+from . import fetch
+from .parsing import parse_html
+
+logger = logging.getLogger(__name__)
+
+PAGE_PATTERN = re.compile(r'[?&]page=(\d+)')
+
+# Paging bars of Moodle listings (course/index.php and friends)
+PAGING_LINKS = '.paging a[href*="page="], .pagination a[href*="page="], nav[aria-label] .page-link[href*="page="]'
+SHOW_ALL_LINKS = '.paging-showall a[href], .paging a[href*="perpage=all"], .pagination a[href*="perpage=all"]'
+
+
+def with_query(url, **params):
+    """
+    Return the URL with some query parameters set or replaced
+    """
+    parsed = urlparse(url)
+    query = dict(parse_qsl(parsed.query, keep_blank_values=True))
+    query.update({key: str(value) for key, value in params.items()})
+    return urlunparse(parsed._replace(query=urlencode(query)))
+
+
+def listing_url(url):
+    """
+    Ask a Moodle listing for the largest page size it allows
+    """
+    return with_query(url, perpage='all')
+
+
+def find_pagination(soup, page_url):
+    """
+    Read the paging bar of a listing page
+
+    Args:
+        soup (BeautifulSoup): The parsed page
+        page_url (str): The URL of the page, to resolve relative links
+
+    Returns:
+        dict: `pages` maps each page number linked from the bar to its URL (empty
+            when the listing fits on one page); `show_all` is the "Show all" URL, if any
+    """
+    pages = {}
+    for link in soup.select(PAGING_LINKS):
+        href = link.get('href', '')
+        page_match = PAGE_PATTERN.search(href)
+        if page_match:
+            pages.setdefault(int(page_match.group(1)), urljoin(page_url, href))
+
+    show_all = soup.select_one(SHOW_ALL_LINKS)
+
+    return {
+        'pages': pages,
+        'show_all': urljoin(page_url, show_all.get('href')) if show_all is not None and pages else None
+    }
+
+
+def _fetch_soup(session, page_url, timeout):
+    response = fetch.get(session, page_url, 'page', timeout=timeout)
+    response.raise_for_status()
+    return parse_html(response.text)
+
+
+def collect_pages(session, page_url, first_soup, max_workers=4, timeout=30):
+    """
+    Complete a paginated listing from its first page
+
+    When the first page has no paging bar the listing is already complete. If
+    Moodle offers "Show all", that single page replaces the paginated one.
+    Otherwise the remaining pages are fetched concurrently, in page order.
+
+    Args:
+        session (requests.Session): The session to fetch with
+        page_url (str): The URL the first page was fetched from
+        first_soup (BeautifulSoup): The parsed first page
+        max_workers (int): Maximum number of pages fetched at the same time
+        timeout (int): Timeout in seconds for each request
+
+    Returns:
+        list: The parsed pages of the listing (BeautifulSoup objects); pages
+            that fail to load are logged and left out
+    """
+    pagination = find_pagination(first_soup, page_url)
+    if not pagination['pages']:
+        return [first_soup]
+
+    if pagination['show_all'] and pagination['show_all'] != page_url:
+        try:
+            logger.info(f"Listing is paginated, fetching all entries from: {pagination['show_all']}")
+            full_soup = _fetch_soup(session, pagination['show_all'], timeout)
+            if not find_pagination(full_soup, pagination['show_all'])['pages']:
+                return [full_soup]
+        except Exception as e:
+            logger.warning(f"Could not fetch the full listing: {str(e)}")
+
+    # Moodle only links a window of pages, so build every page URL from one link
+    current_page = PAGE_PATTERN.search(page_url)
+    current_page = int(current_page.group(1)) if current_page else 0
+    template = next(iter(pagination['pages'].values()))
+    remaining = [page for page in range(max(pagination['pages']) + 1) if page != current_page]
+
+    def fetch_page(page):
+        try:
+            return _fetch_soup(session, with_query(template, page=page), timeout)
+        except Exception as e:
+            logger.warning(f"Could not fetch page {page} of {page_url}: {str(e)}")
+            return None
+
+    logger.info(f"Fetching {len(remaining)} more pages of {page_url}")
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(remaining)))) as executor:
+        soups = [soup for soup in executor.map(fetch_page, remaining) if soup is not None]
+
+    return [first_soup] + soups
@@ -0,0 +1,78 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Pages smaller than this are parsed in the calling thread: the round trip to a
+# worker process costs more than parsing them
+DEFAULT_MIN_OFFLOAD_SIZE = 32 * 1024
+
+_workers = 0
+_min_size = DEFAULT_MIN_OFFLOAD_SIZE
+_pool = None
+_lock = threading.Lock()
+
+
+def configure(workers, min_size=DEFAULT_MIN_OFFLOAD_SIZE):
+    """
+    Set the number of parser processes; 0 parses every page in the calling thread
+
+    Args:
+        workers (int): Number of worker processes
+        min_size (int): Smallest page, in characters, sent to the workers
+    """
+    global _workers, _min_size, _pool
+
+    with _lock:
+        old_pool = _pool
+        _workers = max(0, int(workers or 0))
+        _min_size = min_size
+        _pool = None
+
+    if old_pool is not None:
+        old_pool.shutdown(wait=False)
+
+
+def _get_pool():
+    global _pool
+
+    with _lock:
+        if _pool is None and _workers > 0:
+            # Imported here so the app does not pay for multiprocessing unless the pool is used
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Spawned workers do not inherit the server's threads and sockets, unlike forked ones
+            _pool = ProcessPoolExecutor(max_workers=_workers, mp_context=multiprocessing.get_context('spawn'))
+            logger.info(f"Started {_workers} HTML parser processes")
+        return _pool
+
+
+def run(extractor, html, *args):
+    """
+    Run a scraper.extractors function on a page, in a worker process when the pool is enabled
+
+    Parsing with BeautifulSoup holds the GIL, so concurrent crawls in threads
+    parse one page at a time. Worker processes parse in parallel and send back
+    only the extractor's compact records.
+
+    Args:
+        extractor (callable): A module-level function of scraper.extractors
+        html (str): The page
+        *args: Further arguments for the extractor
+
+    Returns:
+        The extractor's result
+    """
+    pool = _get_pool() if len(html) >= _min_size else None
+    if pool is None:
+        return extractor(html, *args)
+
+    from concurrent.futures.process import BrokenProcessPool
+
+    try:
+        return pool.submit(extractor, html, *args).result()
+    except BrokenProcessPool:
+        logger.error("HTML parser processes died, restarting the pool")
+        configure(_workers, _min_size)
+        return extractor(html, *args)
@@ -0,0 +1,31 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# bs4 (and soupsieve behind it) is the slowest import of the app, so it is
+# loaded by the first page that gets parsed rather than when Django starts
+_beautiful_soup = None
+
+
+def beautiful_soup():
+    """
+    Return the BeautifulSoup class, importing bs4 on first use
+    """
+    global _beautiful_soup
+    if _beautiful_soup is None:
+        from bs4 import BeautifulSoup
+        _beautiful_soup = BeautifulSoup
+    return _beautiful_soup
+
+
+def parse_html(markup):
+    """
+    Parse an HTML page with the standard library parser
+
+    Args:
+        markup (str): The HTML to parse
+
+    Returns:
+        BeautifulSoup: The parsed document
+    """
+    return beautiful_soup()(markup, 'html.parser')
@@ -0,0 +1,132 @@
+import sys
+from collections.abc import Mapping
+
+# Crawl records: immutable, slotted replacements for the per-link dicts built
+# by the scrapers. A record reads like the dict it replaces (`pdf['url']`,
+# `pdf.get('name')`, `dict(pdf)`), so callers and the JSON encoder use it
+# unchanged, but it holds no per-instance dict and cannot be mutated halfway
+# through a crawl: use replace() to derive a changed copy.
+
+# File type tags of get_course_pdfs, interned so every record of a crawl, and
+# the rows read back from the catalogue, share the same string objects
+RESOURCE = sys.intern('resource')
+RESOURCE_PDF = sys.intern('resource_pdf')
+DIRECT_LINK = sys.intern('direct_link')
+FOLDER = sys.intern('folder')
+FOLDER_ARCHIVE = sys.intern('folder_archive')
+
+FILE_TYPES = {tag: tag for tag in (RESOURCE, RESOURCE_PDF, DIRECT_LINK, FOLDER, FOLDER_ARCHIVE)}
+
+
+def type_tag(value):
+    """
+    Return the interned tag for a file type read from elsewhere (database, cache)
+    """
+    return FILE_TYPES.get(value) or sys.intern(value)
+
+
+class Record(Mapping):
+    """
+    Base class of the crawl records
+
+    Subclasses list their keys in `__slots__`; keys in `_optional` are left
+    out of the mapping while they are None, as the dicts only had them when set.
+    """
+    __slots__ = ()
+    _optional = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f"{type(self).__name__} has no field {', '.join(fields)}")
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} records are immutable, use replace()")
+
+    __delattr__ = __setattr__
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            value = getattr(self, key)
+            if value is not None or key not in self._optional:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self.__slots__:
+            value = getattr(self, key)
+            if value is not None or key not in self._optional:
+                return value
+        return default
+
+    def __contains__(self, key):
+        return key in self.__slots__ and (key not in self._optional or getattr(self, key) is not None)
+
+    def __iter__(self):
+        for name in self.__slots__:
+            if name not in self._optional or getattr(self, name) is not None:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={self[name]!r}' for name in self)})"
+
+    def __reduce__(self):
+        return _rebuild, (type(self), self.as_dict())
+
+    def as_dict(self):
+        """
+        Return the record as a plain dict, for encoders that only take dicts
+        """
+        return {name: self[name] for name in self}
+
+    def replace(self, **changes):
+        """
+        Return a copy of the record with some fields changed
+        """
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return type(self)(**fields)
+
+
+def _rebuild(cls, fields):
+    return cls(**fields)
+
+
+class CourseFile(Record):
+    """
+    A file listed by get_course_pdfs; `files` names the members of a folder archive
+    """
+    __slots__ = ('name', 'url', 'resource_name', 'resource_url', 'type', 'files')
+    _optional = ('files',)
+
+
+class ResourceLink(Record):
+    """
+    A resource of a course page and the file it leads to, as the resource endpoints return it
+    """
+    __slots__ = ('resource_name', 'resource_url', 'pdf_url', 'pdf_name', 'error')
+    _optional = ('pdf_name', 'error')
+
+    @classmethod
+    def from_course_file(cls, pdf):
+        """
+        Build the resource entry of a get_course_pdfs file, sharing its strings
+        """
+        return cls(
+            resource_name=pdf.get('resource_name', ''),
+            resource_url=pdf.get('resource_url', ''),
+            pdf_url=pdf.get('url', ''),
+            pdf_name=pdf.get('name', '')
+        )
+
+
+class Link(Record):
+    """
+    An `aalink` anchor of a page, with the course ID found in its URL
+    """
+    __slots__ = ('text', 'href', 'course_id', 'error')
+    _optional = ('course_id', 'error')
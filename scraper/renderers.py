@@ -0,0 +1,104 @@
+import json
+from collections.abc import Mapping
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .records import Record
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+EVENT_STREAM_MEDIA_TYPE = 'text/event-stream'
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def ndjson_line(payload):
+    """
+    Encode one NDJSON line; crawl records, dates and lazy strings are encoded as the JSON renderer does
+    """
+    return json.dumps(payload, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON: a list is rendered one item per line, anything else as a single line
+
+    Streaming listings bypass the renderer and write their lines as they are
+    resolved; the renderer lets `?format=ndjson` and `Accept: application/x-ndjson`
+    pass content negotiation and renders the plain responses (errors) of those views.
+    """
+    media_type = NDJSON_MEDIA_TYPE
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return ''.join(ndjson_line(item) for item in items).encode(self.charset)
+
+
+def _encode_default(obj):
+    # Crawl records are Mappings, not dicts; anything else is encoded as DRF's encoder does
+    if isinstance(obj, Record):
+        return obj.as_dict()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    return JSONEncoder().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer encoding with orjson when it is installed
+
+    Listings are passed to Response as the records and dicts the scrapers
+    build, without serializers; this renderer encodes them in one pass into
+    the same compact JSON as DRF's renderer. Responses asking for an `indent`
+    in the Accept header, and installs without orjson, use DRF's renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Dates are left to DRF's encoder, which writes UTC as `Z`
+        body = orjson.dumps(data, default=_encode_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        # Escaped by DRF's renderer too, as they end lines in JavaScript
+        return body.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def sse_message(event, data, event_id=None):
+    """
+    Encode one Server-Sent Events message
+    """
+    prefix = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{prefix}event: {event}\ndata: {ndjson_line(data)}\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Server-Sent Events; plain responses (errors) are rendered as a single `error` event
+
+    EventSource asks for `text/event-stream` only, which DRF would otherwise refuse with a 406.
+    """
+    media_type = EVENT_STREAM_MEDIA_TYPE
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return sse_message('error', data).encode(self.charset)
+
+
+# Renderers of the views that can stream NDJSON
+STREAMING_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [NDJSONRenderer]
+
+# Renderers of the Server-Sent Events views, JSON first for clients that are not EventSource
+EVENT_STREAM_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [EventStreamRenderer]
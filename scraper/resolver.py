@@ -0,0 +1,251 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Moodle file icon names (pix/f/<name>-24.png) mapped to a file extension
+ICON_EXTENSIONS = {
+    'pdf': '.pdf',
+    'document': '.docx',
+    'spreadsheet': '.xlsx',
+    'powerpoint': '.pptx',
+    'archive': '.zip',
+    'text': '.txt',
+    'image': '.png',
+    'audio': '.mp3',
+    'video': '.mp4',
+    'mpeg': '.mp4',
+    'sourcecode': '.txt',
+    'oth': '.odt',
+    'writer': '.odt',
+    'calc': '.ods',
+    'impress': '.odp',
+}
+
+# Type words shown in `resourcelinkdetails` when the course displays file types
+DETAILS_EXTENSIONS = (
+    ('pdf', '.pdf'),
+    ('word', '.docx'),
+    ('excel', '.xlsx'),
+    ('powerpoint', '.pptx'),
+    ('zip', '.zip'),
+    ('archive', '.zip'),
+    ('text', '.txt'),
+)
+
+ICON_PATTERN = re.compile(r'/f/([a-z0-9_]+?)(?:-\d+)?(?:[?.]|$)')
+
+# Icon patterns are trusted once this many probes confirmed them
+MIN_PATTERN_SAMPLES = 5
+MIN_PATTERN_ACCURACY = 0.9
+
+# A trusted pattern is still verified with a real probe once every this many uses
+VERIFY_EVERY = 50
+
+
+def describe_link(link):
+    """
+    Read the file type hints Moodle puts around an activity link
+
+    Args:
+        link: BeautifulSoup tag of the activity link
+
+    Returns:
+        dict: `modtype`, `icon` and `details` hints, any of which may be None
+    """
+    activity = link.find_parent('li', class_='activity') or link.find_parent(class_='activity-item')
+    scope = activity or link.parent or link
+
+    modtype = None
+    if activity is not None:
+        for css_class in activity.get('class', []):
+            if css_class.startswith('modtype_'):
+                modtype = css_class[len('modtype_'):]
+                break
+
+    icon = None
+    icon_img = link.select_one('img.activityicon, img.iconlarge, img') or scope.select_one('img.activityicon, .activityiconcontainer img')
+    if icon_img is not None:
+        icon_match = ICON_PATTERN.search(icon_img.get('src', ''))
+        if icon_match:
+            icon = icon_match.group(1)
+
+    details = None
+    details_element = scope.select_one('.resourcelinkdetails')
+    if details_element is not None:
+        details = details_element.get_text(' ', strip=True).lower()
+
+    return {'modtype': modtype, 'icon': icon, 'details': details}
+
+
+class ResolutionHistory:
+    """
+    Thread-safe, bounded memory of how resource URLs resolved on earlier crawls
+
+    Besides per-URL outcomes it keeps, for every markup pattern (such as
+    `icon:pdf`), how often the inference from that pattern matched the probe.
+    Patterns that turn out to be unreliable stop being trusted.
+    """
+
+    def __init__(self, max_entries=20000, ttl=7 * 24 * 60 * 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._patterns = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            if time.time() - entry['resolved_at'] > self.ttl:
+                del self._entries[url]
+                return None
+            self._entries.move_to_end(url)
+            return entry
+
+    def record(self, url, is_file, name=None, final_url=None, content_type=None):
+        entry = {
+            'is_file': is_file,
+            'name': name,
+            'final_url': final_url,
+            'content_type': content_type,
+            'resolved_at': time.time()
+        }
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def record_pattern(self, pattern, is_file):
+        """
+        Record whether a probe confirmed the file inference of a markup pattern
+        """
+        with self._lock:
+            matches, total, uses = self._patterns.get(pattern, (0, 0, 0))
+            self._patterns[pattern] = (matches + bool(is_file), total + 1, uses)
+
+    def use_pattern(self, pattern, warmup):
+        """
+        Decide whether the inference of a markup pattern can replace a probe
+
+        Args:
+            pattern (str): The markup pattern, such as `icon:pdf`
+            warmup (bool): Require MIN_PATTERN_SAMPLES confirmed probes first
+
+        Returns:
+            bool: True if the probe can be skipped
+        """
+        with self._lock:
+            matches, total, uses = self._patterns.get(pattern, (0, 0, 0))
+            if warmup and total < MIN_PATTERN_SAMPLES:
+                return False
+            if total and matches / total < MIN_PATTERN_ACCURACY:
+                return False
+            uses += 1
+            self._patterns[pattern] = (matches, total, uses)
+            return uses % VERIFY_EVERY != 0
+
+
+# Shared by every crawl in the process
+resolution_history = ResolutionHistory()
+
+
+class ResourceResolver:
+    """
+    Decide, per resource link, whether a HEAD/GET probe is needed
+
+    The type and filename of a resource are first inferred from the course page
+    markup (activity icon, `resourcelinkdetails` text, `modtype_*` class) and
+    from the resolution history. Only ambiguous links are probed; the resolver
+    counts how many probes were issued and skipped.
+    """
+
+    def __init__(self, history=None):
+        self.history = history if history is not None else resolution_history
+        self.probes_issued = 0
+        self.skipped_from_markup = 0
+        self.skipped_from_history = 0
+
+    def infer(self, hints, resource_url, resource_name):
+        """
+        Infer what a resource link points to without touching the network
+
+        Args:
+            hints (dict): Markup hints of the resource link, see describe_link
+            resource_url (str): Absolute URL of the link
+            resource_name (str): Text of the link
+
+        Returns:
+            dict: `probe` is True when the link is ambiguous and has to be
+                probed; otherwise `is_file` and `name` hold the inferred result.
+                `pattern` is the markup pattern to pass back to record().
+        """
+        known = self.history.get(resource_url)
+        if known is not None:
+            self.skipped_from_history += 1
+            return {
+                'probe': False,
+                'is_file': known['is_file'],
+                'name': known['name'] or resource_name,
+                'pattern': None
+            }
+
+        extension = None
+        pattern = None
+
+        if hints['details']:
+            for word, details_extension in DETAILS_EXTENSIONS:
+                if word in hints['details']:
+                    extension, pattern = details_extension, f"details:{word}"
+                    break
+
+        if extension is None and hints['icon'] in ICON_EXTENSIONS and hints['modtype'] in (None, 'resource'):
+            extension, pattern = ICON_EXTENSIONS[hints['icon']], f"icon:{hints['icon']}"
+
+        # The type shown in resourcelinkdetails is trusted right away, icons have to prove themselves
+        if extension is None or not self.history.use_pattern(pattern, warmup=pattern.startswith('icon:')):
+            self.probes_issued += 1
+            return {'probe': True, 'pattern': pattern}
+
+        self.skipped_from_markup += 1
+        name = resource_name
+        if not name.lower().endswith(extension):
+            name = f"{name}{extension}"
+
+        return {
+            'probe': False,
+            'is_file': True,
+            'name': name,
+            'pattern': pattern
+        }
+
+    def record(self, resource_url, is_file, name=None, final_url=None, content_type=None, pattern=None):
+        """
+        Remember the outcome of a probe
+
+        Args:
+            resource_url (str): The probed resource URL
+            is_file (bool): Whether the URL downloads a file directly
+            name (str, optional): The filename the probe revealed
+            final_url (str, optional): The URL after redirects
+            content_type (str, optional): The content type of the probe response
+            pattern (str, optional): The markup pattern returned by infer()
+        """
+        self.history.record(resource_url, is_file, name, final_url, content_type)
+        if pattern:
+            self.history.record_pattern(pattern, is_file)
+
+    def stats(self):
+        return {
+            'probes_issued': self.probes_issued,
+            'probes_skipped': self.skipped_from_markup + self.skipped_from_history,
+            'skipped_from_markup': self.skipped_from_markup,
+            'skipped_from_history': self.skipped_from_history
+        }
@@ -0,0 +1,106 @@
+import logging
+import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Default lifetime of an API token, in seconds
+DEFAULT_TOKEN_TTL = 30 * 60
+
+# Default number of live tokens; the oldest ones are revoked beyond it
+DEFAULT_MAX_TOKENS = 1000
+
+
+class SessionStore:
+    """
+    Server-side pool of authenticated Moodle sessions keyed by opaque tokens.
+
+    The login endpoint stores the authenticated requests.Session here and hands
+    the client a random token instead of the raw Moodle cookies. Later requests
+    send the token back in a header and reuse the pooled session directly.
+    At most `max_entries` sessions are kept: issuing a token beyond that
+    revokes the oldest one.
+    """
+
+    def __init__(self, ttl=DEFAULT_TOKEN_TTL, max_entries=DEFAULT_MAX_TOKENS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def issue(self, session, username, url):
+        """
+        Store an authenticated session and return a new token for it
+
+        Args:
+            session (requests.Session): The authenticated session
+            username (str): The Moodle username the session belongs to
+            url (str): The Moodle URL the session is authenticated against
+
+        Returns:
+            dict: Token entry containing the token, username, url and expiry time
+        """
+        token = secrets.token_urlsafe(32)
+        entry = {
+            'token': token,
+            'session': session,
+            'username': username,
+            'url': url,
+            'expires_at': time.time() + self.ttl
+        }
+
+        with self._lock:
+            self._purge_expired_locked()
+            self._entries[token] = entry
+            # Tokens are kept in issue order, so the first ones are the oldest
+            while len(self._entries) > self.max_entries:
+                oldest = self._entries.pop(next(iter(self._entries)))
+                oldest['session'].close()
+                logger.info(f"Revoked the oldest API token, of {oldest['username']}: over {self.max_entries} live tokens")
+
+        logger.info(f"Issued API token for {username} (expires in {self.ttl}s)")
+        return entry
+
+    def get(self, token):
+        """
+        Look up a live token entry
+
+        Args:
+            token (str): The token sent by the client
+
+        Returns:
+            dict: The token entry, or None if the token is unknown or expired
+        """
+        if not token:
+            return None
+
+        with self._lock:
+            # Tokens that are never used again must not keep their session open
+            self._purge_expired_locked()
+            return self._entries.get(token)
+
+    def revoke(self, token):
+        """
+        Forget a token and close its session
+
+        Args:
+            token (str): The token to revoke
+
+        Returns:
+            bool: True if the token existed
+        """
+        with self._lock:
+            entry = self._entries.pop(token, None)
+
+        if entry is None:
+            return False
+
+        entry['session'].close()
+        return True
+
+    def _purge_expired_locked(self):
+        now = time.time()
+        expired = [token for token, entry in self._entries.items() if entry['expires_at'] <= now]
+        for token in expired:
+            self._entries.pop(token)['session'].close()
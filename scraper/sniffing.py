@@ -0,0 +1,102 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes peeked at the start of a body to detect its type
+SNIFF_SIZE = 4096
+
+# Magic numbers of the file types found on course pages
+MAGIC_NUMBERS = (
+    (b'PK\x03\x04', 'application/zip'),  # docx, xlsx, pptx, zip
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),  # doc, xls, ppt
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+)
+
+
+def sniff_content_type(head):
+    """
+    Detect the type of a body from its first bytes
+
+    Args:
+        head (bytes): The first bytes of the body
+
+    Returns:
+        str: The detected MIME type, or None if the bytes are not recognised
+    """
+    # PDF readers accept the header anywhere in the first kilobyte
+    if head.find(b'%PDF-', 0, 1024) != -1:
+        return 'application/pdf'
+
+    for magic, content_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_type
+
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if text.startswith((b'<!doctype html', b'<html')) or b'<html' in text or b'<head' in text:
+        return 'text/html'
+
+    return None
+
+
+class SniffedResponse:
+    """
+    Streaming response whose first bytes have been read to detect its type
+
+    Only the first SNIFF_SIZE bytes are read up front. iter_content() yields
+    those bytes and then keeps streaming the rest of the same connection, so a
+    file is never decoded as text or downloaded twice just to be checked.
+    """
+
+    def __init__(self, response, peek_size=SNIFF_SIZE):
+        self._response = response
+        self.headers = response.headers
+        self.url = response.url
+        self.status_code = response.status_code
+        self.head = next(response.iter_content(chunk_size=peek_size), b'')
+        self.sniffed_type = sniff_content_type(self.head)
+        self._head_pending = True
+
+    @property
+    def header_content_type(self):
+        return self.headers.get('Content-Type', 'application/octet-stream')
+
+    @property
+    def content_type(self):
+        """
+        The content type to trust: the sniffed one unless the header is more specific
+        """
+        header_type = self.header_content_type
+        if self.sniffed_type is None:
+            return header_type
+        if self.sniffed_type == 'application/zip' and 'officedocument' in header_type:
+            return header_type
+        if self.sniffed_type == 'application/x-ole-storage' and header_type.startswith('application/') and 'octet-stream' not in header_type:
+            return header_type
+        return self.sniffed_type
+
+    @property
+    def is_html(self):
+        if self.sniffed_type is not None:
+            return self.sniffed_type == 'text/html'
+        return 'text/html' in self.header_content_type
+
+    def iter_content(self, chunk_size=64 * 1024):
+        if self._head_pending:
+            self._head_pending = False
+            if self.head:
+                yield self.head
+        yield from self._response.iter_content(chunk_size=chunk_size)
+
+    def read_text(self):
+        """
+        Read the rest of the body and decode it, for HTML pages only
+        """
+        body = b''.join(self.iter_content())
+        self.close()
+        return body.decode(self._response.encoding or 'utf-8', errors='replace')
+
+    def close(self):
+        self._response.close()
@@ -1,3 +1,1600 @@
-from django.test import TestCase
+import contextlib
+import gzip
+import heapq
+import io
+import json
+import os
+import pickle
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+import requests
+from rest_framework.renderers import JSONRenderer
+
+from . import (catalogue, category_tree, cursors, db_writer, downloads, extractors, fetch, jobs, moodle_auth, pagination,
+               parse_pool, records, resolver, uploads, views)
+from .db_writer import BatchWriter
+from .downloads import stream_zip
+from .extractors import course_links, resource_page_files
+from .file_cache import FileCache
+from .jobs import JobStore
+from .middleware import CompressionMiddleware
+from .moodle_ajax import MoodleAjaxClient, MoodleAjaxError
+from .session_store import SessionStore
+from .sniffing import SniffedResponse
+from .models import Course, Department, File, Listing, Resource
+from .parsing import parse_html
+from .records import CourseFile, Link, ResourceLink
+from .renderers import FastJSONRenderer
+from .resolver import ResolutionHistory, ResourceResolver
+from .views import DEFAULT_MOODLE_URL, course_pdfs_stream
+from .warmer import TokenBucket, throttled_session, warm_queue
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Import time of the app itself, on top of Django, DRF and requests, in microseconds
+IMPORT_BUDGET_US = 40000
+
+# Framework modules imported before the measurement, so only the app's own cost is counted
+PRELOAD = 'import requests, rest_framework.views, rest_framework.response, rest_framework.serializers'
+
+
+def import_report():
+    """
+    Import the app's URL configuration under `python -X importtime`
+
+    Returns:
+        tuple: (cumulative import time of scraper.urls in microseconds,
+            set of parser modules loaded by the import)
+    """
+    code = (
+        f"import django, sys; django.setup(); {PRELOAD}; import scraper.urls; "
+        "print(','.join(name for name in ('bs4', 'soupsieve') if name in sys.modules))"
+    )
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='myproject.settings')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    )
+
+    cumulative = None
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == 'scraper.urls':
+            cumulative = int(parts[1])
+
+    return cumulative, {name for name in result.stdout.strip().split(',') if name}
+
+
+class ImportTimeTests(SimpleTestCase):
+    def test_app_import_within_budget(self):
+        # Best of three runs, to keep scheduler noise out of the measurement
+        timings = [import_report()[0] for _ in range(3)]
+        self.assertNotIn(None, timings)
+        self.assertLess(min(timings), IMPORT_BUDGET_US,
+                        f"Importing scraper.urls took {min(timings)}us, over the {IMPORT_BUDGET_US}us budget")
+
+    def test_html_parser_loaded_lazily(self):
+        _, parsers = import_report()
+        self.assertEqual(parsers, set())
+
+
+class EngineImportTests(SimpleTestCase):
+    def test_engine_imports_without_django(self):
+        # The command line tools use the engine in-process, without settings or the API server
+        env = {key: value for key, value in os.environ.items() if key != 'DJANGO_SETTINGS_MODULE'}
+        result = subprocess.run(
+            [sys.executable, '-c', "import sys, scraper.engine; print('django' in sys.modules)"],
+            cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), 'False')
+
+
+
+class CommandLineTests(SimpleTestCase):
+    def run_client(self, *args):
+        import moodle_api_client
+
+        output = io.StringIO()
+        argv = ['moodle_api_client.py', '--username', 'student', '--password', 'secret', '--direct', *args]
+        with mock.patch('sys.argv', argv), contextlib.redirect_stdout(output):
+            moodle_api_client.main()
+        return output.getvalue()
+
+    def test_direct_category_courses_prints_json(self):
+        links = [Link(text='Algebra', href=f"{SITE}/course/view.php?id=7")]
+        with mock.patch('scraper.utils_improved.extract_aalinks', return_value=links) as extract_aalinks:
+            output = json.loads(self.run_client('--moodle-url', SITE, 'category-courses', '3'))
+
+        extract_aalinks.assert_called_once_with(f"{SITE}/course/index.php?categoryid=3")
+        self.assertEqual(output, {'status': 'success', 'category_id': '3', 'count': 1,
+                                  'data': [{'text': 'Algebra', 'href': f"{SITE}/course/view.php?id=7"}]})
+
+
+COURSE_PAGE = (
+    '<html><body><h1> Algebra </h1>'
+    '<a class="aalink" href="/mod/resource/view.php?id=11"><span class="instancename">Chapter 1</span></a>'
+    '<a href="/mod/folder/view.php?id=12">Exercises</a>'
+    '<a href="/pluginfile.php/5/notes.pdf">Notes</a>'
+    '</body></html>'
+)
+
+FOLDER_PAGE = (
+    '<html><body><a href="/pluginfile.php/7/a.pdf">a.pdf</a>'
+    '<form action="/mod/folder/download_folder.php"><input type="hidden" name="id" value="12"></form>'
+    '</body></html>'
+)
+
+
+class ParsePoolTests(SimpleTestCase):
+    def tearDown(self):
+        parse_pool.configure(0)
+
+    def test_course_links_are_compact_records(self):
+        name, links = course_links(COURSE_PAGE)
+        self.assertEqual(name, 'Algebra')
+        self.assertEqual([(href, text) for href, text, _ in links], [
+            ('/mod/resource/view.php?id=11', 'Chapter 1'),
+            ('/mod/folder/view.php?id=12', 'Exercises'),
+            ('/pluginfile.php/5/notes.pdf', 'Notes'),
+        ])
+        self.assertTrue(all(isinstance(hints, dict) for _, _, hints in links))
+
+    def test_folder_page_files(self):
+        folder_url = f"{SITE}/mod/folder/view.php?id=12"
+        self.assertEqual(resource_page_files(FOLDER_PAGE, folder_url), (
+            [('/pluginfile.php/7/a.pdf', 'a.pdf')],
+            f"{SITE}/mod/folder/download_folder.php?id=12",
+            None
+        ))
+        self.assertEqual(resource_page_files(FOLDER_PAGE, folder_url, folder_archives=False)[1], None)
+
+    def test_pool_matches_inline_parsing(self):
+        inline = parse_pool.run(course_links, COURSE_PAGE)
+        parse_pool.configure(1, min_size=0)
+        self.assertEqual(parse_pool.run(course_links, COURSE_PAGE), inline)
+
+
+class SlowSession:
+    """
+    Stands in for a requests.Session: answers after the next of `delays`
+    """
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            self.calls.append((method, url, kwargs))
+            delay = self.delays.pop(0) if self.delays else 0
+        time.sleep(delay)
+        return mock.Mock(delay=delay)
+
+
+class FetchTests(SimpleTestCase):
+    def tearDown(self):
+        fetch.configure()
+
+    def warm(self, session):
+        for _ in range(fetch.MIN_SAMPLES):
+            fetch.get(session, f"{SITE}/course/view.php?id=1")
+
+    def test_phase_timeouts(self):
+        fetch.configure(timeouts={'resource': (1, 2)})
+        session = SlowSession([])
+        fetch.get(session, f"{SITE}/mod/resource/view.php?id=1", phase='resource')
+        fetch.head(session, f"{SITE}/pluginfile.php/1/a.pdf")
+        fetch.get(session, f"{SITE}/a.pdf", phase='resource', timeout=60)
+
+        self.assertEqual(session.calls[0][2]['timeout'], (1, 2))
+        self.assertEqual(session.calls[1][2], {'timeout': fetch.DEFAULT_TIMEOUTS['probe'], 'allow_redirects': False})
+        self.assertEqual(session.calls[2][2]['timeout'], 60)
+
+    def test_slow_request_is_hedged_and_hedge_wins(self):
+        fetch.configure(hedging=True)
+        session = SlowSession([0] * fetch.MIN_SAMPLES + [1.0, 0])
+        self.warm(session)
+
+        started = time.monotonic()
+        response = fetch.get(session, f"{SITE}/course/view.php?id=2")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(response.delay, 0)
+        self.assertEqual(len(session.calls), fetch.MIN_SAMPLES + 2)
+        self.assertEqual(fetch.stats()['page']['hedges'], 1)
+        self.assertEqual(fetch.stats()['page']['hedge_wins'], 1)
+
+    def test_hedges_are_limited_by_budget(self):
+        fetch.configure(hedging=True, burst=1)
+        session = SlowSession([0] * fetch.MIN_SAMPLES + [0.2, 0, 0.2])
+        self.warm(session)
+
+        fetch.get(session, f"{SITE}/course/view.php?id=2")
+        fetch.get(session, f"{SITE}/course/view.php?id=3")
+        self.assertEqual(fetch.stats()['page']['hedges'], 1)
+        self.assertEqual(len(session.calls), fetch.MIN_SAMPLES + 3)
+
+    def test_streamed_and_post_requests_are_not_hedged(self):
+        fetch.configure(hedging=True)
+        session = SlowSession([0] * fetch.MIN_SAMPLES + [0.2, 0.2])
+        self.warm(session)
+
+        fetch.get(session, f"{SITE}/a.pdf", stream=True)
+        fetch.request(session, 'POST', f"{SITE}/login/index.php")
+        self.assertEqual(len(session.calls), fetch.MIN_SAMPLES + 2)
+        self.assertEqual(fetch.stats()['page']['hedges'], 0)
+
+    def test_moodle_requests_go_through_fetch(self):
+        session = mock.Mock()
+        session.request.return_value = moodle_response(body=b'<html><script>M.cfg = {"sesskey":"abc"};</script></html>',
+                                                       url=f"{SITE}/my/")
+
+        self.assertEqual(MoodleAjaxClient(session, SITE).get_sesskey(), 'abc')
+        category_tree.fetch_category(session, SITE, '3')
+        downloads._open_sniffed(session, f"{SITE}/pluginfile.php/1/a.pdf", 20)
+
+        sent = [(call.args[0], call.kwargs['timeout']) for call in session.request.call_args_list]
+        self.assertEqual(sent, [('GET', 30), ('GET', 30), ('GET', 20)])
+        self.assertEqual(session.get.call_count, 0)
+        self.assertEqual(set(fetch.stats()), {'page', 'resource'})
+
+    def test_login_is_never_hedged(self):
+        fetch.configure(hedging=True)
+        session = SlowSession([0] * fetch.MIN_SAMPLES + [0.2])
+        for _ in range(fetch.MIN_SAMPLES):
+            fetch.get(session, f"{SITE}/login/index.php", phase='login')
+
+        fetch.get(session, f"{SITE}/login/index.php", phase='login')
+        self.assertEqual(len(session.calls), fetch.MIN_SAMPLES + 1)
+        self.assertEqual(fetch.stats()['login']['hedges'], 0)
+
+
+SITE = 'https://moodle.example'
+
+
+def course_pdfs(*names):
+    return {
+        'success': True,
+        'course_name': 'Algebra',
+        'pdfs': [{
+            'name': f"{name}.pdf",
+            'url': f"{SITE}/pluginfile.php/1/{name}.pdf",
+            'resource_name': name,
+            'resource_url': f"{SITE}/mod/resource/view.php?id={index + 10}",
+            'type': 'resource'
+        } for index, name in enumerate(names)]
+    }
+
+
+# verify_course_access() result for sessions Moodle lets into the course
+ACCESS_GRANTED = {'success': True, 'message': 'Access verified', 'status': 200}
+
+
+def grant_course_access(test, module='scraper.views'):
+    """
+    Let every session of a test see every course, without asking Moodle
+    """
+    patcher = mock.patch(f"{module}.verify_course_access", return_value=ACCESS_GRANTED)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class CatalogueTests(TestCase):
+    def test_course_files_round_trip_in_order(self):
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'td2', 'exam'))
+
+        stored = catalogue.course_files(SITE, '7')
+        self.assertEqual(stored['course_name'], 'Algebra')
+        self.assertIs(stored['pdfs'][0]['type'], records.RESOURCE)
+        self.assertEqual(stored['pdfs'], course_pdfs('td1', 'td2', 'exam')['pdfs'])
+        self.assertEqual(Resource.objects.get(url=f"{SITE}/mod/resource/view.php?id=11").moodle_id, '11')
+
+    def test_recrawl_upserts_and_drops_removed_files(self):
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'td2'))
+        file_id = File.objects.get(name='td1.pdf').id
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'exam'))
+
+        self.assertEqual(File.objects.get(name='td1.pdf').id, file_id)
+        self.assertEqual([pdf['name'] for pdf in catalogue.course_files(SITE, '7')['pdfs']], ['td1.pdf', 'exam.pdf'])
+        self.assertEqual(Course.objects.count(), 1)
+
+    def test_stale_listings_are_not_served(self):
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1'))
+        self.assertIsNone(catalogue.course_files(SITE, '7', max_age=0))
+        self.assertIsNone(catalogue.course_files(SITE, '8'))
+
+    def test_category_tree_courses(self):
+        catalogue.store_category_tree(SITE, {
+            'root': '0',
+            'categories': {
+                '0': {'id': '0', 'name': 'Courses', 'children': ['3'], 'courses': []},
+                '3': {'id': '3', 'name': 'Maths', 'parent': '0', 'children': [], 'courses': [
+                    {'id': '7', 'name': 'Algebra', 'url': f"{SITE}/course/view.php?id=7"}
+                ]}
+            }
+        })
+
+        self.assertEqual(catalogue.category_courses(SITE, '3'), [
+            {'text': 'Algebra', 'href': f"{SITE}/course/view.php?id=7", 'course_id': '7'}
+        ])
+
+
+class RecordTests(SimpleTestCase):
+    def test_records_read_like_dicts(self):
+        link = ResourceLink(resource_name='TD1', resource_url=f"{SITE}/mod/resource/view.php?id=11", pdf_url=None)
+        self.assertEqual(dict(link), {'resource_name': 'TD1', 'resource_url': f"{SITE}/mod/resource/view.php?id=11", 'pdf_url': None})
+        self.assertNotIn('error', link)
+        self.assertIsNone(link.get('pdf_name'))
+        self.assertEqual(link['pdf_url'], None)
+        with self.assertRaises(KeyError):
+            link['error']
+
+    def test_records_are_immutable(self):
+        pdf = course_pdfs('td1')['pdfs'][0]
+        record = CourseFile(**pdf)
+        with self.assertRaises(AttributeError):
+            record.name = 'other.pdf'
+        self.assertFalse(hasattr(record, '__dict__'))
+
+        renamed = record.replace(name='other.pdf')
+        self.assertEqual(renamed['name'], 'other.pdf')
+        self.assertEqual(record, pdf)
+        self.assertEqual(pickle.loads(pickle.dumps(renamed)), renamed)
+
+    def test_records_render_as_json(self):
+        archive = CourseFile(name='TD.zip', url=f"{SITE}/download_folder.php?id=3", resource_name='TD',
+                             resource_url=f"{SITE}/mod/folder/view.php?id=3", type=records.FOLDER_ARCHIVE, files=['a.pdf'])
+        self.assertEqual(json.loads(JSONRenderer().render([archive])), [dict(archive)])
+        self.assertEqual(ResourceLink.from_course_file(archive)['pdf_url'], archive['url'])
+
+
+class RenderingTests(TestCase):
+    def test_fast_renderer_matches_drf(self):
+        data = {
+            'status': 'success',
+            'crawled_at': timezone.now(),
+            'data': [ResourceLink(resource_name='Cours\u2028é', resource_url=f"{SITE}/mod/resource/view.php?id=11", pdf_url=None)]
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_large_listings_are_compressed(self):
+        Department.objects.bulk_create(
+            Department(site=DEFAULT_MOODLE_URL, moodle_id=str(moodle_id), name=f"Department {moodle_id}",
+                       url=f"{DEFAULT_MOODLE_URL}/course/index.php?categoryid={moodle_id}", crawled_at=timezone.now())
+            for moodle_id in range(40)
+        )
+
+        response = self.client.get('/api/departments/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['count'], 40)
+
+        # Small responses are not worth compressing
+        response = self.client.get('/api/jobs/missing/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class PagingTests(TestCase):
+    def test_course_files_pages_follow_the_course_order(self):
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'td2', 'td3', 'exam', 'notes'))
+
+        names, after = [], None
+        while True:
+            page = catalogue.course_files_page(SITE, '7', after, limit=2)
+            names.append([pdf['name'] for pdf in page['pdfs']])
+            after = page['next_after']
+            if after is None:
+                break
+        self.assertEqual(names, [['td1.pdf', 'td2.pdf'], ['td3.pdf', 'exam.pdf'], ['notes.pdf']])
+        self.assertIsNone(catalogue.course_files_page(SITE, '8'))
+
+    def test_course_files_pages_resume_after_the_same_file_across_recrawls(self):
+        listing = course_pdfs('td1', 'td2', 'td3', 'exam')
+        catalogue.store_course_files(SITE, '7', listing)
+        first = catalogue.course_files_page(SITE, '7', None, limit=2)
+
+        # A file added at the top of the course does not repeat td2 on the next page
+        intro = dict(course_pdfs('intro')['pdfs'][0], resource_url=f"{SITE}/mod/resource/view.php?id=99")
+        catalogue.store_course_files(SITE, '7', dict(listing, pdfs=[intro] + listing['pdfs']))
+        page = catalogue.course_files_page(SITE, '7', first['next_after'], limit=2)
+        self.assertEqual([pdf['name'] for pdf in page['pdfs']], ['td3.pdf', 'exam.pdf'])
+
+        # Once the file a cursor resumes after is gone, the listing has to be paged again
+        catalogue.store_course_files(SITE, '7', dict(listing, pdfs=listing['pdfs'][2:]))
+        self.assertIsNone(catalogue.course_files_page(SITE, '7', first['next_after'], limit=2))
+
+    def test_course_pages_only_list_public_courses(self):
+        public_course(SITE, '5')
+        catalogue.store_course_files(SITE, '6', course_pdfs('td1'))
+        catalogue.record_course_request(SITE, '7', timezone.now())
+
+        page = catalogue.courses_page(SITE)
+        self.assertEqual([course['id'] for course in page['courses']], ['5'])
+        self.assertFalse(Course.objects.filter(site=SITE, moodle_id='7').exists())
+
+    def test_category_pages_are_served_from_the_catalogue(self):
+        catalogue.store_category_links(DEFAULT_MOODLE_URL, '3', [
+            Link(text=f"Course {course_id}", href=f"{DEFAULT_MOODLE_URL}/course/view.php?id={course_id}")
+            for course_id in range(20, 25)
+        ])
+
+        texts, cursor = [], None
+        with mock.patch('scraper.views.extract_aalinks', side_effect=AssertionError('crawled')):
+            while True:
+                params = {'limit': 2, 'fields': 'text'}
+                if cursor:
+                    params['cursor'] = cursor
+                body = self.client.get('/api/category/3/courses/', params).json()
+                texts.extend(link for link in body['data'])
+                cursor = body['next_cursor']
+                if cursor is None:
+                    break
+        self.assertEqual(texts, [{'text': f"Course {course_id}"} for course_id in range(20, 25)])
+
+    def test_invalid_parameters_are_refused(self):
+        for params in ({'cursor': 'garbage'}, {'limit': 0}, {'fields': 'text,password'},
+                       {'cursor': cursors.encode_cursor('files', 3, '3')}, {'cursor': cursors.encode_cursor('category', 3, '4')}):
+            response = self.client.get('/api/category/3/courses/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+        response = self.client.get('/api/moodle-pdfs/7/', {'cursor': cursors.encode_cursor('files', 3, '8')})
+        self.assertEqual((response.status_code, response.json()['message']), (400, 'Invalid cursor'))
+        self.assertEqual(cursors.decode_cursor('files', cursors.encode_cursor('files', 3, '7'), '7'), 3)
+
+
+class ConditionalGetTests(TransactionTestCase):
+    def setUp(self):
+        grant_course_access(self)
+        self.token = views.session_store.issue(mock.Mock(), 'student', SITE)['token']
+        self.addCleanup(views.session_store.revoke, self.token)
+        self.addCleanup(db_writer.flush)
+
+    def get_files(self, **headers):
+        with mock.patch('scraper.views.get_course_pdfs', side_effect=AssertionError('crawled')):
+            return self.client.get('/api/moodle-pdfs/7/', HTTP_X_MOODLE_TOKEN=self.token, **headers)
+
+    def test_unchanged_listing_is_answered_with_304(self):
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'td2'))
+
+        response = self.get_files()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        response = self.get_files(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.get_files(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        # The same content crawled again keeps its validators; new material changes them
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'td2'))
+        self.assertEqual(self.get_files(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'td2', 'exam'))
+        response = self.get_files(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 3)
+
+    def test_representations_have_their_own_etag(self):
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'td2'))
+        etag = self.get_files()['ETag']
+        with mock.patch('scraper.views.get_course_pdfs', side_effect=AssertionError('crawled')):
+            response = self.client.get('/api/moodle-pdfs/7/?fields=name', HTTP_X_MOODLE_TOKEN=self.token,
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_course_pages_are_answered_with_304(self):
+        catalogue.store_category_links(DEFAULT_MOODLE_URL, '3', [
+            Link(text=f"Course {course_id}", href=f"{DEFAULT_MOODLE_URL}/course/view.php?id={course_id}")
+            for course_id in range(20, 23)
+        ])
+
+        response = self.client.get('/api/courses/', {'limit': 2})
+        etag = response['ETag']
+        response = self.client.get('/api/courses/', {'limit': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/api/courses/', {'limit': 2}, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertNotEqual(self.client.get('/api/courses/', {'limit': 3})['ETag'], etag)
+
+        # A crawl of a listed course that renames it changes the page
+        catalogue.store_course_files(DEFAULT_MOODLE_URL, '20', course_pdfs('td1'))
+        response = self.client.get('/api/courses/', {'limit': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['name'], 'Algebra')
+
+    def test_scraped_courses_are_answered_with_304(self):
+        courses = [{'name': 'Algebra', 'url': f"{DEFAULT_MOODLE_URL}/course/view.php?id=7", 'image': None,
+                    'summary': '', 'teachers': []}]
+
+        with mock.patch('scraper.views.scrape_elearning_courses', return_value=courses):
+            etag = self.client.get('/api/courses/')['ETag']
+            db_writer.flush()
+            self.assertEqual(self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class CourseRequestCountTests(TransactionTestCase):
+    def setUp(self):
+        grant_course_access(self)
+        self.token = views.session_store.issue(mock.Mock(), 'student', SITE)['token']
+        self.addCleanup(views.session_store.revoke, self.token)
+        self.addCleanup(db_writer.flush)
+
+    def get_files(self, course_id, crawl=None):
+        with mock.patch('scraper.views.get_course_pdfs', return_value=crawl) as get_course_pdfs:
+            response = self.client.get(f"/api/moodle-pdfs/{course_id}/", HTTP_X_MOODLE_TOKEN=self.token)
+        db_writer.flush()
+        return response, get_course_pdfs
+
+    def test_non_numeric_course_ids_are_refused(self):
+        response, get_course_pdfs = self.get_files('abc')
+        self.assertEqual(response.status_code, 400)
+        get_course_pdfs.assert_not_called()
+        self.assertFalse(Course.objects.exists())
+
+    def test_failed_crawls_are_not_counted(self):
+        response, _ = self.get_files('7', {'success': False, 'message': 'Not enrolled in course 7'})
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Course.objects.exists())
+
+    def test_served_listings_are_counted(self):
+        response, _ = self.get_files('7', {'message': 'Found 1 PDF files', **course_pdfs('td1')})
+        self.assertEqual(response.status_code, 200)
+        course = Course.objects.get(site=SITE, moodle_id='7')
+        self.assertEqual(course.name, 'Algebra')
+        self.assertEqual(course.request_score, 1)
+
+        self.get_files('7')
+        self.assertGreater(Course.objects.get(pk=course.pk).request_score, 1)
+
+
+class ChangeLogTests(TransactionTestCase):
+    def test_crawls_log_what_changed(self):
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'td2'))
+        first = catalogue.changes(SITE)
+        self.assertEqual([change['kind'] for change in first['changes']],
+                         ['resource_added', 'resource_added', 'file_added', 'file_added'])
+
+        # An unchanged listing is not compared again
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'td2'))
+        self.assertEqual(catalogue.changes(SITE, first['last_id'])['changes'], [])
+
+        # The second resource keeps its URL under a new name, with a new file
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1', 'exam'))
+        changes = catalogue.changes(SITE, first['last_id'])['changes']
+        self.assertEqual([(change['kind'], change.get('file_name'), change.get('previous')) for change in changes], [
+            ('resource_renamed', None, 'td2'),
+            ('file_added', 'exam.pdf', None),
+            ('file_removed', 'td2.pdf', None)
+        ])
+
+        url = f"{SITE}/pluginfile.php/1/td1.pdf"
+        catalogue.record_content_hash(url, 'a' * 64, 10)
+        catalogue.record_content_hash(url, 'b' * 64, 12)
+        change = catalogue.changes(SITE, first['last_id'] + 3)['changes'][0]
+        self.assertEqual((change['kind'], change['file_url'], change['previous']), ('file_changed', url, 'a' * 64))
+
+    def issue_token(self, username, *course_ids):
+        token = views.session_store.issue(mock.Mock(), username, SITE)['token']
+        self.addCleanup(views.session_store.revoke, token)
+        enrolled = {'success': True, 'message': 'Found courses', 'courses': [
+            {'id': course_id, 'name': f"Course {course_id}", 'url': f"{SITE}/course/view.php?id={course_id}"}
+            for course_id in course_ids
+        ]}
+        patcher = mock.patch('scraper.views.get_enrolled_courses', return_value=enrolled)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(db_writer.flush)
+        return token
+
+    def test_feed_resumes_from_its_cursor(self):
+        token = self.issue_token('changes-reader', '7', '8')
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1'))
+        catalogue.store_course_files(SITE, '8', course_pdfs('exam'))
+
+        body = self.client.get('/api/changes/', {'courses': '8'}, HTTP_X_MOODLE_TOKEN=token).json()
+        self.assertEqual({change['course_id'] for change in body['changes']}, {'8'})
+        self.assertEqual(body['count'], 2)
+
+        body = self.client.get('/api/changes/', {'since': body['next_cursor']}, HTTP_X_MOODLE_TOKEN=token).json()
+        self.assertEqual(body['changes'], [])
+        self.assertFalse(body['has_more'])
+        self.assertEqual(self.client.get('/api/changes/', {'since': 'x'}, HTTP_X_MOODLE_TOKEN=token).status_code, 400)
+
+    def test_enrolled_courses_are_dated_by_their_files(self):
+        token = self.issue_token('dated-student', '7', '8')
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1'))
+        changed_at = int(Listing.objects.get(site=SITE, key='files:7').changed_at.timestamp())
+
+        courses = self.client.get('/api/moodle-courses/', HTTP_X_MOODLE_TOKEN=token).json()['courses']
+        self.assertEqual({course['id']: course['last_modified'] for course in courses}, {'7': changed_at, '8': None})
+
+        # Courses never crawled are listed, since nothing says they did not change
+        courses = self.client.get('/api/moodle-courses/', {'modified_since': changed_at},
+                                  HTTP_X_MOODLE_TOKEN=token).json()['courses']
+        self.assertEqual([course['id'] for course in courses], ['8'])
+
+    def test_feed_is_limited_to_the_courses_of_the_user(self):
+        self.assertEqual(self.client.get('/api/changes/').status_code, 401)
+        self.assertEqual(self.client.get('/api/changes/', HTTP_X_MOODLE_TOKEN='expired').status_code, 401)
+
+        token = self.issue_token('changes-student', '7')
+        catalogue.store_course_files(SITE, '7', course_pdfs('td1'))
+        catalogue.store_course_files(SITE, '8', course_pdfs('exam'))
+
+        body = self.client.get('/api/changes/', HTTP_X_MOODLE_TOKEN=token).json()
+        self.assertEqual({change['course_id'] for change in body['changes']}, {'7'})
+
+        refused = {'success': False, 'message': 'Not enrolled in course 8', 'status': 403}
+        with mock.patch('scraper.views.verify_course_access', return_value=refused) as verify:
+            response = self.client.get('/api/changes/', {'courses': '7,8'}, HTTP_X_MOODLE_TOKEN=token)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(verify.call_args.args[2], '8')
+
+
+def add_department(moodle_id):
+    Department.objects.create(site=SITE, moodle_id=moodle_id, name=moodle_id, url=f"{SITE}/", crawled_at=timezone.now())
+
+
+class BatchWriterTests(TransactionTestCase):
+    def test_concurrent_writes_are_committed(self):
+        writer = BatchWriter(batch_size=10, max_delay=0.01)
+        threads = [
+            threading.Thread(target=lambda worker=worker: [writer.submit(add_department, f"{worker}-{index}") for index in range(25)])
+            for worker in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(writer.flush(10))
+        self.assertEqual(Department.objects.count(), 100)
+
+    def test_failed_write_does_not_roll_back_its_batch(self):
+        writer = BatchWriter(batch_size=10, max_delay=0.5)
+        writer.submit(add_department, 'first')
+        writer.submit(add_department, 'first')
+        writer.submit(add_department, 'second')
+
+        self.assertTrue(writer.flush(10))
+        self.assertEqual(sorted(Department.objects.values_list('moodle_id', flat=True)), ['first', 'second'])
+
+
+
+def crawl_events(*names):
+    yield 'course', 'Algebra'
+    for pdf in course_pdfs(*names)['pdfs']:
+        yield 'file', CourseFile(**pdf)
+    yield 'error', ('Broken', f"{SITE}/mod/resource/view.php?id=99", 'Status code: 503')
+    yield 'done', {'probes_issued': 0, 'probes_skipped': len(names)}
+
+
+def stream_lines(response):
+    return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+
+class NDJSONStreamTests(TransactionTestCase):
+    def setUp(self):
+        grant_course_access(self)
+
+    def test_stream_has_header_items_and_trailer(self):
+        with mock.patch('scraper.views.iter_course_pdfs', return_value=crawl_events('td1', 'td2')):
+            response = course_pdfs_stream('7', SITE, session=None)
+        lines = stream_lines(response)
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(lines[0]['event'], 'course')
+        self.assertEqual(lines[0]['course_name'], 'Algebra')
+        self.assertEqual([line['name'] for line in lines[1:-1]], ['td1.pdf', 'td2.pdf'])
+        self.assertEqual(lines[-1]['event'], 'done')
+        self.assertEqual(lines[-1]['count'], 2)
+        self.assertEqual(lines[-1]['errors'][0]['message'], 'Status code: 503')
+
+        # The streamed crawl is stored, so the next listing comes from the catalogue
+        db_writer.flush()
+        lines = stream_lines(course_pdfs_stream('7', SITE, session=None, resources=True))
+        self.assertTrue(lines[0]['cached'])
+        self.assertEqual([line['pdf_name'] for line in lines if line['event'] == 'resource'], ['td1.pdf', 'td2.pdf'])
+
+    def test_course_page_failure_keeps_error_status(self):
+        with mock.patch('scraper.views.iter_course_pdfs', return_value=iter([('failed', 'Not logged in or session expired')])):
+            response = course_pdfs_stream('7', SITE, session=None)
+        self.assertEqual(response.status_code, 500)
+
+    def test_format_parameter_selects_ndjson(self):
+        response = self.client.get('/api/moodle-pdfs/7/?format=ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(json.loads(response.content)['status'], 'error')
+
+
+
+def wait_for_job(job, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job.finished_at is None and time.monotonic() < deadline:
+        job.events_after(len(job.events_after(0)), timeout=0.1)
+    return [event['event'] for event in job.events_after(0)]
+
+
+class JobTests(TransactionTestCase):
+    def setUp(self):
+        self.store = JobStore()
+        grant_course_access(self, 'scraper.jobs')
+
+    def tearDown(self):
+        # Crawl jobs store their listing through the writer thread
+        db_writer.flush()
+
+    def test_crawl_job_reports_resources_and_progress(self):
+        def events():
+            yield 'course', 'Algebra'
+            yield 'resources', 2
+            yield 'file', CourseFile(**course_pdfs('td1')['pdfs'][0])
+            yield 'progress', 1
+            yield 'error', ('Broken', f"{SITE}/mod/resource/view.php?id=99", 'Status code: 503')
+            yield 'progress', 2
+            yield 'done', {}
+
+        with mock.patch('scraper.jobs.iter_course_pdfs', return_value=events()):
+            job = self.store.start('crawl', jobs.crawl_course, '7', SITE, None)
+            names = wait_for_job(job)
+
+        self.assertEqual(names, ['phase', 'course', 'phase', 'resource', 'progress', 'resource_error', 'progress', 'done'])
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.result['count'], 1)
+        self.assertEqual(job.events_after(6)[0]['data']['eta'], 0)
+
+    def test_export_job_writes_archive_and_reports_bytes(self):
+        def fake_zip(session, resources, file_cache=None, progress=None, revalidate=True):
+            progress('file', 'td1.pdf', None)
+            progress('bytes', 'td1.pdf', 1024)
+            yield b'PK'
+
+        listing = {'course_name': 'Algebra', 'count': 1, 'pdfs': [CourseFile(**course_pdfs('td1')['pdfs'][0])]}
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('scraper.jobs.crawl_course', return_value=listing), \
+                mock.patch('scraper.jobs.stream_zip', side_effect=fake_zip):
+            job = self.store.start('export', jobs.export_course, '7', SITE, None, 'all', None, directory)
+            names = wait_for_job(job)
+            with open(job.path, 'rb') as f:
+                self.assertEqual(f.read(), b'PK')
+
+        self.assertEqual(names, ['phase', 'file', 'bytes', 'bytes', 'done'])
+        self.assertEqual(job.result['files'], 1)
+
+    def test_cancelled_job_stops(self):
+        def endless(job):
+            while True:
+                job.check()
+                time.sleep(0.01)
+
+        job = self.store.start('crawl', endless)
+        job.cancel()
+        self.assertEqual(wait_for_job(job), ['cancelled'])
+
+    def test_events_are_served_as_sse(self):
+        job = self.store.start('crawl', lambda job: job.emit('phase', phase='listing') or {'count': 0})
+        wait_for_job(job)
+
+        with mock.patch('scraper.views.job_store', self.store):
+            response = self.client.get(f"/api/jobs/{job.id}/events/", HTTP_ACCEPT='text/event-stream', HTTP_LAST_EVENT_ID='1')
+            body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertNotIn('event: phase', body)
+        self.assertIn('id: 2\nevent: done\ndata: {"result":{"count":0}', body)
+
+
+class WarmerTests(TestCase):
+    def test_request_score_decays_with_half_life(self):
+        now = timezone.now()
+        public_course(SITE, '7')
+        catalogue.record_course_request(SITE, '7', now - timedelta(days=2))
+        catalogue.record_course_request(SITE, '7', now - timedelta(days=1))
+
+        course = Course.objects.get(site=SITE, moodle_id='7')
+        self.assertAlmostEqual(course.request_score, 1.5)
+        self.assertAlmostEqual(catalogue.decayed_score(course.request_score, course.last_requested_at, now), 0.75)
+
+    def test_queue_orders_hot_courses_and_skips_fresh_ones(self):
+        now = timezone.now()
+        for course_id, requests in (('1', 2), ('2', 6), ('3', 4), ('4', 8)):
+            public_course(SITE, course_id)
+            for _ in range(requests):
+                catalogue.record_course_request(SITE, course_id, now)
+        catalogue.store_course_files(SITE, '4', course_pdfs('td1'))
+
+        heap = warm_queue(SITE, now)
+        order = [heapq.heappop(heap)[1] for _ in range(len(heap))]
+        self.assertEqual(order, ['2', '3', '1'])
+
+    def test_throttled_session_charges_redirects_and_downloads(self):
+        resource_url, file_url = f"{SITE}/mod/resource/view.php?id=11", f"{SITE}/pluginfile.php/1/td1.pdf"
+        answers = {resource_url: moodle_response(303, location=file_url, url=resource_url),
+                   file_url: moodle_response(body=PDF_BODY, url=file_url)}
+
+        def send(request, **kwargs):
+            answers[request.url].request = request
+            return answers[request.url]
+
+        adapter = mock.Mock(spec=requests.adapters.BaseAdapter)
+        adapter.send.side_effect = send
+        session = requests.Session()
+        session.mount(SITE, adapter)
+        bucket = mock.Mock()
+
+        response = fetch.get(throttled_session(session, bucket), resource_url, 'resource', allow_redirects=True)
+
+        self.assertEqual(response.content, PDF_BODY)
+        self.assertEqual(bucket.acquire.call_count, 2)
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=50, capacity=5)
+        started = time.monotonic()
+        for _ in range(10):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+        self.assertFalse(bucket.acquire(5, timeout=0.01))
+
+
+def public_course(site, course_id):
+    return Course.objects.create(site=site, moodle_id=course_id, category_moodle_id='1', name=f"Course {course_id}",
+                                 url=f"{site}/course/view.php?id={course_id}", crawled_at=timezone.now())
+
+
+def tree_with_root(name):
+    root = {'id': '0', 'name': name, 'url': f"{SITE}/course/index.php", 'children': [], 'courses': [], 'fetched_at': 0}
+    return {'success': True, 'message': 'Crawled 1 categories (0 failed)', 'url': SITE, 'root': '0', 'categories': {'0': root}}
+
+
+class CategoryTreeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.crawls = []
+        self.roots = []
+
+        def crawl(url, **kwargs):
+            self.crawls.append(url)
+            self.roots.append(kwargs.get('root_id'))
+            return tree_with_root(f"crawl {len(self.crawls)}")
+
+        for target, patched in (('scraper.views.crawl_category_tree', crawl), ('scraper.views.store_in_catalogue', None)):
+            patcher = mock.patch(target, side_effect=patched)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.store = views.store_in_catalogue
+
+    def get_tree(self, token=None, **params):
+        headers = {'HTTP_X_MOODLE_TOKEN': token} if token else {}
+        return self.client.get('/api/tree/', params, **headers)
+
+    def test_refresh_needs_a_token(self):
+        self.assertEqual(self.get_tree(refresh='all').status_code, 401)
+        self.assertEqual(self.crawls, [])
+
+        # The site of the tree is the default one for guests; a url parameter is ignored
+        self.assertEqual(self.get_tree(url='http://internal.example').status_code, 200)
+        self.assertEqual(self.crawls, [DEFAULT_MOODLE_URL])
+
+    @override_settings(MOODLE_TREE_REFRESH_INTERVAL=60)
+    def test_refreshes_are_throttled(self):
+        token = views.session_store.issue(mock.Mock(), 'student', SITE)['token']
+        self.addCleanup(views.session_store.revoke, token)
+
+        self.assertEqual(self.get_tree(token, refresh='all').json()['tree']['name'], 'crawl 1')
+        self.assertEqual(self.get_tree(token, refresh='all').json()['tree']['name'], 'crawl 1')
+        self.assertEqual(self.crawls, [SITE])
+
+        entry = cache.get(f"category_tree:{SITE}:student")
+        cache.set(f"category_tree:{SITE}:student", dict(entry, fetched_at=entry['fetched_at'] - 120))
+        self.assertEqual(self.get_tree(token, refresh='all').json()['tree']['name'], 'crawl 2')
+
+    def test_only_the_guest_tree_is_stored(self):
+        token = views.session_store.issue(mock.Mock(), 'student', SITE)['token']
+        self.addCleanup(views.session_store.revoke, token)
+
+        self.get_tree(token)
+        self.store.assert_not_called()
+        self.get_tree()
+        self.assertEqual(self.store.call_args.args[:2], (catalogue.store_category_tree, DEFAULT_MOODLE_URL))
+
+    def test_refresh_values(self):
+        token = views.session_store.issue(mock.Mock(), 'student', SITE)['token']
+        self.addCleanup(views.session_store.revoke, token)
+
+        self.assertEqual(self.get_tree(token, refresh='true').status_code, 400)
+        self.get_tree(token)
+        cache.set(f"category_tree:{SITE}:student", dict(cache.get(f"category_tree:{SITE}:student"), fetched_at=0))
+        self.assertEqual(self.get_tree(token, refresh='1').status_code, 200)
+        self.assertEqual(self.roots, [None, '1'])
+
+
+class SessionStoreTests(SimpleTestCase):
+    def test_tokens_resolve_to_their_session_until_revoked(self):
+        store = SessionStore(ttl=60)
+        session = mock.Mock()
+        entry = store.issue(session, 'student', SITE)
+
+        self.assertEqual(store.get(entry['token'])['session'], session)
+        self.assertEqual(store.get(entry['token'])['username'], 'student')
+        self.assertIsNone(store.get('unknown'))
+        self.assertIsNone(store.get(None))
+
+        self.assertTrue(store.revoke(entry['token']))
+        self.assertFalse(store.revoke(entry['token']))
+        self.assertIsNone(store.get(entry['token']))
+        session.close.assert_called_once()
+
+    def test_expired_tokens_are_dropped_on_lookup(self):
+        store = SessionStore(ttl=60)
+        sessions = [mock.Mock(), mock.Mock()]
+        tokens = [store.issue(session, 'student', SITE)['token'] for session in sessions]
+
+        with mock.patch('scraper.session_store.time.time', return_value=time.time() + 61):
+            # Looking up one token closes every expired session, not only that one
+            self.assertIsNone(store.get(tokens[0]))
+        for session in sessions:
+            session.close.assert_called_once()
+        self.assertIsNone(store.get(tokens[1]))
+
+    def test_oldest_tokens_are_evicted_beyond_the_limit(self):
+        store = SessionStore(ttl=60, max_entries=2)
+        sessions = [mock.Mock() for _ in range(3)]
+        tokens = [store.issue(session, f"student{index}", SITE)['token'] for index, session in enumerate(sessions)]
+
+        self.assertIsNone(store.get(tokens[0]))
+        sessions[0].close.assert_called_once()
+        self.assertEqual([store.get(token)['session'] for token in tokens[1:]], sessions[1:])
+
+
+def moodle_response(status_code=200, location=None, body=b'', url=None, headers=None):
+    """
+    Build a requests.Response as Moodle would send it
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url or f"{DEFAULT_MOODLE_URL}/course/view.php?id=7"
+    response.raw = io.BytesIO(body)
+    response.headers.update(headers or {})
+    if location:
+        response.headers['Location'] = location
+    return response
+
+
+class CourseAccessTests(TransactionTestCase):
+    def setUp(self):
+        catalogue.store_course_files(DEFAULT_MOODLE_URL, '7', course_pdfs('td1', 'td2'))
+        self.addCleanup(db_writer.flush)
+
+    def post_files(self, moodle):
+        with mock.patch('requests.Session.request', side_effect=moodle) as request:
+            response = self.client.post('/api/moodle-pdfs/', {'course_id': '7', 'session': {'MoodleSession': 'garbage'}},
+                                        content_type='application/json')
+        return response, request
+
+    def test_unverified_cookies_get_no_listing(self):
+        response, request = self.post_files(lambda method, url, **kwargs: moodle_response(
+            303, f"{DEFAULT_MOODLE_URL}/login/index.php"))
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('pdfs', response.json())
+        self.assertFalse(request.call_args.kwargs['allow_redirects'])
+
+        response, _ = self.post_files(requests.ConnectionError('Moodle is down'))
+        self.assertEqual(response.status_code, 502)
+
+    def test_users_who_are_not_enrolled_are_refused(self):
+        response, _ = self.post_files(lambda method, url, **kwargs: moodle_response(
+            303, f"{DEFAULT_MOODLE_URL}/enrol/index.php?id=7"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_access_is_checked_once_per_session(self):
+        session = requests.Session()
+        token = views.session_store.issue(session, 'student', DEFAULT_MOODLE_URL)['token']
+        self.addCleanup(views.session_store.revoke, token)
+
+        with mock.patch('requests.Session.request', return_value=moodle_response()) as request:
+            for _ in range(2):
+                response = self.client.get('/api/moodle-pdfs/7/', HTTP_X_MOODLE_TOKEN=token)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(request.call_count, 1)
+
+    def test_crawl_of_the_enrolment_page_fails(self):
+        enrol_page = moodle_response(url=f"{DEFAULT_MOODLE_URL}/enrol/index.php?id=7", body=b'<html><h1>Enrol</h1></html>')
+        with mock.patch('requests.Session.request', return_value=enrol_page):
+            events = list(moodle_auth.iter_course_pdfs('7', url=DEFAULT_MOODLE_URL, session=requests.Session()))
+        self.assertEqual(events, [('failed', 'Not enrolled in course 7')])
+
+
+PDF_BODY = b'%PDF-1.4 ' + bytes(range(256)) * 4
+
+
+def cache_file(directory, url, body=PDF_BODY):
+    cache = FileCache(directory)
+    writer = cache.open_writer(url, 'td1.pdf', 'application/pdf')
+    writer.write(body)
+    return cache, writer.commit()
+
+
+@override_settings(MOODLE_SENDFILE_BACKEND=None)
+class CachedFileResponseTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache, self.entry = cache_file(directory.name, f"{SITE}/pluginfile.php/1/td1.pdf")
+        self.etag = f'"{self.entry["etag"]}"'
+
+    def get(self, **headers):
+        response = views.cached_file_response(RequestFactory().get('/', **headers), self.entry)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_full_download(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, PDF_BODY)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_byte_ranges(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-2')
+        self.assertEqual((response.status_code, body), (206, b'%PD'))
+        self.assertEqual(response['Content-Range'], f"bytes 0-2/{len(PDF_BODY)}")
+
+        response, body = self.get(HTTP_RANGE='bytes=-4')
+        self.assertEqual((response.status_code, body), (206, PDF_BODY[-4:]))
+
+        response, body = self.get(HTTP_RANGE=f"bytes=10-{len(PDF_BODY) * 2}")
+        self.assertEqual((response.status_code, body), (206, PDF_BODY[10:]))
+
+    def test_invalid_and_unsatisfiable_ranges(self):
+        # An inverted range is ignored, the whole file is sent
+        response, body = self.get(HTTP_RANGE='bytes=5-3')
+        self.assertEqual((response.status_code, body), (200, PDF_BODY))
+
+        response, _ = self.get(HTTP_RANGE=f"bytes={len(PDF_BODY)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f"bytes */{len(PDF_BODY)}")
+
+    def test_if_range_only_resumes_the_same_file(self):
+        response, body = self.get(HTTP_RANGE='bytes=3-', HTTP_IF_RANGE=self.etag)
+        self.assertEqual((response.status_code, body), (206, PDF_BODY[3:]))
+
+        response, body = self.get(HTTP_RANGE='bytes=3-', HTTP_IF_RANGE='"other"')
+        self.assertEqual((response.status_code, body), (200, PDF_BODY))
+
+    def test_if_none_match(self):
+        for tag in (self.etag, f"W/{self.etag}", f'"other", {self.etag}', '*'):
+            response, body = self.get(HTTP_IF_NONE_MATCH=tag)
+            self.assertEqual((response.status_code, body), (304, b''), tag)
+            self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"')[0].status_code, 200)
+
+    def test_files_are_not_compressed(self):
+        def serve(request):
+            return views.cached_file_response(request, self.entry)
+
+        middleware = CompressionMiddleware(serve)
+        for headers in ({}, {'HTTP_RANGE': 'bytes=0-2'}):
+            response = middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip', **headers))
+            body = b''.join(response.streaming_content)
+            response.close()
+            self.assertFalse(response.has_header('Content-Encoding'), headers)
+            self.assertEqual(response['ETag'], self.etag)
+            self.assertEqual(body, PDF_BODY[:3] if headers else PDF_BODY)
+
+        listing = CompressionMiddleware(lambda request: HttpResponse(b'{}' * 1024, content_type='application/json'))
+        self.assertEqual(listing(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))['Content-Encoding'], 'gzip')
+
+    def test_downloads_stream_to_the_client_and_into_the_cache(self):
+        url = f"{SITE}/pluginfile.php/1/td2.pdf"
+
+        def download():
+            file_response = SniffedResponse(moodle_response(body=PDF_BODY * 2, url=url, headers={'Content-Type': 'application/pdf'}),
+                                            peek_size=len(PDF_BODY))
+            return {'response': file_response, 'filename': 'td2.pdf', 'content_type': 'application/pdf'}
+
+        with mock.patch.object(views, 'file_cache', self.cache), mock.patch('scraper.views.store_in_catalogue') as store:
+            # A client that hangs up leaves nothing in the cache
+            response = views.file_download_response(RequestFactory().get('/'), url, download())
+            next(iter(response.streaming_content))
+            response.close()
+            self.assertIsNone(self.cache.lookup(url))
+
+            response = views.file_download_response(RequestFactory().get('/'), url, download())
+            chunks = iter(response.streaming_content)
+            body = next(chunks)
+            self.assertIsNone(self.cache.lookup(url))
+            body += b''.join(chunks)
+
+        self.assertEqual(body, PDF_BODY * 2)
+        self.assertEqual(self.cache.lookup(url)['size'], len(body))
+        self.assertEqual(store.call_count, 1)
+
+    def test_purge_drops_expired_and_least_recently_used_files(self):
+        cache = FileCache(self.cache.directory, max_size=len(PDF_BODY) * 3)
+        now = time.time()
+        for age, name in ((30, 'a'), (20, 'b')):
+            cache_file(cache.directory, f"{SITE}/pluginfile.php/1/{name}.pdf")
+            os.utime(cache._paths(cache.key_for(f"{SITE}/pluginfile.php/1/{name}.pdf"))[1], (now - age, now - age))
+        os.utime(cache._paths(cache.key_for(f"{SITE}/pluginfile.php/1/td1.pdf"))[1], (now - 40, now - 40))
+        # A hit makes a file the most recently used
+        self.assertIsNotNone(cache.lookup(f"{SITE}/pluginfile.php/1/a.pdf"))
+
+        cache_file(cache.directory, f"{SITE}/pluginfile.php/1/c.pdf")
+        writer = cache.open_writer(f"{SITE}/pluginfile.php/1/d.pdf", 'd.pdf', 'application/pdf')
+        writer.write(PDF_BODY)
+        writer.commit()
+
+        kept = [name for name in ('td1', 'a', 'b', 'c', 'd') if cache.lookup(f"{SITE}/pluginfile.php/1/{name}.pdf")]
+        self.assertEqual(kept, ['a', 'c', 'd'])
+
+        abandoned = os.path.join(cache.directory, 'abandoned.part')
+        Path(abandoned).touch()
+        os.utime(abandoned, (now - 60, now - 60))
+        cache.ttl = 0
+        self.assertEqual(cache.purge(), 3)
+        self.assertEqual(os.listdir(cache.directory), [])
+
+    def test_cached_files_are_only_zipped_for_sessions_moodle_lets_through(self):
+        url = f"{SITE}/pluginfile.php/1/td1.pdf"
+        resource = ResourceLink(resource_name='td1', resource_url=url, pdf_url=url, pdf_name='td1.pdf')
+        login_page = moodle_response(url=f"{SITE}/login/index.php?redirect=1")
+
+        with mock.patch('requests.Session.request', return_value=login_page) as request, \
+                mock.patch('scraper.downloads.open_resource_download', return_value={'success': False, 'message': 'Login required'}):
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_zip(requests.Session(), [resource], file_cache=self.cache))))
+        self.assertEqual(request.call_args.args[0], 'HEAD')
+        self.assertEqual(archive.namelist(), ['errors.txt'])
+
+        # Files of a course the session was verified for come straight from the cache
+        with mock.patch('requests.Session.request', side_effect=AssertionError('asked Moodle')):
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(
+                stream_zip(requests.Session(), [resource], file_cache=self.cache, revalidate=False))))
+        self.assertEqual(archive.read('td1.pdf'), PDF_BODY)
+
+
+def serve_files(files):
+    """
+    Stand in for requests.Session.request, answering with the bodies of `files` by URL, 404 otherwise
+    """
+    def request(method, url, **kwargs):
+        if url not in files:
+            return moodle_response(404, url=url)
+        return moodle_response(body=files[url], url=url, headers={'Content-Type': 'application/octet-stream'})
+    return request
+
+
+def file_resource(name, url=None):
+    return {'resource_name': os.path.splitext(name)[0], 'resource_url': url or f"{SITE}/pluginfile.php/1/{name}",
+            'pdf_url': url or f"{SITE}/pluginfile.php/1/{name}", 'pdf_name': name}
+
+
+class ZipDownloadTests(SimpleTestCase):
+    resources = [file_resource('td1.pdf'), file_resource('Exam.PDF'), file_resource('slides.pptx')]
+
+    def test_files_selector(self):
+        self.assertIsNone(downloads.parse_files_selector('all'))
+        self.assertEqual(downloads.parse_files_selector('0, 2')['index'], {0, 2})
+        self.assertEqual(downloads.parse_files_selector({'type': ['.PDF']})['type'], {'pdf'})
+        for selector in ('a,b', 42, {'index': ['x']}):
+            with self.assertRaises(ValueError, msg=selector):
+                downloads.parse_files_selector(selector)
+
+    def test_select_resources(self):
+        def names(selector):
+            return [resource['pdf_name'] for resource in downloads.select_resources(self.resources, selector)]
+
+        self.assertEqual(names('*'), ['td1.pdf', 'Exam.PDF', 'slides.pptx'])
+        self.assertEqual(names([2, 0]), ['td1.pdf', 'slides.pptx'])
+        self.assertEqual(names('type:pdf'), ['td1.pdf', 'Exam.PDF'])
+        self.assertEqual(names('name:exam'), ['Exam.PDF'])
+        self.assertEqual(names({'name': 't*', 'type': 'pdf'}), ['td1.pdf'])
+
+    def test_stream_zip_writes_a_valid_archive(self):
+        resources = self.resources[:2] + [file_resource('td1.pdf', f"{SITE}/pluginfile.php/2/td1.pdf"),
+                                          file_resource('missing.pdf')]
+        files = {f"{SITE}/pluginfile.php/1/td1.pdf": PDF_BODY, f"{SITE}/pluginfile.php/1/Exam.PDF": b'%PDF-1.4 exam',
+                 f"{SITE}/pluginfile.php/2/td1.pdf": b'%PDF-1.4 other'}
+        events = []
+
+        with mock.patch('requests.Session.request', side_effect=serve_files(files)):
+            chunks = list(stream_zip(requests.Session(), resources, chunk_size=100,
+                                     progress=lambda event, name, value: events.append((event, name))))
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), ['td1.pdf', 'Exam.PDF', 'td1 (2).pdf', 'errors.txt'])
+        self.assertEqual(archive.read('td1.pdf'), PDF_BODY)
+        self.assertEqual(archive.read('td1 (2).pdf'), b'%PDF-1.4 other')
+        self.assertIn('missing.pdf: ', archive.read('errors.txt').decode())
+        self.assertIn(('error', 'missing.pdf'), events)
+        self.assertGreater(len(chunks), 2)
+
+    def test_stream_zip_keeps_a_valid_archive_when_downloads_fail(self):
+        class BrokenBody(io.BytesIO):
+            def read(self, *args):
+                data = super().read(*args)
+                if not data:
+                    raise OSError('Connection reset by peer')
+                return data
+
+        def request(method, url, **kwargs):
+            if url.endswith('evil.pdf'):
+                return moodle_response(body=PDF_BODY, url=url, headers={
+                    'Content-Type': 'application/pdf', 'Content-Disposition': 'attachment; filename="../../etc/passwd.pdf"'})
+            response = moodle_response(url=url, headers={'Content-Type': 'application/pdf'})
+            response.raw = BrokenBody(PDF_BODY)
+            return response
+
+        with mock.patch('requests.Session.request', side_effect=request):
+            chunks = list(stream_zip(requests.Session(), [file_resource('evil.pdf'), file_resource('broken.pdf')]))
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), ['passwd.pdf', 'broken.pdf', 'errors.txt'])
+        self.assertIn('broken.pdf: incomplete, the download failed: Connection reset', archive.read('errors.txt').decode())
+
+    def test_archive_names_are_quoted(self):
+        response = views.zip_files_response(requests.Session(), self.resources, 'all', 'Cours "Algèbre"')
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=utf-8''Cours%20%22Alg%C3%A8bre%22.zip")
+
+    def test_closing_stream_zip_ignores_failed_prefetches(self):
+        opened = {'success': True, 'cached': None, 'filename': 'td1.pdf', 'url': f"{SITE}/pluginfile.php/1/td1.pdf",
+                  'content_type': 'application/pdf', 'response': moodle_response(body=PDF_BODY * 1000)}
+        failures = threading.Event()
+
+        def open_member(session, resource, *args):
+            if resource['pdf_name'] == 'td1.pdf':
+                return opened
+            failures.set()
+            raise RuntimeError('Moodle is down')
+
+        with mock.patch('scraper.downloads._open_member', side_effect=open_member):
+            chunks = stream_zip(requests.Session(), self.resources, chunk_size=100)
+            next(chunks)
+            failures.wait(1)
+            time.sleep(0.05)
+            chunks.close()
+
+class SniffedResponseTests(SimpleTestCase):
+    def sniff(self, body, content_type='application/octet-stream', peek_size=16):
+        return SniffedResponse(moodle_response(body=body, headers={'Content-Type': content_type}), peek_size=peek_size)
+
+    def test_peeks_only_the_first_bytes(self):
+        body = b'%PDF-1.4 ' + b'x' * 100
+        sniffed = self.sniff(body)
+        self.assertEqual((sniffed.content_type, sniffed.is_html), ('application/pdf', False))
+        self.assertEqual(sniffed._response.raw.tell(), 16)
+
+        # The peeked bytes come first, once; like a requests body, the stream cannot be read twice
+        self.assertEqual(b''.join(sniffed.iter_content(chunk_size=32)), body)
+        with self.assertRaises(requests.exceptions.StreamConsumedError):
+            b''.join(sniffed.iter_content())
+
+    def test_content_type(self):
+        self.assertTrue(self.sniff(b'\n<!DOCTYPE html><html>', 'application/pdf').is_html)
+        self.assertEqual(self.sniff(b'PK\x03\x04', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+                         .content_type, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+        self.assertEqual(self.sniff(b'PK\x03\x04', 'text/html').content_type, 'application/zip')
+        self.assertTrue(self.sniff(b'plain words', 'text/html; charset=utf-8').is_html)
+
+    def test_read_text(self):
+        sniffed = self.sniff('<html><body>Café</body></html>'.encode('utf-8'), 'text/html', peek_size=4)
+        self.assertEqual(sniffed.read_text(), '<html><body>Café</body></html>')
+
+
+def icon_course_page(resource_ids, icon='pdf'):
+    """
+    A course page listing `resource_ids` as resource activities with a file icon
+    """
+    activities = ''.join(
+        f'<li class="activity modtype_resource"><a href="/mod/resource/view.php?id={resource_id}">'
+        f'<img class="activityicon" src="/theme/image.php/boost/core/1/f/{icon}-24">Chapter {resource_id}</a></li>'
+        for resource_id in resource_ids
+    )
+    return f"<html><body><h1>Algebra</h1><ul>{activities}</ul></body></html>".encode()
+
+
+class ResourceResolverTests(SimpleTestCase):
+    def setUp(self):
+        self.history = ResolutionHistory()
+        patcher = mock.patch('scraper.resolver.resolution_history', self.history)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def crawl(self, resource_ids, resource_answer):
+        """
+        Crawl a course page of icon-marked resources; HEAD and GET on a resource get `resource_answer(url)`
+        """
+        def moodle(method, url, **kwargs):
+            if '/course/view.php' in url:
+                return moodle_response(body=icon_course_page(resource_ids), url=url)
+            return resource_answer(url)
+
+        with mock.patch('requests.Session.request', side_effect=moodle) as request:
+            events = list(moodle_auth.iter_course_pdfs('7', url=SITE, session=requests.Session()))
+        probes = [call.args[1] for call in request.call_args_list if '/mod/resource/' in call.args[1]]
+        return [value for event, value in events if event == 'file'], probes, dict(events)['done']
+
+    def test_icons_are_trusted_after_warmup(self):
+        def pdf(url):
+            return moodle_response(url=f"{SITE}/pluginfile.php/1/chapter.pdf", headers={'Content-Type': 'application/pdf'})
+
+        count = resolver.MIN_PATTERN_SAMPLES + 2
+        files, probes, stats = self.crawl(range(1, count + 1), pdf)
+
+        self.assertEqual(len(files), count)
+        self.assertEqual(len(probes), resolver.MIN_PATTERN_SAMPLES)
+        self.assertEqual([file.name for file in files[-2:]], [f"Chapter {count - 1}.pdf", f"Chapter {count}.pdf"])
+        self.assertEqual((stats['probes_issued'], stats['skipped_from_markup']), (resolver.MIN_PATTERN_SAMPLES, 2))
+
+        # Nothing is probed on the next crawl: probed resources are remembered, the others trusted to their icon
+        _, probes, stats = self.crawl(range(1, count + 1), pdf)
+        self.assertEqual(probes, [])
+        self.assertEqual((stats['skipped_from_history'], stats['skipped_from_markup']), (resolver.MIN_PATTERN_SAMPLES, 2))
+
+    def test_trusted_patterns_are_verified_now_and_then(self):
+        for _ in range(resolver.MIN_PATTERN_SAMPLES):
+            self.history.record_pattern('icon:pdf', True)
+        uses = [self.history.use_pattern('icon:pdf', warmup=True) for _ in range(resolver.VERIFY_EVERY)]
+        self.assertEqual(uses.count(False), 1)
+        self.assertFalse(uses[-1])
+
+    def test_unreliable_icons_fall_back_to_probes(self):
+        # The icon says PDF but Moodle shows a page: the link is read from the resource page
+        def page(url):
+            return moodle_response(url=url, body=b'<html><a href="/pluginfile.php/3/real.pdf">real</a></html>',
+                                   headers={'Content-Type': 'text/html'})
+
+        files, probes, _ = self.crawl(range(1, resolver.MIN_PATTERN_SAMPLES + 1), page)
+        self.assertEqual([file.url for file in files], [f"{SITE}/pluginfile.php/3/real.pdf"] * resolver.MIN_PATTERN_SAMPLES)
+        self.assertFalse(self.history.use_pattern('icon:pdf', warmup=True))
+
+        # The type shown by resourcelinkdetails needs no warmup
+        hints = {'modtype': 'resource', 'icon': None, 'details': '120.5 kb pdf document'}
+        self.assertEqual(ResourceResolver(self.history).infer(hints, f"{SITE}/mod/resource/view.php?id=99", 'Notes'),
+                         {'probe': False, 'is_file': True, 'name': 'Notes.pdf', 'pattern': 'details:pdf'})
+
+
+def folder_zip(*names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('Series/', '')
+        for name in names:
+            archive.writestr(name, f"%PDF-1.4 {name}")
+    return buffer.getvalue()
+
+
+class FolderArchiveTests(SimpleTestCase):
+    folder_url = f"{SITE}/mod/folder/view.php?id=12"
+
+    def archive_url(self, html):
+        return extractors.folder_archive_url(parse_html(html), self.folder_url)
+
+    def test_folder_archive_url(self):
+        self.assertEqual(self.archive_url(FOLDER_PAGE), f"{SITE}/mod/folder/download_folder.php?id=12")
+
+        # Without an id field the folder's own id is sent, with the other hidden fields
+        form = ('<form action="download_folder.php"><input type="hidden" name="sesskey" value="abc">'
+                '<input type="submit" name="download"></form>')
+        self.assertEqual(self.archive_url(form), f"{SITE}/mod/folder/download_folder.php?sesskey=abc&id=12")
+
+        self.assertEqual(self.archive_url('<a href="/mod/folder/download_folder.php?id=4">Download</a>'),
+                         f"{SITE}/mod/folder/download_folder.php?id=4")
+        self.assertIsNone(self.archive_url('<a href="/pluginfile.php/7/a.pdf">a.pdf</a>'))
+
+    def test_stream_zip_unpacks_folder_archives(self):
+        archive_url = f"{SITE}/mod/folder/download_folder.php?id=12"
+        files = {archive_url: folder_zip('Series/s1.pdf', 'Series/s2.pdf'), f"{SITE}/pluginfile.php/1/td1.pdf": PDF_BODY}
+        resources = [
+            {'resource_name': 'Exercises', 'resource_url': self.folder_url, 'pdf_url': archive_url, 'pdf_name': 'Exercises.zip'},
+            file_resource('td1.pdf')
+        ]
+
+        with mock.patch('requests.Session.request', side_effect=serve_files(files)):
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_zip(requests.Session(), resources))))
+
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), ['Exercises/Series/s1.pdf', 'Exercises/Series/s2.pdf', 'td1.pdf'])
+        self.assertEqual(archive.read('Exercises/Series/s2.pdf'), b'%PDF-1.4 Series/s2.pdf')
+
+
+def ajax_response(payload):
+    return moodle_response(body=json.dumps(payload).encode(), url=f"{SITE}/lib/ajax/service.php",
+                           headers={'Content-Type': 'application/json'})
+
+
+def sesskey_page(sesskey):
+    return moodle_response(body=f'<script>M.cfg = {{"sesskey":"{sesskey}"}};</script>'.encode(), url=f"{SITE}/my/")
+
+
+class MoodleAjaxTests(SimpleTestCase):
+    def client_for(self, *answers):
+        session = requests.Session()
+        patcher = mock.patch.object(session, 'request', side_effect=list(answers))
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+        return MoodleAjaxClient(session, SITE)
+
+    def test_batch_reports_each_call(self):
+        client = self.client_for(sesskey_page('key1'), ajax_response([
+            {'error': False, 'data': {'courses': []}},
+            {'error': True, 'exception': {'message': 'Course not found', 'errorcode': 'invalidrecord'}},
+        ]))
+
+        results = client.batch([('core_course_get_courses_by_field', {'field': 'id', 'value': '7'}),
+                                ('core_course_get_contents', {'courseid': 99})])
+        self.assertEqual(results, [
+            {'success': True, 'data': {'courses': []}, 'message': 'OK'},
+            {'success': False, 'data': None, 'message': 'Course not found', 'errorcode': 'invalidrecord'},
+        ])
+
+        post = self.request.call_args
+        self.assertEqual(post.args[0], 'POST')
+        self.assertEqual(post.kwargs['params'], {'sesskey': 'key1',
+                                                 'info': 'core_course_get_courses_by_field,core_course_get_contents'})
+        self.assertEqual([call['index'] for call in post.kwargs['json']], [0, 1])
+        self.assertEqual(client.batch([]), [])
+        self.assertEqual(self.request.call_count, 2)
+
+    def test_rejected_sesskey_is_read_again(self):
+        client = self.client_for(
+            sesskey_page('old'),
+            ajax_response({'error': 'Invalid sesskey', 'errorcode': 'invalidsesskey'}),
+            sesskey_page('new'),
+            ajax_response([{'error': False, 'data': {'courses': [{'id': 7}]}}])
+        )
+        self.assertEqual(client.call('core_course_get_enrolled_courses_by_timeline_classification'), {'courses': [{'id': 7}]})
+        self.assertEqual(self.request.call_args.kwargs['params']['sesskey'], 'new')
+        self.assertEqual(MoodleAjaxClient(client.session, SITE).get_sesskey(), 'new')
+
+    def test_batch_errors(self):
+        client = self.client_for(sesskey_page('key1'), ajax_response({'error': 'Log in first', 'errorcode': 'requirelogin'}))
+        with self.assertRaises(MoodleAjaxError) as raised:
+            client.batch([('core_course_get_contents', {'courseid': 7})])
+        self.assertEqual((str(raised.exception), raised.exception.errorcode), ('Log in first', 'requirelogin'))
+
+        with self.assertRaises(MoodleAjaxError) as raised:
+            self.client_for(moodle_response(url=f"{SITE}/login/index.php")).get_sesskey()
+        self.assertEqual(raised.exception.errorcode, 'requirelogin')
+
+        client = self.client_for(sesskey_page('key1'), ajax_response([
+            {'error': True, 'exception': {'message': 'No access', 'errorcode': 'nopermissions'}}]))
+        with self.assertRaises(MoodleAjaxError) as raised:
+            client.call('core_course_get_contents', courseid=7)
+        self.assertEqual(raised.exception.errorcode, 'nopermissions')
+
+
+def listing_page(number, last_page=3, show_all=False):
+    """
+    Page `number` of a category listing whose paging bar links up to `last_page` (0-based)
+    """
+    links = ''.join(f'<a href="/course/index.php?categoryid=3&amp;page={page}">{page + 1}</a>'
+                    for page in range(last_page + 1) if page != number)
+    show_all_link = '<div class="paging-showall"><a href="/course/index.php?categoryid=3&amp;perpage=all">Show all</a></div>'
+    return f'<html><h2>Page {number}</h2><div class="paging">{links}</div>{show_all_link if show_all else ""}</html>'
+
+
+class CollectPagesTests(SimpleTestCase):
+    page_url = f"{SITE}/course/index.php?categoryid=3"
+
+    def collect(self, first_page, answers):
+        def moodle(method, url, **kwargs):
+            body = answers.get(url)
+            return moodle_response(500, url=url) if body is None else moodle_response(body=body.encode(), url=url)
+
+        with mock.patch('requests.Session.request', side_effect=moodle) as request:
+            soups = pagination.collect_pages(requests.Session(), self.page_url, parse_html(first_page), max_workers=2)
+        return [soup.h2.text for soup in soups], sorted(call.args[1] for call in request.call_args_list)
+
+    def test_single_page_listing_is_complete(self):
+        self.assertEqual(self.collect('<html><h2>Page 0</h2></html>', {}), (['Page 0'], []))
+
+    def test_show_all_replaces_the_pages(self):
+        show_all_url = f"{self.page_url}&perpage=all"
+        titles, fetched = self.collect(listing_page(0, show_all=True), {show_all_url: '<html><h2>All</h2></html>'})
+        self.assertEqual((titles, fetched), (['All'], [show_all_url]))
+
+    def test_remaining_pages_are_fetched_in_order(self):
+        # Every page is fetched from the same URL template; page 2 fails and is left out
+        answers = {f"{self.page_url}&page={page}": listing_page(page) for page in (1, 3)}
+        titles, fetched = self.collect(listing_page(0, last_page=3), answers)
+        self.assertEqual(titles, ['Page 0', 'Page 1', 'Page 3'])
+        self.assertEqual(fetched, [f"{self.page_url}&page={page}" for page in (1, 2, 3)])
+
+
+MODULE_FORM = (
+    '<html><body><script>{"id":"5","name":"Upload a file","type":"upload"} {"context":{"id":"321"}}</script>'
+    '<form class="mform" action="modedit.php" method="post">'
+    '<input type="hidden" name="sesskey" value="key1"><input type="hidden" name="files" value="777">'
+    '<input type="hidden" name="course" value="7"><input type="text" name="name" value="">'
+    '<input type="checkbox" name="showdescription" value="1"><input type="checkbox" name="visible" value="1" checked>'
+    '<select name="display"><option value="0">Auto</option><option value="5" selected>Open</option></select>'
+    '<textarea name="introeditor[text]">Intro</textarea>'
+    '<input type="submit" name="submitbutton" value="Save and display">'
+    '</form></body></html>'
+)
+
+
+class UploadTests(SimpleTestCase):
+    def write_file(self, name, body):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        Path(path).write_bytes(body)
+        return path
+
+    def test_multipart_body_streams_the_file(self):
+        path = self.write_file('td1.pdf', PDF_BODY)
+        body = uploads.MultipartFileBody({'sesskey': 'key1', 'itemid': '777'}, 'repo_upload_file', path,
+                                               'TD "1".pdf', 'application/pdf', chunk_size=100)
+        chunks = list(iter(lambda: body.read(), b''))
+        body.close()
+
+        data = b''.join(chunks)
+        self.assertEqual(len(data), len(body))
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 100)
+        self.assertTrue(data.startswith(f"--{body.boundary}\r\n".encode()))
+        self.assertTrue(data.endswith(f"\r\n--{body.boundary}--\r\n".encode()))
+        self.assertIn(b'name="itemid"\r\n\r\n777\r\n', data)
+        self.assertIn(b'filename="TD 1.pdf"\r\nContent-Type: application/pdf\r\n\r\n' + PDF_BODY + b'\r\n', data)
+
+    def test_parse_module_form(self):
+        form = uploads.parse_module_form(MODULE_FORM, f"{SITE}/course/modedit.php?add=folder&course=7")
+        self.assertEqual(form['action'], f"{SITE}/course/modedit.php")
+        self.assertEqual(form['fields'], {'sesskey': 'key1', 'files': '777', 'course': '7', 'name': '', 'visible': '1',
+                                          'display': '5', 'introeditor[text]': 'Intro'})
+        self.assertEqual((form['sesskey'], form['draft_itemid'], form['repo_id'], form['context_id']),
+                         ('key1', '777', '5', '321'))
+        self.assertIsNone(uploads.parse_module_form('<html><form action="/search"></form></html>', SITE))
+
+    def test_files_are_uploaded_into_one_module(self):
+        paths = [self.write_file('td1.pdf', PDF_BODY), self.write_file('td2.pdf', b'%PDF-1.4 td2')]
+        uploaded = {}
+        saved = []
+
+        def moodle(method, url, **kwargs):
+            if 'modedit.php?add=' in url:
+                return moodle_response(body=MODULE_FORM.encode(), url=url)
+            if 'repository_ajax.php' in url:
+                data = b''.join(iter(lambda: kwargs['data'].read(), b''))
+                uploaded[re.search(rb'filename="([^"]+)"', data).group(1).decode()] = data
+                return moodle_response(body=b'{"url": "draftfile.php"}', url=url)
+            saved.append(kwargs['data'])
+            return moodle_response(url=f"{SITE}/course/view.php?id=7")
+
+        with mock.patch('requests.Session.request', side_effect=moodle):
+            result = uploads.upload_files_to_course('7', paths, url=SITE, session=requests.Session(), name='Series')
+
+        self.assertTrue(result['success'], result['message'])
+        self.assertEqual(result['message'], 'Uploaded 2 file(s) to course 7 as a folder')
+        self.assertEqual(sorted(uploaded), ['td1.pdf', 'td2.pdf'])
+        self.assertTrue(all(b'name="itemid"\r\n\r\n777\r\n' in data for data in uploaded.values()))
+        self.assertEqual(len(saved), 1)
+        self.assertEqual((saved[0]['name'], saved[0]['files'], saved[0]['sesskey']), ('Series', '777', 'key1'))
+
+    def test_upload_needs_a_module_form(self):
+        path = self.write_file('td1.pdf', PDF_BODY)
+        with mock.patch('requests.Session.request', return_value=moodle_response(url=f"{SITE}/login/index.php")):
+            result = uploads.upload_files_to_course('7', [path], url=SITE, session=requests.Session())
+        self.assertEqual((result['success'], result['message']), (False, 'Not logged in or session expired'))
+
+        with mock.patch('requests.Session.request', side_effect=lambda method, url, **kwargs: moodle_response(
+                body=b'<html>No permission</html>', url=url)):
+            result = uploads.upload_files_to_course('7', [path], url=SITE, session=requests.Session())
+        self.assertFalse(result['success'])
+        self.assertIn('Could not open the resource form', result['message'])
@@ -0,0 +1,309 @@
+import logging
+import mimetypes
+import os
+import re
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from . import fetch
+from .moodle_auth import get_authenticated_session
+from .parsing import parse_html
+
+logger = logging.getLogger(__name__)
+
+# Repository used when the form does not reveal the ID of the upload repository
+DEFAULT_UPLOAD_REPO_ID = '4'
+
+UPLOAD_REPO_PATTERN = re.compile(r'"id"\s*:\s*"?(\d+)"?\s*,\s*"name"\s*:\s*"[^"]*"\s*,\s*"type"\s*:\s*"upload"')
+CONTEXT_ID_PATTERN = re.compile(r'"context"\s*:\s*\{\s*"id"\s*:\s*"?(\d+)"?')
+
+
+class MultipartFileBody:
+    """
+    multipart/form-data body that reads the file from disk while it is sent
+
+    requests streams any file-like body with a known length chunk by chunk, so
+    the file is never loaded into memory. `__len__` gives the exact body size
+    for the Content-Length header.
+    """
+
+    def __init__(self, fields, file_field, file_path, file_name, content_type, chunk_size=64 * 1024):
+        self.boundary = f"----MoodleUpload{secrets.token_hex(16)}"
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.chunk_size = chunk_size
+        self._file_path = file_path
+        self._file = None
+
+        preamble = []
+        for name, value in fields.items():
+            preamble.append(
+                f"--{self.boundary}\r\n"
+                f"Content-Disposition: form-data; name=\"{name}\"\r\n\r\n"
+                f"{value}\r\n"
+            )
+        preamble.append(
+            f"--{self.boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{file_field}\"; filename=\"{file_name.replace(chr(34), '')}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n"
+        )
+
+        self._parts = [''.join(preamble).encode('utf-8'), None, f"\r\n--{self.boundary}--\r\n".encode('utf-8')]
+        self._length = len(self._parts[0]) + os.path.getsize(file_path) + len(self._parts[2])
+        self._part = 0
+        self._offset = 0
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.chunk_size
+
+        while self._part < len(self._parts):
+            if self._part == 1:
+                if self._file is None:
+                    self._file = open(self._file_path, 'rb')
+                data = self._file.read(size)
+                if data:
+                    return data
+                self._file.close()
+            else:
+                data = self._parts[self._part][self._offset:self._offset + size]
+                if data:
+                    self._offset += len(data)
+                    return data
+            self._part += 1
+            self._offset = 0
+
+        return b''
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def parse_module_form(html, form_url):
+    """
+    Read the state of a Moodle "add resource/folder" form needed to upload into it
+
+    Args:
+        html (str): The modedit.php page
+        form_url (str): The URL of the page
+
+    Returns:
+        dict: `action`, `fields` (every named input with its default value),
+            `sesskey`, `draft_itemid` (the file manager's draft area), `repo_id`
+            and `context_id`, or None if the page has no module form
+    """
+    soup = parse_html(html)
+    form = soup.select_one('form.mform[action*="modedit.php"]') or soup.select_one('form[action*="modedit.php"]')
+    if form is None:
+        return None
+
+    fields = {}
+    for form_input in form.select('input[name]'):
+        input_type = (form_input.get('type') or 'text').lower()
+        if input_type in ('submit', 'button', 'file', 'image'):
+            continue
+        if input_type in ('checkbox', 'radio') and not form_input.has_attr('checked'):
+            continue
+        fields[form_input['name']] = form_input.get('value', '')
+    for select in form.select('select[name]'):
+        option = select.select_one('option[selected]') or select.select_one('option')
+        if option is not None:
+            fields[select['name']] = option.get('value', option.text)
+    for textarea in form.select('textarea[name]'):
+        fields[textarea['name']] = textarea.text
+
+    repo_match = UPLOAD_REPO_PATTERN.search(html)
+    context_match = CONTEXT_ID_PATTERN.search(html)
+
+    return {
+        'action': urljoin(form_url, form.get('action')),
+        'fields': fields,
+        'sesskey': fields.get('sesskey'),
+        'draft_itemid': fields.get('files'),
+        'repo_id': repo_match.group(1) if repo_match else DEFAULT_UPLOAD_REPO_ID,
+        'context_id': context_match.group(1) if context_match else None
+    }
+
+
+def upload_to_draft_area(session, url, form_state, file_path, file_name, timeout=300):
+    """
+    Upload one file into the draft area of a module form, streaming it from disk
+
+    Args:
+        session (requests.Session): The authenticated session
+        url (str): The Moodle URL
+        form_state (dict): Form state returned by parse_module_form
+        file_path (str): Path to the file
+        file_name (str): The name the file gets in Moodle
+        timeout (int): Timeout in seconds for the upload
+
+    Returns:
+        dict: Result containing success status and message
+    """
+    content_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    body = MultipartFileBody({
+        'sesskey': form_state['sesskey'],
+        'repo_id': form_state['repo_id'],
+        'itemid': form_state['draft_itemid'],
+        'author': 'API Upload',
+        'title': file_name,
+        'savepath': '/',
+        'ctx_id': form_state['context_id'] or ''
+    }, 'repo_upload_file', file_path, file_name, content_type)
+
+    try:
+        logger.info(f"Uploading {file_name} ({len(body)} bytes, {content_type})")
+        upload_response = fetch.request(
+            session, 'POST', f"{url}/repository/repository_ajax.php?action=upload", 'resource',
+            data=body,
+            headers={'Content-Type': body.content_type},
+            timeout=timeout
+        )
+    finally:
+        body.close()
+
+    if upload_response.status_code != 200:
+        return {
+            'success': False,
+            'message': f"File upload failed. Status code: {upload_response.status_code}"
+        }
+
+    try:
+        upload_result = upload_response.json()
+    except ValueError:
+        return {
+            'success': False,
+            'message': "Failed to parse upload response"
+        }
+
+    if 'error' in upload_result:
+        return {
+            'success': False,
+            'message': f"File upload error: {upload_result['error']}"
+        }
+
+    return {
+        'success': True,
+        'message': f"Uploaded {file_name}"
+    }
+
+
+def upload_files_to_course(course_id, file_paths, username=None, password=None, url='https://elearning.univ-bba.dz',
+                           session=None, module=None, name=None, file_names=None, section=0, max_workers=4):
+    """
+    Upload several files to a Moodle course as a single resource or folder
+
+    The session is authenticated once and the module form is fetched once. All
+    files are then uploaded in parallel into the form's draft area, streamed
+    from disk, and the module is saved with a single form submission.
+
+    Args:
+        course_id (str): The course ID to upload to
+        file_paths (list): Paths of the files to upload
+        username (str, optional): The username for Moodle
+        password (str, optional): The password for Moodle
+        url (str): The Moodle URL
+        session (requests.Session, optional): An authenticated session to reuse instead of logging in
+        module (str, optional): `resource` or `folder`; defaults to a resource for
+            one file and a folder for several
+        name (str, optional): Name of the module (defaults to the first file name)
+        file_names (list, optional): Names to use for the files (defaults to their basenames)
+        section (int): Course section to add the module to
+        max_workers (int): Maximum number of files uploaded at the same time
+
+    Returns:
+        dict: Result containing success status, message and one result per file
+    """
+    try:
+        file_paths = list(file_paths)
+        if not file_paths:
+            return {
+                'success': False,
+                'message': 'No files to upload',
+                'files': []
+            }
+
+        file_names = list(file_names or [os.path.basename(file_path) for file_path in file_paths])
+        module = module or ('resource' if len(file_paths) == 1 else 'folder')
+
+        # Login to Moodle unless we already have a session
+        session, login_error = get_authenticated_session(username, password, url, session)
+
+        if session is None:
+            return {
+                'success': False,
+                'message': login_error,
+                'files': []
+            }
+
+        # Open the "add module" form directly instead of walking the course page and activity chooser
+        form_url = f"{url}/course/modedit.php?add={module}&type=&course={course_id}&section={section}&return=0&sr=0"
+        form_response = fetch.get(session, form_url, 'page')
+
+        if 'login/index.php' in form_response.url:
+            return {
+                'success': False,
+                'message': "Not logged in or session expired",
+                'files': []
+            }
+
+        form_state = parse_module_form(form_response.text, form_response.url) if form_response.status_code == 200 else None
+
+        if form_state is None or not form_state['sesskey'] or not form_state['draft_itemid']:
+            return {
+                'success': False,
+                'message': f"Could not open the {module} form. You might not have permission to add resources.",
+                'files': []
+            }
+
+        # Upload every file into the same draft area in parallel
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(file_paths)))) as executor:
+            results = list(executor.map(
+                lambda item: upload_to_draft_area(session, url, form_state, *item),
+                zip(file_paths, file_names)
+            ))
+
+        file_results = [dict(result, name=file_name) for result, file_name in zip(results, file_names)]
+        failed = [result for result in file_results if not result['success']]
+
+        if failed:
+            return {
+                'success': False,
+                'message': f"{len(failed)} of {len(file_paths)} files failed to upload: {failed[0]['message']}",
+                'files': file_results
+            }
+
+        # Save the module once, with the form defaults and the filled draft area
+        form_data = dict(form_state['fields'])
+        form_data.update({
+            'name': name or os.path.splitext(file_names[0])[0],
+            'files': form_state['draft_itemid'],
+            'submitbutton2': 'Save and return to course'
+        })
+        form_data.setdefault('introeditor[text]', '')
+
+        save_response = fetch.request(session, 'POST', form_state['action'], 'page', data=form_data)
+
+        if save_response.status_code != 200 or 'modedit.php' in save_response.url:
+            return {
+                'success': False,
+                'message': f"Failed to save {module}. Status code: {save_response.status_code}",
+                'files': file_results
+            }
+
+        return {
+            'success': True,
+            'message': f"Uploaded {len(file_paths)} file(s) to course {course_id} as a {module}",
+            'files': file_results
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error during file upload: {str(e)}")
+        return {
+            'success': False,
+            'message': f"Unexpected error: {str(e)}",
+            'files': []
+        }
@@ -1,8 +1,9 @@
 from django.urls import path
 from .views import (
     CourseListAPIView, DepartmentListAPIView, LinkExtractAPIView,
-    CategoryCoursesAPIView, CourseResourcesAPIView, AuthenticatedResourcesAPIView,
-    MoodleCoursesAPIView, MoodleLoginAPIView, MoodleCoursePDFsAPIView
+    CategoryCoursesAPIView, CategoryTreeAPIView, CourseResourcesAPIView, AuthenticatedResourcesAPIView,
+    MoodleCoursesAPIView, MoodleLoginAPIView, MoodleCoursePDFsAPIView, ChangesAPIView,
+    JobsAPIView, JobDetailAPIView, JobEventsAPIView, JobCancelAPIView, JobDownloadAPIView
 )
 from .mock_views import MockAuthResourcesAPIView
 
@@ -11,6 +12,7 @@ urlpatterns = [
     path('departments/', DepartmentListAPIView.as_view(), name='department-list'),
     path('links/', LinkExtractAPIView.as_view(), name='link-extract'),
     path('category/<int:category_id>/courses/', CategoryCoursesAPIView.as_view(), name='category-courses'),
+    path('tree/', CategoryTreeAPIView.as_view(), name='category-tree'),
     path('course/<int:course_id>/resources/', CourseResourcesAPIView.as_view(), name='course-resources'),
     path('resources/', CourseResourcesAPIView.as_view(), name='course-resources-post'),
     path('auth-resources/', AuthenticatedResourcesAPIView.as_view(), name='authenticated-resources'),
@@ -19,4 +21,10 @@ urlpatterns = [
     path('moodle-login/', MoodleLoginAPIView.as_view(), name='moodle-login'),
     path('moodle-pdfs/', MoodleCoursePDFsAPIView.as_view(), name='moodle-pdfs'),
     path('moodle-pdfs/<str:course_id>/', MoodleCoursePDFsAPIView.as_view(), name='moodle-pdfs-detail'),
+    path('changes/', ChangesAPIView.as_view(), name='changes'),
+    path('jobs/', JobsAPIView.as_view(), name='jobs'),
+    path('jobs/<str:job_id>/', JobDetailAPIView.as_view(), name='job-detail'),
+    path('jobs/<str:job_id>/events/', JobEventsAPIView.as_view(), name='job-events'),
+    path('jobs/<str:job_id>/cancel/', JobCancelAPIView.as_view(), name='job-cancel'),
+    path('jobs/<str:job_id>/download/', JobDownloadAPIView.as_view(), name='job-download'),
 ]
@@ -1,10 +1,16 @@
 import requests
-from bs4 import BeautifulSoup
 import logging
 import time
 from urllib.parse import urljoin
 import re
 
+from . import fetch, parse_pool
+from .extractors import course_resource_links, resource_page_pdf
+from .pagination import collect_pages, listing_url
+from .parsing import parse_html
+from .records import Link, ResourceLink
+from .resolver import ResourceResolver
+
 logger = logging.getLogger(__name__)
 
 def scrape_elearning_courses():
@@ -34,7 +40,7 @@ def scrape_elearning_courses():
         logger.info(f"Response status: {response.status_code}, Content length: {len(response.text)}")
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = parse_html(response.text)
 
         # If login is required, we might see a login form
         login_form = soup.select_one('form#login')
@@ -182,7 +188,7 @@ def extract_departments():
         logger.info(f"Response status: {response.status_code}, Content length: {len(response.text)}")
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = parse_html(response.text)
 
         # If login is required, we might see a login form
         login_form = soup.select_one('form#login')
@@ -253,7 +259,7 @@ def extract_aalinks(url):
         url (str): The URL to scrape for links.
 
     Returns:
-        list: A list of dictionaries containing link information (text and href).
+        list: A list of Link records (text, href and, when found, course_id).
     """
     # Add headers to mimic a browser request
     headers = {
@@ -264,38 +270,46 @@ def extract_aalinks(url):
         'Upgrade-Insecure-Requests': '1',
     }
 
+    # Category listings are paginated, ask for every course on one page
+    is_listing = '/course/index.php' in url
+    page_url = listing_url(url) if is_listing else url
+
     try:
+        session = requests.Session()
+        session.headers.update(headers)
+
         # Fetch the webpage
-        response = requests.get(url, headers=headers, timeout=15)
+        response = session.get(page_url, timeout=15)
         response.raise_for_status()  # Raise an exception for HTTP errors
 
         # Log the response status and content length for debugging
         logger.info(f"Response status: {response.status_code}, Content length: {len(response.text)}")
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = parse_html(response.text)
 
         # If login is required, we might see a login form
         login_form = soup.select_one('form#login')
         if login_form:
             logger.warning("Login form detected. Authentication might be required.")
             # For demonstration, return a message indicating login required
-            return [{
-                'text': 'Authentication Required',
-                'href': url,
-                'error': 'Login is required to access this page.'
-            }]
+            return [Link(
+                text='Authentication Required',
+                href=url,
+                error='Login is required to access this page.'
+            )]
 
-        # Find all links with the 'aalink' class
-        aalinks = soup.select('a.aalink')
+        # Find all links with the 'aalink' class, on every page of a paginated listing
+        pages = collect_pages(session, response.url, soup, timeout=15) if is_listing else [soup]
+        aalinks = [link for page_soup in pages for link in page_soup.select('a.aalink')]
 
         if not aalinks:
             logger.warning(f"No links with 'aalink' class found at {url}")
-            return [{
-                'text': 'No Links Found',
-                'href': url,
-                'error': "No links with 'aalink' class found on the page."
-            }]
+            return [Link(
+                text='No Links Found',
+                href=url,
+                error="No links with 'aalink' class found on the page."
+            )]
 
         # Extract information from each link
         links_data = []
@@ -315,36 +329,31 @@ def extract_aalinks(url):
                 except (IndexError, ValueError):
                     pass
 
-            # Create a link dictionary
-            link_data = {
-                'text': text,
-                'href': href if href.startswith('http') else urljoin(url, href)
-            }
-
-            # Add course ID if available
-            if course_id:
-                link_data['course_id'] = course_id
-
-            links_data.append(link_data)
+            # Create a link record, with the course ID if available
+            links_data.append(Link(
+                text=text,
+                href=href if href.startswith('http') else urljoin(url, href),
+                course_id=course_id or None
+            ))
 
         return links_data
 
     except requests.RequestException as e:
         logger.error(f"Error fetching data from {url}: {e}")
         # Return a message about the error
-        return [{
-            'text': 'Error Fetching Data',
-            'href': url,
-            'error': f'Error fetching data from the website: {str(e)}'
-        }]
+        return [Link(
+            text='Error Fetching Data',
+            href=url,
+            error=f'Error fetching data from the website: {str(e)}'
+        )]
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         # Return a message about the error
-        return [{
-            'text': 'Unexpected Error',
-            'href': url,
-            'error': f'An unexpected error occurred: {str(e)}'
-        }]
+        return [Link(
+            text='Unexpected Error',
+            href=url,
+            error=f'An unexpected error occurred: {str(e)}'
+        )]
 
 
 def login_to_elearning(username, password):
@@ -384,7 +393,7 @@ def login_to_elearning(username, password):
         response.raise_for_status()
 
         # Parse the login page
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = parse_html(response.text)
 
         # Find the login token
         login_token = soup.select_one('input[name="logintoken"]')
@@ -436,7 +445,7 @@ def extract_course_resources(course_url, session=None):
         session (requests.Session, optional): A session object with authentication cookies.
 
     Returns:
-        list: A list of dictionaries containing resource information.
+        list: A list of ResourceLink records.
     """
     # Add headers to mimic a browser request
     headers = {
@@ -453,81 +462,53 @@ def extract_course_resources(course_url, session=None):
     try:
         # Fetch the course page using the session if provided, otherwise use a regular request
         if session:
-            response = session.get(course_url, timeout=timeout)
+            response = fetch.get(session, course_url, 'page', timeout=timeout)
         else:
-            response = requests.get(course_url, headers=headers, timeout=timeout)
+            response = fetch.get(requests, course_url, 'page', headers=headers, timeout=timeout)
         response.raise_for_status()
 
         # Log the response status and content length for debugging
         logger.info(f"Response status: {response.status_code}, Content length: {len(response.text)}")
 
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # Parse the HTML content, in a parser process when the pool is enabled
+        page_status, resource_links = parse_pool.run(course_resource_links, response.text)
 
         # Check for login form
-        login_form = soup.select_one('form#login')
-        if login_form:
+        if page_status == 'login':
             logger.warning("Login form detected. Authentication might be required.")
-            return [{
-                'resource_name': 'Authentication Required',
-                'resource_url': course_url,
-                'pdf_url': None,
-                'error': 'Login is required to access the course page.'
-            }]
-
-        # Try different selectors for resource links
-        resource_links = (
-            soup.select('a.aalink[href*="resource/view.php"]') or
-            soup.select('a[href*="resource/view.php"]') or
-            soup.select('a[onclick*="resource/view.php"]') or
-            soup.select('a[href*="pluginfile.php"]') or
-            soup.select('a[href*=".pdf"]')
-        )
-
-        # Also look for any links with specific text that might indicate downloadable files
-        # BeautifulSoup doesn't support :contains() selector, so we need to filter manually
-        if not resource_links:
-            all_links = soup.find_all('a', href=True)
-            file_keywords = ['fichier', 'file', 'document', 'pdf', 'download', 'télécharger']
-
-            filtered_links = []
-            for link in all_links:
-                link_text = link.text.lower()
-                # Check if any of the keywords are in the link text
-                if any(keyword in link_text for keyword in file_keywords):
-                    filtered_links.append(link)
-
-            if filtered_links:
-                resource_links = filtered_links
+            return [ResourceLink(
+                resource_name='Authentication Required',
+                resource_url=course_url,
+                pdf_url=None,
+                error='Login is required to access the course page.'
+            )]
 
         # If no resource links found, try to extract any useful information
         if not resource_links:
             logger.warning(f"No resource links found at {course_url}")
 
             # Look for any content that might indicate resources
-            content_section = soup.select_one('.course-content')
-            if content_section:
+            if page_status == 'content':
                 logger.info("Found course content section, but no resource links.")
-                return [{
-                    'resource_name': 'Course Content Found',
-                    'resource_url': course_url,
-                    'pdf_url': None,
-                    'error': 'Course content found, but no resource links detected. The course might use a different format for resources.'
-                }]
-
-            return [{
-                'resource_name': 'No Resources Found',
-                'resource_url': course_url,
-                'pdf_url': None,
-                'error': 'No resource links found on the course page.'
-            }]
+                return [ResourceLink(
+                    resource_name='Course Content Found',
+                    resource_url=course_url,
+                    pdf_url=None,
+                    error='Course content found, but no resource links detected. The course might use a different format for resources.'
+                )]
+
+            return [ResourceLink(
+                resource_name='No Resources Found',
+                resource_url=course_url,
+                pdf_url=None,
+                error='No resource links found on the course page.'
+            )]
 
         resources = []
+        resolver = ResourceResolver()
 
         # Process each resource link
-        for link in resource_links:
-            resource_url = link.get('href')
-            onclick = link.get('onclick')
+        for resource_url, onclick, resource_name, hints in resource_links:
 
             # Try to extract URL from onclick attribute if href is not available
             if not resource_url and onclick:
@@ -538,8 +519,6 @@ def extract_course_resources(course_url, session=None):
                     if '&amp;' in resource_url:
                         resource_url = resource_url.split('&amp;')[0]
 
-            resource_name = link.text.strip()
-
             # Skip empty links
             if not resource_url or not resource_name:
                 continue
@@ -548,138 +527,109 @@ def extract_course_resources(course_url, session=None):
             if not resource_url.startswith('http'):
                 resource_url = urljoin(course_url, resource_url)
 
-            # Create a resource entry
-            resource_data = {
-                'resource_name': resource_name,
-                'resource_url': resource_url,
-                'pdf_url': None
-            }
-
             # If the URL already points to a PDF, use it directly
             if resource_url.lower().endswith('.pdf'):
-                resource_data['pdf_url'] = resource_url
-                resource_data['pdf_name'] = resource_name
-                resources.append(resource_data)
+                resources.append(ResourceLink(resource_name=resource_name, resource_url=resource_url,
+                                              pdf_url=resource_url, pdf_name=resource_name))
+                continue
+
+            # Use the course page markup and earlier crawls before probing the link
+            resolution = resolver.infer(hints, resource_url, resource_name)
+
+            if not resolution['probe'] and resolution['is_file']:
+                resources.append(ResourceLink(resource_name=resource_name, resource_url=resource_url,
+                                              pdf_url=resource_url, pdf_name=resolution['name']))
+                logger.info(f"Resolved resource without probing: {resource_url}")
                 continue
 
+            # The file found for the resource, or why none was found
+            pdf_url = pdf_name = error = None
+
             # Try to fetch the resource page to find PDF links
             try:
                 # First, try a HEAD request to check if it's a direct download
-                if session:
-                    head_response = session.head(resource_url, timeout=timeout, allow_redirects=True)
-                else:
-                    head_response = requests.head(resource_url, headers=headers, timeout=timeout, allow_redirects=True)
-
-                # Check if it's a direct download based on Content-Type or Content-Disposition
-                content_type = head_response.headers.get('Content-Type', '')
-                content_disposition = head_response.headers.get('Content-Disposition', '')
-
-                # If it's a PDF or has a download disposition, use it directly
-                if ('application/pdf' in content_type or
-                    'application/octet-stream' in content_type or
-                    'attachment' in content_disposition or
-                    'filename=' in content_disposition):
-
-                    # This is likely a direct download
-                    resource_data['pdf_url'] = resource_url
-
-                    # Try to get the filename from Content-Disposition
-                    if 'filename=' in content_disposition:
-                        import re
-                        filename_match = re.search(r'filename="?([^"]+)"?', content_disposition)
-                        if filename_match:
-                            resource_data['pdf_name'] = filename_match.group(1)
-                        else:
-                            resource_data['pdf_name'] = resource_name
+                if resolution['probe']:
+                    if session:
+                        head_response = fetch.head(session, resource_url, timeout=timeout, allow_redirects=True)
                     else:
-                        resource_data['pdf_name'] = resource_name
+                        # The requests module sends the anonymous probe, with the browser headers
+                        head_response = fetch.head(requests, resource_url, headers=headers, timeout=timeout, allow_redirects=True)
+
+                    # Check if it's a direct download based on Content-Type or Content-Disposition
+                    content_type = head_response.headers.get('Content-Type', '')
+                    content_disposition = head_response.headers.get('Content-Disposition', '')
+
+                    # If it's a PDF or has a download disposition, use it directly
+                    if ('application/pdf' in content_type or
+                        'application/octet-stream' in content_type or
+                        'attachment' in content_disposition or
+                        'filename=' in content_disposition):
+
+                        # This is likely a direct download
+                        pdf_name = resource_name
+
+                        # Try to get the filename from Content-Disposition
+                        if 'filename=' in content_disposition:
+                            filename_match = re.search(r'filename="?([^"]+)"?', content_disposition)
+                            if filename_match:
+                                pdf_name = filename_match.group(1)
+
+                        resolver.record(resource_url, True, pdf_name, head_response.url, content_type, resolution['pattern'])
+                        logger.info(f"Found direct download: {resource_url} with content type {content_type}")
+                        resources.append(ResourceLink(resource_name=resource_name, resource_url=resource_url,
+                                                      pdf_url=resource_url, pdf_name=pdf_name))
+                        continue
 
-                    logger.info(f"Found direct download: {resource_url} with content type {content_type}")
-                    continue
+                    # Remember that this resource has to be resolved from its page
+                    resolver.record(resource_url, False, final_url=head_response.url, content_type=content_type, pattern=resolution['pattern'])
 
                 # If not a direct download, fetch the full page
                 if session:
-                    resource_response = session.get(resource_url, timeout=timeout)
+                    resource_response = fetch.get(session, resource_url, 'resource', timeout=timeout)
                 else:
-                    resource_response = requests.get(resource_url, headers=headers, timeout=timeout)
+                    resource_response = fetch.get(requests, resource_url, 'resource', headers=headers, timeout=timeout)
                 resource_response.raise_for_status()
 
                 # Log the response status and content length for debugging
                 logger.info(f"Resource response status: {resource_response.status_code}, Content length: {len(resource_response.text)}")
 
                 # Parse the resource page
-                resource_soup = BeautifulSoup(resource_response.text, 'html.parser')
-
-                # Look for PDF links with different selectors
-                pdf_links = (
-                    resource_soup.select('a[href*=".pdf"]') or
-                    resource_soup.select('a[href*="pluginfile.php"]') or
-                    resource_soup.select('iframe[src*=".pdf"]') or
-                    resource_soup.select('object[data*=".pdf"]') or
-                    resource_soup.select('embed[src*=".pdf"]')
-                )
-
-                if pdf_links:
-                    # Get the first PDF link
-                    pdf_element = pdf_links[0]
-                    pdf_url = pdf_element.get('href') or pdf_element.get('src') or pdf_element.get('data')
-
-                    if not pdf_url:
-                        continue
+                pdf_kind, pdf_url, pdf_name = parse_pool.run(resource_page_pdf, resource_response.text)
+
+                # A PDF element without a URL leaves nothing to download
+                if pdf_kind == 'skip':
+                    continue
 
+                if pdf_kind == 'file':
                     if not pdf_url.startswith('http'):
                         pdf_url = urljoin(resource_url, pdf_url)
-
-                    resource_data['pdf_url'] = pdf_url
-                    resource_data['pdf_name'] = pdf_element.text.strip() if pdf_element.text.strip() else resource_name
-                else:
-                    # If no PDF links found, check if the page itself is a redirect to a PDF
-                    meta_refresh = resource_soup.select_one('meta[http-equiv="refresh"]')
-                    if meta_refresh:
-                        content = meta_refresh.get('content', '')
-                        if 'url=' in content.lower():
-                            redirect_url = content.split('url=')[1].strip()
-                            if redirect_url.lower().endswith('.pdf') or 'pluginfile.php' in redirect_url:
-                                if not redirect_url.startswith('http'):
-                                    redirect_url = urljoin(resource_url, redirect_url)
-                                resource_data['pdf_url'] = redirect_url
-                                resource_data['pdf_name'] = resource_name
-
-                    # If still no PDF links found, check for download buttons
-                    if not resource_data.get('pdf_url'):
-                        # Look for download buttons or links
-                        download_links = resource_soup.find_all('a', href=True)
-                        for link in download_links:
-                            link_text = link.text.lower()
-                            if 'download' in link_text or 'télécharger' in link_text:
-                                download_url = link.get('href')
-                                if download_url:
-                                    if not download_url.startswith('http'):
-                                        download_url = urljoin(resource_url, download_url)
-                                    resource_data['pdf_url'] = download_url
-                                    resource_data['pdf_name'] = link.text.strip() if link.text.strip() else resource_name
-                                    break
+                    pdf_name = pdf_name or resource_name
             except Exception as e:
                 logger.error(f"Error fetching resource page {resource_url}: {e}")
-                resource_data['error'] = f"Error fetching resource page: {str(e)}"
+                pdf_url = pdf_name = None
+                error = f"Error fetching resource page: {str(e)}"
 
-            resources.append(resource_data)
+            resources.append(ResourceLink(resource_name=resource_name, resource_url=resource_url,
+                                          pdf_url=pdf_url, pdf_name=pdf_name, error=error))
+
+        probe_stats = resolver.stats()
+        logger.info(f"Resource probes issued: {probe_stats['probes_issued']}, skipped: {probe_stats['probes_skipped']}")
 
         return resources
 
     except requests.RequestException as e:
         logger.error(f"Error fetching data from {course_url}: {e}")
-        return [{
-            'resource_name': 'Error Fetching Data',
-            'resource_url': course_url,
-            'pdf_url': None,
-            'error': f'Error fetching data from the course page: {str(e)}'
-        }]
+        return [ResourceLink(
+            resource_name='Error Fetching Data',
+            resource_url=course_url,
+            pdf_url=None,
+            error=f'Error fetching data from the course page: {str(e)}'
+        )]
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
-        return [{
-            'resource_name': 'Unexpected Error',
-            'resource_url': course_url,
-            'pdf_url': None,
-            'error': f'An unexpected error occurred: {str(e)}'
-        }]
+        return [ResourceLink(
+            resource_name='Unexpected Error',
+            resource_url=course_url,
+            pdf_url=None,
+            error=f'An unexpected error occurred: {str(e)}'
+        )]
@@ -2,48 +2,661 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import JSONParser
-from django.http import FileResponse, HttpResponse
-import requests
-import io
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+import hashlib
+import logging
 import os
+import queue
+import re
+import threading
+import time
+from itertools import chain
+from urllib.parse import urlparse, parse_qs
 from .utils_improved import scrape_elearning_courses, extract_departments, extract_aalinks, extract_course_resources, login_to_elearning
-from .serializers import CourseSerializer, DepartmentSerializer, LinkSerializer, ResourceSerializer
-from .moodle_auth import moodle_login, get_course_pdfs, get_category_courses
+from .moodle_auth import moodle_login, get_course_pdfs, get_category_courses, iter_course_pdfs, session_from_cookies
+from .session_store import SessionStore, DEFAULT_MAX_TOKENS, DEFAULT_TOKEN_TTL
+from .downloads import can_download, open_resource_download, parse_files_selector, select_resources, stream_zip
+from .file_cache import FileCache, FileRange, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_SIZE, DEFAULT_CACHE_TTL
+from .moodle_ajax import get_enrolled_courses
+from .access import verified_courses, verify_course_access
+from .caching import get_or_refresh, invalidate, peek, refresh_now
+from .category_tree import ROOT_ID, crawl_category_tree, nest_category_tree
+from . import catalogue, db_writer
+from .records import CourseFile, Link, ResourceLink
+from .cursors import decode_cursor, encode_cursor, next_cursor, page_request, parse_fields, parse_limit, select_fields
+from .renderers import (
+    EVENT_STREAM_MEDIA_TYPE, EVENT_STREAM_RENDERER_CLASSES, NDJSON_MEDIA_TYPE, STREAMING_RENDERER_CLASSES, ndjson_line,
+    sse_message
+)
+from .jobs import DEFAULT_JOB_DIR, DEFAULT_JOB_TTL, FINAL_EVENTS, JobStore, crawl_course, export_course
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MOODLE_URL = 'https://elearning.univ-bba.dz'
+
+# Item fields of the course listings, for `fields` selectors; the other listings use their record's fields
+COURSE_FIELDS = ('name', 'url', 'image', 'summary', 'teachers')
+CATALOGUE_COURSE_FIELDS = ('id', 'name', 'shortname', 'url', 'category_id')
+
+# Pool of authenticated Moodle sessions handed out by MoodleLoginAPIView
+session_store = SessionStore(
+    ttl=getattr(settings, 'MOODLE_TOKEN_TTL', DEFAULT_TOKEN_TTL),
+    max_entries=getattr(settings, 'MOODLE_MAX_TOKENS', DEFAULT_MAX_TOKENS)
+)
+
+# Background crawls and exports followed over Server-Sent Events
+job_store = JobStore(ttl=getattr(settings, 'MOODLE_JOB_TTL', DEFAULT_JOB_TTL))
+
+# Downloaded course files, served from disk on repeat downloads
+file_cache = FileCache(
+    directory=getattr(settings, 'MOODLE_FILE_CACHE_DIR', DEFAULT_CACHE_DIR),
+    ttl=getattr(settings, 'MOODLE_FILE_CACHE_TTL', DEFAULT_CACHE_TTL),
+    max_size=getattr(settings, 'MOODLE_FILE_CACHE_MAX_SIZE', DEFAULT_CACHE_MAX_SIZE)
+)
+
+
+def get_token_entry(request):
+    """
+    Return the pooled session entry for the API token sent with the request
+
+    The token is read from the `X-Moodle-Token` header, or from an
+    `Authorization: Token <token>` header.
+
+    Args:
+        request: The incoming DRF request
+
+    Returns:
+        dict: The session store entry, or None if no valid token was sent
+    """
+    token = request.headers.get('X-Moodle-Token')
+
+    if not token:
+        authorization = request.headers.get('Authorization', '')
+        if authorization.startswith('Token '):
+            token = authorization[len('Token '):].strip()
+
+    return session_store.get(token)
+
+
+def cached_file_response(request, entry):
+    """
+    Serve a file from disk without reading it into Python
+
+    Full downloads are a FileResponse over the open file, which the WSGI server
+    can pass to sendfile. When MOODLE_SENDFILE_BACKEND is set, the body is left
+    to the front-end server through X-Sendfile or X-Accel-Redirect. Conditional
+    requests are answered from the ETag, and single byte ranges get a 206.
+
+    Args:
+        request: The incoming request
+        entry (dict): File entry from FileCache or describe_file
+
+    Returns:
+        HttpResponse: The file, a 304, a 206 partial response or a 416
+    """
+    etag = f'"{entry["etag"]}"'
+    size = entry['size']
+    content_type = entry['content_type']
+
+    # If-None-Match compares weakly: a W/ tag, as compression middleware may send, still matches
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or
+                          etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    backend = getattr(settings, 'MOODLE_SENDFILE_BACKEND', None)
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+
+    if backend:
+        # The front-end server handles Range requests for internal redirects
+        response = HttpResponse(content_type=content_type)
+        if backend == 'x-accel-redirect':
+            prefix = getattr(settings, 'MOODLE_SENDFILE_PREFIX', '/protected/moodle_files/')
+            response['X-Accel-Redirect'] = prefix + os.path.basename(entry['path'])
+        else:
+            response['X-Sendfile'] = entry['path']
+    else:
+        if range_header and (not if_range or if_range.strip() == etag):
+            range_match = re.fullmatch(r'bytes=(\d*)-(\d*)', range_header.strip())
+            if range_match and any(range_match.groups()):
+                first, last = range_match.groups()
+                if first:
+                    start, end = int(first), min(int(last), size - 1) if last else size - 1
+                else:
+                    start, end = max(size - int(last), 0), size - 1
+
+                if start >= size:
+                    response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                    response['Content-Range'] = f'bytes */{size}'
+                    return response
+
+                # An inverted range is invalid rather than unsatisfiable, so it is ignored (RFC 9110 14.1.1)
+                if start <= end:
+                    byte_range = (start, end)
+
+        file = open(entry['path'], 'rb')
+        if byte_range:
+            start, end = byte_range
+            response = FileResponse(FileRange(file, start, end - start + 1), status=status.HTTP_206_PARTIAL_CONTENT, content_type=content_type)
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            response = FileResponse(file, content_type=content_type)
+
+    response['Content-Disposition'] = content_disposition_header(True, entry['filename'])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(entry['mtime'])
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def store_in_catalogue(store, *args):
+    """
+    Queue a crawl result for the catalogue; the batched writer commits it in the background
+
+    Args:
+        store (callable): One of the catalogue.store_* functions
+        *args: Its arguments
+    """
+    db_writer.submit(store, *args)
+
+
+def course_id_error(course_id):
+    """
+    Refuse course IDs that are not numbers before anything is crawled, counted or stored
+
+    Returns:
+        Response: The error response, or None for a valid course ID
+    """
+    if str(course_id).isdigit():
+        return None
+    return Response({
+        'status': 'error',
+        'message': 'The course ID must be a number'
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
+def count_course_request(url, course_id):
+    """
+    Count a request for a course listing that was served, for the cache warmer
+    """
+    db_writer.submit(catalogue.record_course_request, url, course_id, timezone.now())
+
+
+def course_access_error(session, url, course_id):
+    """
+    Check with Moodle that the caller's session may see a course before anything of it is served
+
+    Returns:
+        Response: The error response, or None when access is verified
+    """
+    access = verify_course_access(session, url, course_id)
+    if access['success']:
+        return None
+
+    logger.info(f"Refused course {course_id}: {access['message']}")
+    return Response({
+        'status': 'error',
+        'message': access['message']
+    }, status=access['status'])
+
+
+def listing_validators(request, content_hash, changed_at, variant=''):
+    """
+    Return the ETag and Last-Modified time of a listing response
+
+    The ETag is weak: it follows the listing's content hash, the renderer and
+    `variant` (the fields and page asked for), while crawl metadata in the body
+    (messages, crawl times) may change under it.
+
+    Args:
+        request: The DRF request
+        content_hash (str): The listing's content hash, see catalogue.content_hash
+        changed_at (datetime): When the listing last changed
+        variant (str): What else selects the representation
+
+    Returns:
+        tuple: (ETag, Last-Modified as a Unix timestamp)
+    """
+    representation = f"{content_hash}|{request.accepted_renderer.format}|{variant}"
+    return f'W/"{hashlib.sha256(representation.encode("utf-8")).hexdigest()[:32]}"', int(changed_at.timestamp())
+
+
+def crawled_validators(request, version, content_hash, variant=''):
+    """
+    Return the validators of a freshly crawled listing, unchanged since `version` if its hash still matches
+    """
+    if version is not None and version['content_hash'] == content_hash:
+        return listing_validators(request, content_hash, version['changed_at'], variant)
+    return listing_validators(request, content_hash, timezone.now(), variant)
+
+
+def conditional_response(request, response, validators):
+    """
+    Add the validators to a listing response, or answer 304 if the client's copy is current
+
+    Args:
+        request: The DRF request
+        response (Response): The full response, or None to only check the validators
+        validators (tuple): (ETag, Last-Modified) from listing_validators, or None
+
+    Returns:
+        HttpResponse: The 304, the response with its validators, or None when
+            `response` is None and the client's copy is not current
+    """
+    if validators is None:
+        return response
+
+    etag, last_modified = validators
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        response = not_modified
+    elif response is None:
+        return None
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def listing_options(params, listing, fields, scope=None):
+    """
+    Read the pagination and `fields` parameters of a listing request
+
+    Args:
+        params: The query parameters or request body
+        listing (str): The listing cursors must belong to
+        fields (tuple): The fields of the listing's items
+        scope (str, optional): The course or category cursors must belong to
+
+    Returns:
+        tuple: (paging dict or None, selected fields or None, error Response or None)
+    """
+    try:
+        return page_request(params, listing, scope), parse_fields(params.get('fields'), fields), None
+    except ValueError as e:
+        return None, None, Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+def course_files_page(course_id, url, session, paging, refresh=False):
+    """
+    Read one page of the files of a course from the catalogue
+
+    The first page is crawled first when the stored listing is missing or
+    stale, and the crawl is written before the page is read; later pages are
+    always read from the catalogue, so a listing is never recrawled halfway.
+
+    Returns:
+        tuple: (page dict as catalogue.course_files_page returns it, error Response or None)
+    """
+    page = catalogue.course_files_page(url, course_id, paging['after'], paging['limit'])
+    if paging['after'] is None and (refresh or page is None or not catalogue.is_fresh(page['crawled_at'])):
+        pdf_result = get_course_pdfs(course_id, url=url, session=session)
+        if not pdf_result['success']:
+            return None, Response({
+                'status': 'error',
+                'message': pdf_result['message']
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        store_in_catalogue(catalogue.store_course_files, url, course_id, pdf_result)
+        db_writer.flush()
+        page = catalogue.course_files_page(url, course_id, None, paging['limit'])
+
+    if page is None:
+        return None, Response({
+            'status': 'error',
+            'message': f"The files of course {course_id} changed or are not in the catalogue, start again without a cursor"
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return page, None
+
+
+def course_pdfs_response(course_id, url, session, refresh=False, paging=None, fields=None, request=None):
+    """
+    List the files of a course, from the catalogue while it is fresh, otherwise from Moodle
+
+    Args:
+        course_id (str): The course ID
+        url (str): The Moodle URL
+        session (requests.Session): The authenticated session
+        refresh (bool): Crawl the course even if the catalogue has a fresh copy
+        paging (dict): `after` and `limit` of the page to return, None for the whole listing
+        fields (tuple): The file fields to return, None for all of them
+        request: The GET request, to answer If-None-Match and If-Modified-Since
+            from the catalogue; None for requests that are not conditional
+
+    Returns:
+        Response: The DRF response
+    """
+    error = course_id_error(course_id) or course_access_error(session, url, course_id)
+    if error is not None:
+        return error
+
+    # Polls for an unchanged listing get a 304 from the stored content hash, without a crawl
+    version = catalogue.listing_version(url, catalogue.files_listing(course_id)) if request is not None else None
+    variant = f"{','.join(fields or ())}|{paging}"
+    if version is not None and not refresh and catalogue.is_fresh(version['checked_at']):
+        validators = listing_validators(request, version['content_hash'], version['changed_at'], variant)
+        not_modified = conditional_response(request, None, validators)
+        if not_modified is not None:
+            count_course_request(url, course_id)
+            return not_modified
+
+    if paging is not None:
+        page, error = course_files_page(course_id, url, session, paging, refresh)
+        if error is not None:
+            return error
+        count_course_request(url, course_id)
+        if request is not None:
+            version = catalogue.listing_version(url, catalogue.files_listing(course_id))
+        validators = listing_validators(request, version['content_hash'], version['changed_at'], variant) if version else None
+        return conditional_response(request, Response({
+            'status': 'success',
+            'message': f"Found {len(page['pdfs'])} PDF files in this page of course {course_id}",
+            'course_name': page['course_name'],
+            'count': len(page['pdfs']),
+            'pdfs': select_fields(page['pdfs'], fields),
+            'next_cursor': next_cursor('files', page['next_after'], str(course_id)),
+            'crawled_at': int(page['crawled_at'].timestamp())
+        }, status=status.HTTP_200_OK), validators)
+
+    stored = None if refresh else catalogue.course_files(url, course_id)
+
+    if stored is not None:
+        count_course_request(url, course_id)
+        validators = listing_validators(request, version['content_hash'], version['changed_at'], variant) if version else None
+        return conditional_response(request, Response({
+            'status': 'success',
+            'message': f"Found {len(stored['pdfs'])} PDF files in course {course_id}",
+            'course_name': stored['course_name'],
+            'count': len(stored['pdfs']),
+            'pdfs': select_fields(stored['pdfs'], fields),
+            'probes': None,
+            'crawled_at': int(stored['crawled_at'].timestamp())
+        }, status=status.HTTP_200_OK), validators)
+
+    pdf_result = get_course_pdfs(course_id, url=url, session=session)
+
+    if not pdf_result['success']:
+        return Response({
+            'status': 'error',
+            'message': pdf_result['message']
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    store_in_catalogue(catalogue.store_course_files, url, course_id, pdf_result)
+    count_course_request(url, course_id)
+
+    validators = None
+    if request is not None:
+        validators = crawled_validators(request, version, catalogue.course_files_hash(pdf_result), variant)
+    return conditional_response(request, Response({
+        'status': 'success',
+        'message': pdf_result['message'],
+        'course_name': pdf_result['course_name'],
+        'count': len(pdf_result['pdfs']),
+        'pdfs': select_fields(pdf_result['pdfs'], fields),
+        'probes': pdf_result.get('probes')
+    }, status=status.HTTP_200_OK), validators)
+
+
+def wants_ndjson(request):
+    """
+    Tell whether the client asked for an NDJSON stream (`format=ndjson` or `Accept: application/x-ndjson`)
+    """
+    accepted = getattr(request, 'accepted_renderer', None)
+    if accepted is not None and accepted.format == 'ndjson':
+        return True
+    return hasattr(request.data, 'get') and request.data.get('format') == 'ndjson'
+
+
+def course_pdfs_stream(course_id, url, session, refresh=False, resources=False):
+    """
+    Stream the files of a course as NDJSON, one line per file as soon as it is resolved
+
+    The first line is a `course` header with the course name, then one `file`
+    line per file (`resource` lines in the auth-resources format), and a final
+    `done` trailer with the count, the resources that could not be read and
+    timings. The course page is read before the response starts, so login and
+    course page failures are still answered with an error status.
+
+    Args:
+        course_id (str): The course ID
+        url (str): The Moodle URL
+        session (requests.Session): The authenticated session
+        refresh (bool): Crawl the course even if the catalogue has a fresh copy
+        resources (bool): Emit ResourceLink lines, as /api/auth-resources/ lists them
+
+    Returns:
+        StreamingHttpResponse | Response: The stream, or the DRF error response
+    """
+    started = time.monotonic()
+    error = course_id_error(course_id) or course_access_error(session, url, course_id)
+    if error is not None:
+        return error
+
+    stored = None if refresh else catalogue.course_files(url, course_id)
+
+    if stored is not None:
+        events = chain(
+            [('course', stored['course_name'])],
+            (('file', pdf) for pdf in stored['pdfs']),
+            [('done', None)]
+        )
+    else:
+        events = iter_course_pdfs(course_id, url=url, session=session)
+
+    # The header event needs the course page: fail with a status code while we still can
+    first_event, course_name = next(events)
+    if first_event == 'failed':
+        return Response({
+            'status': 'error',
+            'message': course_name
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    item_event = 'resource' if resources else 'file'
+
+    def lines():
+        pdfs = []
+        errors = []
+        probes = None
+        message = None
+        first_item_at = None
+
+        yield ndjson_line({
+            'event': 'course',
+            'course_id': str(course_id),
+            'course_name': course_name,
+            'cached': stored is not None,
+            'crawled_at': int(stored['crawled_at'].timestamp()) if stored is not None else None
+        })
+
+        for event, value in events:
+            if event == 'file':
+                if first_item_at is None:
+                    first_item_at = time.monotonic()
+                pdfs.append(value)
+                yield ndjson_line({'event': item_event, **(ResourceLink.from_course_file(value) if resources else value)})
+            elif event == 'error':
+                resource_name, resource_url, error = value
+                errors.append({'resource_name': resource_name, 'resource_url': resource_url, 'message': error})
+            elif event == 'failed':
+                message = value
+            elif event == 'done':
+                probes = value
+
+        if message is None and stored is None:
+            store_in_catalogue(catalogue.store_course_files, url, course_id, {'course_name': course_name, 'pdfs': pdfs})
+        if message is None:
+            count_course_request(url, course_id)
+
+        yield ndjson_line({
+            'event': 'done',
+            'success': message is None,
+            'message': message or f"Found {len(pdfs)} PDF files in course {course_id}",
+            'count': len(pdfs),
+            'errors': errors,
+            'probes': probes,
+            'first_item_ms': int((first_item_at - started) * 1000) if first_item_at is not None else None,
+            'elapsed_ms': int((time.monotonic() - started) * 1000)
+        })
+
+    response = StreamingHttpResponse(lines(), content_type=NDJSON_MEDIA_TYPE)
+    # Keep reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def file_download_response(request, download_url, download):
+    """
+    Stream a download opened by open_resource_download to the client and into the file cache at once
+
+    The cached copy is only kept when the whole file went through; repeat
+    downloads are then served from disk by cached_file_response.
+
+    Args:
+        request: The incoming request
+        download_url (str): The URL the file was requested from, used as cache key
+        download (dict): A successful open_resource_download result
+
+    Returns:
+        HttpResponse: The file as an attachment
+    """
+    content_type = download['content_type']
+    filename = download['filename']
+
+    if 'pdf' in content_type.lower() or filename.lower().endswith('.pdf'):
+        content_type = 'application/pdf'
+
+    def record_content_hash(entry):
+        store_in_catalogue(catalogue.record_content_hash, download_url, entry['etag'], entry['size'])
+
+    file_response = download['response']
+    response = StreamingHttpResponse(file_cache.tee(download_url, file_response, filename, content_type,
+                                                    on_stored=record_content_hash), content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    # iter_content() decodes a compressed body, so Moodle's length only holds for an unencoded one
+    if file_response.headers.get('Content-Length') and not file_response.headers.get('Content-Encoding'):
+        response['Content-Length'] = file_response.headers['Content-Length']
+    return response
+
+
+def zip_files_response(session, resources, files_selector, archive_name, revalidate=True):
+    """
+    Stream the resources picked by a `files` selector as one ZIP archive
+
+    Args:
+        session (requests.Session): The authenticated session
+        resources (list): The course resources
+        files_selector: The `files` selector from the request
+        archive_name (str): Name of the archive, without extension
+        revalidate (bool): Check the session may download each cached file, see stream_zip
+
+    Returns:
+        Response: A streaming ZIP response, or a JSON error response
+    """
+    try:
+        selected = select_resources(resources, files_selector)
+    except ValueError as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if not selected:
+        return Response({
+            'status': 'error',
+            'message': 'No files match the files selector'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(stream_zip(session, selected, file_cache=file_cache, revalidate=revalidate),
+                                     content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, f'{archive_name}.zip')
+    response['X-File-Count'] = str(len(selected))
+    return response
+
 
 class CourseListAPIView(APIView):
     """
     API view to retrieve courses from elearning.univ-bba.dz
+
+    With `limit` or `cursor`, pages through the public courses of the catalogue instead of scraping the front page.
+    Both send validators, and answer 304 when the client's copy is current.
     """
     def get(self, request):
+        try:
+            paging = page_request(request.query_params, 'courses')
+            fields = parse_fields(request.query_params.get('fields'), CATALOGUE_COURSE_FIELDS if paging else COURSE_FIELDS)
+        except ValueError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        variant = f"{','.join(fields or ())}|{paging}"
+        if paging is not None:
+            page = catalogue.courses_page(DEFAULT_MOODLE_URL, paging['after'], paging['limit'])
+            validators = None
+            if page['changed_at'] is not None:
+                validators = listing_validators(request, page['content_hash'], page['changed_at'], variant)
+            return conditional_response(request, Response({
+                'status': 'success',
+                'count': len(page['courses']),
+                'data': select_fields(page['courses'], fields),
+                'next_cursor': next_cursor('courses', page['next_after'])
+            }, status=status.HTTP_200_OK), validators)
+
         # Scrape courses from the website
+        version = catalogue.listing_version(DEFAULT_MOODLE_URL, catalogue.FRONT_PAGE_LISTING)
         courses = scrape_elearning_courses()
+        store_in_catalogue(catalogue.record_front_page, DEFAULT_MOODLE_URL, courses)
+        content_hash = catalogue.front_page_hash(courses)
+        validators = crawled_validators(request, version, content_hash, variant) if content_hash else None
 
-        # Serialize the data
-        serializer = CourseSerializer(courses, many=True)
-
-        return Response({
+        # The scraper builds the response rows; they are rendered as they are
+        return conditional_response(request, Response({
             'status': 'success',
             'count': len(courses),
-            'data': serializer.data
-        }, status=status.HTTP_200_OK)
+            'data': select_fields(courses, fields)
+        }, status=status.HTTP_200_OK), validators)
 
 
 class DepartmentListAPIView(APIView):
     """
     API view to retrieve departments from elearning.univ-bba.dz
+
+    Served from the catalogue while it is fresh; `refresh=true` scrapes the site again.
     """
     def get(self, request):
-        # Extract departments from the website
-        departments = extract_departments()
+        refresh = request.query_params.get('refresh', 'false').lower() in ('1', 'true', 'yes')
+        version = catalogue.listing_version(DEFAULT_MOODLE_URL, catalogue.DEPARTMENTS_LISTING)
+        departments = None if refresh else catalogue.departments(DEFAULT_MOODLE_URL)
 
-        # Serialize the data
-        serializer = DepartmentSerializer(departments, many=True)
+        if departments is not None:
+            validators = listing_validators(request, version['content_hash'], version['changed_at']) if version else None
+        else:
+            # Extract departments from the website
+            departments = extract_departments()
+            store_in_catalogue(catalogue.store_departments, DEFAULT_MOODLE_URL, departments)
+            content_hash = catalogue.departments_hash(departments)
+            validators = crawled_validators(request, version, content_hash) if content_hash else None
 
-        return Response({
+        return conditional_response(request, Response({
             'status': 'success',
             'count': len(departments),
-            'data': serializer.data
-        }, status=status.HTTP_200_OK)
+            'data': departments
+        }, status=status.HTTP_200_OK), validators)
 
 
 class LinkExtractAPIView(APIView):
@@ -63,35 +676,174 @@ class LinkExtractAPIView(APIView):
         # Extract links from the provided URL
         links = extract_aalinks(url)
 
-        # Serialize the data
-        serializer = LinkSerializer(links, many=True)
 
         return Response({
             'status': 'success',
             'count': len(links),
-            'data': serializer.data
+            'data': links
         }, status=status.HTTP_200_OK)
 
 
 class CategoryCoursesAPIView(APIView):
     """
     API view to extract courses from a specific category
+
+    Served from the catalogue while it is fresh; `refresh=true` scrapes the category again.
+    With `limit` or `cursor` the courses are returned a page at a time.
     """
     def get(self, request, category_id):
-        # Construct the URL with the category ID
-        url = f"https://elearning.univ-bba.dz/course/index.php?categoryid={category_id}"
+        refresh = request.query_params.get('refresh', 'false').lower() in ('1', 'true', 'yes')
+        paging, fields, error = listing_options(request.query_params, 'category', Link.__slots__, str(category_id))
+        if error is not None:
+            return error
+
+        # Polls for an unchanged listing get a 304 from the stored content hash, without a crawl
+        version = catalogue.listing_version(DEFAULT_MOODLE_URL, catalogue.category_listing(category_id))
+        variant = f"{','.join(fields or ())}|{paging}"
+        if version is not None and not refresh and catalogue.is_fresh(version['checked_at']):
+            validators = listing_validators(request, version['content_hash'], version['changed_at'], variant)
+            not_modified = conditional_response(request, None, validators)
+            if not_modified is not None:
+                return not_modified
+
+        if paging is not None:
+            response = self.get_page(category_id, paging, fields, refresh)
+            version = catalogue.listing_version(DEFAULT_MOODLE_URL, catalogue.category_listing(category_id))
+            validators = listing_validators(request, version['content_hash'], version['changed_at'], variant) if version else None
+            return conditional_response(request, response, validators)
+
+        links = None if refresh else catalogue.category_courses(DEFAULT_MOODLE_URL, category_id)
+
+        if links is not None:
+            validators = listing_validators(request, version['content_hash'], version['changed_at'], variant) if version else None
+        else:
+            # Construct the URL with the category ID
+            url = f"{DEFAULT_MOODLE_URL}/course/index.php?categoryid={category_id}"
 
-        # Extract links from the URL
-        links = extract_aalinks(url)
+            # Extract links from the URL
+            links = extract_aalinks(url)
+            store_in_catalogue(catalogue.store_category_links, DEFAULT_MOODLE_URL, category_id, links)
+            content_hash = catalogue.category_links_hash(links)
+            validators = crawled_validators(request, version, content_hash, variant) if content_hash else None
+
+        return conditional_response(request, Response({
+            'status': 'success',
+            'category_id': category_id,
+            'count': len(links),
+            'data': select_fields(links, fields)
+        }, status=status.HTTP_200_OK), validators)
+
+    def get_page(self, category_id, paging, fields, refresh):
+        page = catalogue.category_courses_page(DEFAULT_MOODLE_URL, category_id, paging['after'], paging['limit'])
 
-        # Serialize the data
-        serializer = LinkSerializer(links, many=True)
+        # Only the first page crawls, and it waits for the crawl to be stored before reading it back
+        if paging['after'] is None and (refresh or page is None or not catalogue.is_fresh(page['crawled_at'])):
+            links = extract_aalinks(f"{DEFAULT_MOODLE_URL}/course/index.php?categoryid={category_id}")
+            store_in_catalogue(catalogue.store_category_links, DEFAULT_MOODLE_URL, category_id, links)
+            db_writer.flush()
+            page = catalogue.category_courses_page(DEFAULT_MOODLE_URL, category_id, None, paging['limit'])
+
+            # Nothing could be stored, the error entries of the crawl are the only page
+            if page is None:
+                page = {'links': links, 'next_after': None}
+
+        if page is None:
+            page = {'links': [], 'next_after': None}
 
         return Response({
             'status': 'success',
             'category_id': category_id,
-            'count': len(links),
-            'data': serializer.data
+            'count': len(page['links']),
+            'data': select_fields(page['links'], fields),
+            'next_cursor': next_cursor('category', page['next_after'], str(category_id))
+        }, status=status.HTTP_200_OK)
+
+
+class CategoryTreeAPIView(APIView):
+    """
+    API view serving the whole category hierarchy, with the courses of each category
+
+    The tree is crawled concurrently and cached for MOODLE_TREE_CACHE_TTL
+    seconds; older copies are served while a full recrawl runs in the
+    background. `refresh=<category_id>` recrawls only that branch and merges it
+    into the cached tree, `refresh=all` recrawls it whole. Refreshes need an
+    API token, and are ignored while one runs or for
+    MOODLE_TREE_REFRESH_INTERVAL seconds after the last load. Trees crawled
+    with a token stay in that user's cache and are not stored in the catalogue.
+    """
+    def get(self, request):
+        category_id = request.query_params.get('category')
+        refresh = request.query_params.get('refresh')
+        include_courses = request.query_params.get('courses', 'true').lower() not in ('0', 'false', 'no')
+
+        # `all` recrawls the whole tree; any number, 1 included, names the category to recrawl
+        if refresh and not (refresh.isdigit() or refresh.lower() == 'all'):
+            return Response({
+                'status': 'error',
+                'message': "refresh must be a category ID or 'all'"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Logged-in users may see categories hidden from guests, so they get their own tree
+        token_entry = get_token_entry(request)
+        if refresh and not token_entry:
+            return Response({
+                'status': 'error',
+                'message': 'A valid API token is required to refresh the tree'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+
+        session = token_entry['session'] if token_entry else None
+        url = token_entry['url'] if token_entry else DEFAULT_MOODLE_URL
+        cache_key = f"category_tree:{url}:{token_entry['username'] if token_entry else 'public'}"
+        max_workers = getattr(settings, 'MOODLE_TREE_WORKERS', 8)
+        stale_ttl = getattr(settings, 'MOODLE_TREE_STALE_TTL', 7 * 24 * 60 * 60)
+
+        def load_tree(**kwargs):
+            tree = crawl_category_tree(url, session=session, max_workers=max_workers, **kwargs)
+            # The catalogue is served to everyone: only the guest's view of the tree goes into it
+            if session is None:
+                store_in_catalogue(catalogue.store_category_tree, url, tree)
+            return tree
+
+        cached = None
+        if refresh:
+            previous = peek(cache_key)
+            root_id = refresh if refresh.isdigit() and previous else ROOT_ID
+            cached = refresh_now(
+                cache_key,
+                lambda: load_tree(root_id=root_id, previous=previous),
+                stale_ttl,
+                min_interval=getattr(settings, 'MOODLE_TREE_REFRESH_INTERVAL', 5 * 60)
+            )
+            if cached is None:
+                logger.info(f"Ignoring refresh of {cache_key}: it is running or was loaded recently")
+
+        if cached is not None:
+            cached = dict(cached, stale=False)
+        else:
+            cached = get_or_refresh(
+                cache_key,
+                load_tree,
+                ttl=getattr(settings, 'MOODLE_TREE_CACHE_TTL', 6 * 60 * 60),
+                stale_ttl=stale_ttl
+            )
+
+        tree = cached['value']
+        nested = nest_category_tree(tree, category_id, include_courses)
+
+        if nested is None:
+            return Response({
+                'status': 'error',
+                'message': f"Category {category_id} is not in the tree"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'status': 'success',
+            'message': tree['message'],
+            'category_count': len(tree['categories']),
+            'course_count': sum(len(node['courses']) for node in tree['categories'].values()),
+            'fetched_at': int(cached['fetched_at']),
+            'stale': cached['stale'],
+            'tree': nested
         }, status=status.HTTP_200_OK)
 
 
@@ -106,15 +858,13 @@ class CourseResourcesAPIView(APIView):
         # Extract resources from the course page
         resources = extract_course_resources(course_url)
 
-        # Serialize the data
-        serializer = ResourceSerializer(resources, many=True)
 
         return Response({
             'status': 'success',
             'course_id': course_id,
             'course_url': course_url,
             'count': len(resources),
-            'data': serializer.data
+            'data': resources
         }, status=status.HTTP_200_OK)
 
     def post(self, request):
@@ -130,14 +880,12 @@ class CourseResourcesAPIView(APIView):
         # Extract resources from the course page
         resources = extract_course_resources(course_url)
 
-        # Serialize the data
-        serializer = ResourceSerializer(resources, many=True)
 
         return Response({
             'status': 'success',
             'course_url': course_url,
             'count': len(resources),
-            'data': serializer.data
+            'data': resources
         }, status=status.HTTP_200_OK)
 
 
@@ -145,18 +893,19 @@ class AuthenticatedResourcesAPIView(APIView):
     """
     API view to extract resources and PDF links from a course page with authentication
     and return the actual files
+
+    With `download_file=false`, `format=ndjson` streams the resources of a course URL as they are
+    resolved, and `limit` or `cursor` returns them a page at a time from the catalogue.
     """
-    def post(self, request):
-        import logging
-        import re
-        from urllib.parse import urlparse, parse_qs
-        logger = logging.getLogger(__name__)
+    renderer_classes = STREAMING_RENDERER_CLASSES
 
+    def post(self, request):
         # Get the course URL, username, and password from the request data
         course_url = request.data.get('url')
         username = request.data.get('username')
         password = request.data.get('password')
         download_file = request.data.get('download_file', True)  # Default to True to download files
+        files_selector = request.data.get('files')  # Select several files to stream as a ZIP archive
 
         logger.info(f"Received request for URL: {course_url}")
         logger.info(f"Download file flag: {download_file}")
@@ -167,10 +916,12 @@ class AuthenticatedResourcesAPIView(APIView):
                 'message': 'Course URL is required in the request body'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        if not username or not password:
+        token_entry = get_token_entry(request)
+
+        if not token_entry and (not username or not password):
             return Response({
                 'status': 'error',
-                'message': 'Username and password are required for authentication'
+                'message': 'An API token or username and password are required for authentication'
             }, status=status.HTTP_400_BAD_REQUEST)
 
         # Check if it's a category URL or a course URL
@@ -188,9 +939,13 @@ class AuthenticatedResourcesAPIView(APIView):
         else:
             logger.warning(f"URL type not recognized: {course_url}")
 
-        # Login to the elearning website
-        logger.info(f"Attempting to login with username: {username}")
-        session = login_to_elearning(username, password)
+        # Reuse the pooled session for the token, or login to the elearning website
+        if token_entry:
+            logger.info(f"Using pooled session for {token_entry['username']}")
+            session = token_entry['session']
+        else:
+            logger.info(f"Attempting to login with username: {username}")
+            session = login_to_elearning(username, password)
 
         if not session:
             logger.error("Authentication failed")
@@ -205,8 +960,7 @@ class AuthenticatedResourcesAPIView(APIView):
         if is_category:
             try:
                 # Get the courses in the category
-                from .moodle_auth import get_category_courses
-                courses_result = get_category_courses(category_id, username, password)
+                courses_result = get_category_courses(category_id, session=session)
 
                 if not courses_result.get('success'):
                     logger.error(f"Failed to get courses in category: {courses_result.get('message')}")
@@ -247,8 +1001,43 @@ class AuthenticatedResourcesAPIView(APIView):
         # For course URLs, we can use the moodle_auth.get_course_pdfs function
         if is_course:
             try:
-                from .moodle_auth import get_course_pdfs
-                pdfs_result = get_course_pdfs(course_id, username, password)
+                # The listing and cached files are shared: check the session may see the course first
+                error = course_id_error(course_id) or course_access_error(session, DEFAULT_MOODLE_URL, course_id)
+                if error is not None:
+                    return error
+
+                # Cursors belong to a course, which is only known once a category URL led to its first course
+                paging, fields, error = listing_options(request.data, 'files', ResourceLink.__slots__, str(course_id))
+                if error is not None:
+                    return error
+
+                # Listings can be streamed line by line while the course is resolved
+                if not download_file and wants_ndjson(request):
+                    return course_pdfs_stream(course_id, DEFAULT_MOODLE_URL, session, resources=True)
+
+                # The catalogue answers while fresh; the download itself still goes through the session
+                if not download_file and paging is not None:
+                    page, error = course_files_page(course_id, DEFAULT_MOODLE_URL, session, paging)
+                    if error is not None:
+                        return error
+                    count_course_request(DEFAULT_MOODLE_URL, course_id)
+                    resources = [ResourceLink.from_course_file(pdf) for pdf in page['pdfs']]
+                    return Response({
+                        'status': 'success',
+                        'course_url': course_url,
+                        'authenticated': True,
+                        'count': len(resources),
+                        'data': select_fields(resources, fields),
+                        'next_cursor': next_cursor('files', page['next_after'], str(course_id))
+                    }, status=status.HTTP_200_OK)
+
+                stored = catalogue.course_files(DEFAULT_MOODLE_URL, course_id)
+                if stored is not None:
+                    pdfs_result = {'success': True, 'pdfs': stored['pdfs']}
+                else:
+                    pdfs_result = get_course_pdfs(course_id, session=session)
+                    if pdfs_result.get('success'):
+                        store_in_catalogue(catalogue.store_course_files, DEFAULT_MOODLE_URL, course_id, pdfs_result)
 
                 if not pdfs_result.get('success'):
                     logger.error(f"Failed to get PDFs from course: {pdfs_result.get('message')}")
@@ -256,19 +1045,13 @@ class AuthenticatedResourcesAPIView(APIView):
                         'status': 'error',
                         'message': f"Failed to get PDFs from course: {pdfs_result.get('message')}"
                     }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                count_course_request(DEFAULT_MOODLE_URL, course_id)
 
                 pdfs = pdfs_result.get('pdfs', [])
                 logger.info(f"Found {len(pdfs)} files in course {course_id}")
 
-                # Convert PDFs to resources format
-                resources = []
-                for pdf in pdfs:
-                    resources.append({
-                        'resource_name': pdf.get('resource_name', ''),
-                        'resource_url': pdf.get('resource_url', ''),
-                        'pdf_url': pdf.get('url', ''),
-                        'pdf_name': pdf.get('name', '')
-                    })
+                # Resource records share the strings of the file records and render as they are
+                resources = [ResourceLink.from_course_file(pdf) for pdf in pdfs]
 
                 # If no resources found, return empty response
                 if not resources:
@@ -282,15 +1065,18 @@ class AuthenticatedResourcesAPIView(APIView):
 
                 # If download_file is False, return JSON response
                 if not download_file:
-                    serializer = ResourceSerializer(resources, many=True)
                     return Response({
                         'status': 'success',
                         'course_url': course_url,
                         'authenticated': True,
                         'count': len(resources),
-                        'data': serializer.data
+                        'data': select_fields(resources, fields)
                     }, status=status.HTTP_200_OK)
 
+                # If files are selected, stream them all as one ZIP archive
+                if files_selector:
+                    return zip_files_response(session, resources, files_selector, f"course_{course_id}", revalidate=False)
+
                 # If download_file is True, download the first file
                 resource = resources[0]
                 download_url = resource.get('pdf_url')
@@ -303,146 +1089,42 @@ class AuthenticatedResourcesAPIView(APIView):
                         'message': 'No download URL found in resource'
                     }, status=status.HTTP_404_NOT_FOUND)
 
+                # The session was verified for this course, whose listing the file comes from
+                cached_entry = file_cache.lookup(download_url)
+                if cached_entry:
+                    logger.info(f"Serving {download_url} from the file cache")
+                    return cached_file_response(request, cached_entry)
+
                 logger.info(f"Downloading file from: {download_url}")
+                download = open_resource_download(session, download_url, resource_name)
 
-                try:
-                    # Download the file with a timeout
-                    # First, try to get the direct file URL
-                    from .moodle_auth import get_direct_file_url
-                    direct_url_result = get_direct_file_url(download_url, session)
-
-                    if direct_url_result.get('success'):
-                        direct_url = direct_url_result.get('url')
-                        logger.info(f"Got direct file URL: {direct_url}")
-
-                        # Try downloading with the direct URL
-                        file_response = session.get(direct_url, stream=True, timeout=30, allow_redirects=True)
-                        file_response.raise_for_status()
-
-                        # Get the content type
-                        content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
-                        logger.info(f"File content type: {content_type}")
-
-                        # Check if we got HTML instead of a file
-                        if 'text/html' in content_type and '<html' in file_response.text[:1000].lower():
-                            logger.warning("Received HTML from direct URL. Falling back to original URL.")
-                            # Try with the original URL
-                            file_response = session.get(download_url, stream=True, timeout=30, allow_redirects=True)
-                            file_response.raise_for_status()
-
-                            # Get the content type
-                            content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
-                            logger.info(f"File content type: {content_type}")
-                    else:
-                        # Try with the original URL
-                        logger.info(f"No direct URL found, using original URL: {download_url}")
-                        file_response = session.get(download_url, stream=True, timeout=30, allow_redirects=True)
-                        file_response.raise_for_status()
-
-                        # Get the content type
-                        content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
-                        logger.info(f"File content type: {content_type}")
-
-                    # Check if we got HTML instead of a file
-                    if 'text/html' in content_type and '<html' in file_response.text[:1000].lower():
-                        logger.warning("Received HTML instead of file. Trying to extract file URL from HTML...")
-
-                        # Try to find a download link in the HTML
-                        from bs4 import BeautifulSoup
-                        soup = BeautifulSoup(file_response.text, 'html.parser')
-
-                        # Look for download links
-                        download_links = soup.select('a[href*=".pdf"], a[href*="pluginfile.php"], a[href*="webservice"], a[href*=".docx"], a[href*=".xlsx"], a[href*=".pptx"]')
-                        if download_links:
-                            new_url = download_links[0].get('href')
-                            if not new_url.startswith('http'):
-                                from urllib.parse import urljoin
-                                new_url = urljoin(download_url, new_url)
-
-                            logger.info(f"Found download link in HTML: {new_url}")
-
-                            # Try downloading again with the new URL
-                            file_response = session.get(new_url, stream=True, timeout=30, allow_redirects=True)
-                            file_response.raise_for_status()
-
-                            # Update content type
-                            content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
-                            logger.info(f"New file content type: {content_type}")
-                        else:
-                            # If we can't find a download link, return the HTML as JSON
-                            logger.warning("Could not find download link in HTML. Returning resources as JSON.")
-                            serializer = ResourceSerializer(resources, many=True)
-                            return Response({
-                                'status': 'success',
-                                'course_url': course_url,
-                                'authenticated': True,
-                                'count': len(resources),
-                                'data': serializer.data
-                            }, status=status.HTTP_200_OK)
-
-                    # Get the filename from Content-Disposition header or URL
-                    filename = resource_name
-                    content_disposition = file_response.headers.get('Content-Disposition', '')
-
-                    if 'filename=' in content_disposition:
-                        filename_match = re.search(r'filename="?([^"]+)"?', content_disposition)
-                        if filename_match:
-                            filename = filename_match.group(1)
-                    elif download_url.split('/')[-1].split('?')[0]:
-                        filename = download_url.split('/')[-1].split('?')[0]
-
-                    # Add file extension if missing
-                    if '.' not in filename:
-                        if 'pdf' in content_type.lower():
-                            filename += '.pdf'
-                        elif 'word' in content_type.lower():
-                            filename += '.docx'
-                        elif 'excel' in content_type.lower():
-                            filename += '.xlsx'
-                        elif 'powerpoint' in content_type.lower():
-                            filename += '.pptx'
-                        elif 'text' in content_type.lower():
-                            filename += '.txt'
-
-                    logger.info(f"Using filename: {filename}")
-
-                    # Create a file-like object from the content
-                    file_content = io.BytesIO(file_response.content)
-
-                    # Save the file to disk for debugging
-                    import os
-                    debug_dir = '/tmp/moodle_files'
-                    os.makedirs(debug_dir, exist_ok=True)
-                    debug_path = os.path.join(debug_dir, filename)
-                    with open(debug_path, 'wb') as f:
-                        f.write(file_response.content)
-                    logger.info(f"Saved file to {debug_path} for debugging")
-
-                    # Return the file
-                    if 'pdf' in content_type.lower() or filename.lower().endswith('.pdf'):
-                        response = FileResponse(file_content, content_type='application/pdf')
-                    else:
-                        response = FileResponse(file_content, content_type=content_type)
-
-                    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                    return response
+                if download.get('html'):
+                    # If we can't find a download link, return the resources as JSON
+                    logger.warning("Could not find download link in HTML. Returning resources as JSON.")
+                    return Response({
+                        'status': 'success',
+                        'course_url': course_url,
+                        'authenticated': True,
+                        'count': len(resources),
+                        'data': resources
+                    }, status=status.HTTP_200_OK)
 
-                except Exception as e:
-                    logger.error(f"Error downloading file: {e}")
+                if not download['success']:
                     # Add the error to the resource
-                    resource['error'] = f"Error downloading file: {str(e)}"
+                    resources[0] = resource.replace(error=download['message'])
 
                     # Return JSON response with error
-                    serializer = ResourceSerializer(resources, many=True)
                     return Response({
                         'status': 'error',
-                        'message': f"Error downloading file: {str(e)}",
+                        'message': download['message'],
                         'course_url': course_url,
                         'authenticated': True,
                         'count': len(resources),
-                        'data': serializer.data
+                        'data': resources
                     }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+                return file_download_response(request, download_url, download)
+
             except Exception as e:
                 logger.error(f"Error processing course: {str(e)}")
                 return Response({
@@ -454,9 +1136,6 @@ class AuthenticatedResourcesAPIView(APIView):
         logger.info(f"Extracting resources from URL: {course_url}")
         try:
             # Set a timeout for the extraction to prevent hanging
-            import threading
-            import queue
-
             result_queue = queue.Queue()
 
             def extract_with_timeout():
@@ -517,6 +1196,10 @@ class AuthenticatedResourcesAPIView(APIView):
             if not downloadable_resources:
                 downloadable_resources = [r for r in resources if r.get('resource_url')]
 
+            # If files are selected, stream them all as one ZIP archive
+            if files_selector and downloadable_resources:
+                return zip_files_response(session, downloadable_resources, files_selector, 'course_files')
+
             if downloadable_resources:
                 # Get the first downloadable resource
                 resource = downloadable_resources[0]
@@ -532,153 +1215,154 @@ class AuthenticatedResourcesAPIView(APIView):
                         'message': 'No download URL found in resource'
                     }, status=status.HTTP_404_NOT_FOUND)
 
+                # Any page may link to any file: the cached copy is only served if Moodle lets the session through
+                cached_entry = file_cache.lookup(download_url)
+                if cached_entry and can_download(session, download_url):
+                    logger.info(f"Serving {download_url} from the file cache")
+                    return cached_file_response(request, cached_entry)
+
                 logger.info(f"Downloading file from: {download_url}")
+                download = open_resource_download(session, download_url, resource_name)
 
-                try:
-                    # Download the file with a timeout
-                    # First, try to get the direct file URL
-                    from .moodle_auth import get_direct_file_url
-                    direct_url_result = get_direct_file_url(download_url, session)
-
-                    if direct_url_result.get('success'):
-                        direct_url = direct_url_result.get('url')
-                        logger.info(f"Got direct file URL: {direct_url}")
-
-                        # Try downloading with the direct URL
-                        file_response = session.get(direct_url, stream=True, timeout=30, allow_redirects=True)
-                        file_response.raise_for_status()
-
-                        # Get the content type
-                        content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
-                        logger.info(f"File content type: {content_type}")
-
-                        # Check if we got HTML instead of a file
-                        if 'text/html' in content_type and '<html' in file_response.text[:1000].lower():
-                            logger.warning("Received HTML from direct URL. Falling back to original URL.")
-                            # Try with the original URL
-                            file_response = session.get(download_url, stream=True, timeout=30, allow_redirects=True)
-                            file_response.raise_for_status()
-
-                            # Get the content type
-                            content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
-                            logger.info(f"File content type: {content_type}")
-                    else:
-                        # Try with the original URL
-                        logger.info(f"No direct URL found, using original URL: {download_url}")
-                        file_response = session.get(download_url, stream=True, timeout=30, allow_redirects=True)
-                        file_response.raise_for_status()
-
-                        # Get the content type
-                        content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
-                        logger.info(f"File content type: {content_type}")
-
-                    # Check if we got HTML instead of a file
-                    if 'text/html' in content_type and '<html' in file_response.text[:1000].lower():
-                        logger.warning("Received HTML instead of file. Trying to extract file URL from HTML...")
-
-                        # Try to find a download link in the HTML
-                        from bs4 import BeautifulSoup
-                        soup = BeautifulSoup(file_response.text, 'html.parser')
-
-                        # Look for download links
-                        download_links = soup.select('a[href*=".pdf"], a[href*="pluginfile.php"], a[href*="webservice"], a[href*=".docx"], a[href*=".xlsx"], a[href*=".pptx"]')
-                        if download_links:
-                            new_url = download_links[0].get('href')
-                            if not new_url.startswith('http'):
-                                from urllib.parse import urljoin
-                                new_url = urljoin(download_url, new_url)
-
-                            logger.info(f"Found download link in HTML: {new_url}")
-
-                            # Try downloading again with the new URL
-                            file_response = session.get(new_url, stream=True, timeout=30, allow_redirects=True)
-                            file_response.raise_for_status()
-
-                            # Update content type
-                            content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
-                            logger.info(f"New file content type: {content_type}")
-                        else:
-                            # If we can't find a download link, return the HTML as JSON
-                            logger.warning("Could not find download link in HTML. Returning resources as JSON.")
-                            serializer = ResourceSerializer(resources, many=True)
-                            return Response({
-                                'status': 'success',
-                                'course_url': course_url,
-                                'authenticated': True,
-                                'count': len(resources),
-                                'data': serializer.data
-                            }, status=status.HTTP_200_OK)
-
-                    # Get the filename from Content-Disposition header or URL
-                    filename = resource_name
-                    content_disposition = file_response.headers.get('Content-Disposition', '')
-
-                    if 'filename=' in content_disposition:
-                        filename_match = re.search(r'filename="?([^"]+)"?', content_disposition)
-                        if filename_match:
-                            filename = filename_match.group(1)
-                    elif download_url.split('/')[-1].split('?')[0]:
-                        filename = download_url.split('/')[-1].split('?')[0]
-
-                    # Add file extension if missing
-                    if '.' not in filename:
-                        if 'pdf' in content_type.lower():
-                            filename += '.pdf'
-                        elif 'word' in content_type.lower():
-                            filename += '.docx'
-                        elif 'excel' in content_type.lower():
-                            filename += '.xlsx'
-                        elif 'powerpoint' in content_type.lower():
-                            filename += '.pptx'
-                        elif 'text' in content_type.lower():
-                            filename += '.txt'
-
-                    logger.info(f"Using filename: {filename}")
-
-                    # Create a file-like object from the content
-                    file_content = io.BytesIO(file_response.content)
-
-                    # Save the file to disk for debugging
-                    import os
-                    debug_dir = '/tmp/moodle_files'
-                    os.makedirs(debug_dir, exist_ok=True)
-                    debug_path = os.path.join(debug_dir, filename)
-                    with open(debug_path, 'wb') as f:
-                        f.write(file_response.content)
-                    logger.info(f"Saved file to {debug_path} for debugging")
-
-                    # Return the file
-                    if 'pdf' in content_type.lower() or filename.lower().endswith('.pdf'):
-                        response = FileResponse(file_content, content_type='application/pdf')
-                    else:
-                        response = FileResponse(file_content, content_type=content_type)
-
-                    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                    return response
+                if download['success']:
+                    return file_download_response(request, download_url, download)
 
-                except Exception as e:
-                    logger.error(f"Error downloading file: {e}")
+                if not download.get('html'):
                     # Add the error to the resource
-                    resource['error'] = f"Error downloading file: {str(e)}"
+                    resources = [r.replace(error=download['message']) if r is resource else r for r in resources]
 
         # If no file downloaded or download_file is False, return the JSON response
         logger.info("Returning JSON response with resources")
-        serializer = ResourceSerializer(resources, many=True)
 
         return Response({
             'status': 'success',
             'course_url': course_url,
             'authenticated': True,
             'count': len(resources),
-            'data': serializer.data
+            'data': resources
         }, status=status.HTTP_200_OK)
 
 
+def enrolled_courses(token_entry, refresh=False):
+    """
+    Return the enrolled courses of a pooled session from the per-user cache, loading them when missing
+
+    Args:
+        token_entry (dict): The session store entry of the user
+        refresh (bool): Drop the cached listing and load it again
+
+    Returns:
+        dict: The get_or_refresh() entry, whose `value` is the get_enrolled_courses() result
+    """
+    session = token_entry['session']
+    url = token_entry['url']
+    cache_key = f"moodle_courses:{url}:{token_entry['username']}"
+
+    if refresh:
+        invalidate(cache_key)
+
+    # A user's enrolments are private: they stay in the per-user cache, out of the shared catalogue
+    def load_courses():
+        return get_enrolled_courses(url=url, session=session)
+
+    return get_or_refresh(
+        cache_key,
+        load_courses,
+        ttl=getattr(settings, 'MOODLE_COURSES_CACHE_TTL', 5 * 60),
+        stale_ttl=getattr(settings, 'MOODLE_COURSES_STALE_TTL', 60 * 60)
+    )
+
+
+def enrolled_courses_response(token_entry, refresh=False, modified_since=None, extra=None):
+    """
+    Build the enrolled-courses listing of a pooled session, served from the per-user cache
+
+    Args:
+        token_entry (dict): The session store entry of the user
+        refresh (bool): Drop the cached listing and load it again
+        modified_since (int, optional): Only list courses whose `last_modified` is newer, or unknown
+        extra (dict, optional): Additional keys for the response body
+
+    Returns:
+        Response: The DRF response
+    """
+    cached = enrolled_courses(token_entry, refresh)
+    result = cached['value']
+
+    if not result['success']:
+        return Response({
+            'status': 'error',
+            'message': result['message']
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    # The last change of each course's files, as the catalogue saw it; None until its files are crawled
+    changed_at = catalogue.files_changed_at(token_entry['url'], [course['id'] for course in result['courses']])
+    courses = [dict(course, last_modified=changed_at.get(str(course['id']))) for course in result['courses']]
+    if modified_since is not None:
+        courses = [course for course in courses
+                   if course['last_modified'] is None or course['last_modified'] > modified_since]
+
+    body = {
+        'status': 'success',
+        'message': result['message'],
+        'count': len(courses),
+        'courses': courses,
+        'fetched_at': int(cached['fetched_at']),
+        'stale': cached['stale']
+    }
+    body.update(extra or {})
+    return Response(body, status=status.HTTP_200_OK)
+
+
 class MoodleCoursesAPIView(APIView):
     """
-    API view to retrieve courses from Moodle
+    API view listing the courses the user is enrolled in
+
+    The listing is cached per user for MOODLE_COURSES_CACHE_TTL seconds; older
+    copies are still served while a background refresh runs. Each course has a
+    `last_modified` hint, the last change of its files in the catalogue, so
+    clients can skip recrawling unchanged courses.
     """
+    def _options(self, params):
+        modified_since = params.get('modified_since')
+        return {
+            'refresh': str(params.get('refresh', '')).lower() in ('1', 'true', 'yes'),
+            'modified_since': int(modified_since) if modified_since not in (None, '') else None
+        }
+
+    def get(self, request):
+        token_entry = get_token_entry(request)
+
+        if not token_entry:
+            return Response({
+                'status': 'error',
+                'message': 'A valid API token is required'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            options = self._options(request.query_params)
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': 'modified_since must be a Unix timestamp'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return enrolled_courses_response(token_entry, **options)
+
     def post(self, request):
+        try:
+            options = self._options(request.data)
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': 'modified_since must be a Unix timestamp'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        token_entry = get_token_entry(request)
+
+        if token_entry:
+            return enrolled_courses_response(token_entry, **options)
+
         # Get username and password from request data
         username = request.data.get('username')
         password = request.data.get('password')
@@ -687,7 +1371,7 @@ class MoodleCoursesAPIView(APIView):
         if not username or not password:
             return Response({
                 'status': 'error',
-                'message': 'Username and password are required'
+                'message': 'An API token or username and password are required'
             }, status=status.HTTP_400_BAD_REQUEST)
 
         # Attempt to login
@@ -699,18 +1383,21 @@ class MoodleCoursesAPIView(APIView):
                 'message': login_result['message']
             }, status=status.HTTP_401_UNAUTHORIZED)
 
-        # For now, just return a success message
-        # In a real implementation, we would retrieve the courses from Moodle
-        return Response({
-            'status': 'success',
-            'message': 'Login successful, but course retrieval is not implemented yet',
-            'session': login_result['cookies']
-        }, status=status.HTTP_200_OK)
+        token_entry = session_store.issue(session_from_cookies(login_result['cookies']), username, url)
+
+        return enrolled_courses_response(token_entry, extra={
+            'token': token_entry['token'],
+            'expires_in': session_store.ttl
+        }, **options)
 
 
 class MoodleLoginAPIView(APIView):
     """
     API view for Moodle login
+
+    A successful login returns an opaque API token. The authenticated Moodle
+    session stays on the server; send the token back in the `X-Moodle-Token`
+    header (or `Authorization: Token <token>`) to reuse it.
     """
     def post(self, request):
         # Get username and password from request data
@@ -733,18 +1420,41 @@ class MoodleLoginAPIView(APIView):
                 'message': login_result['message']
             }, status=status.HTTP_401_UNAUTHORIZED)
 
-        # Return the login result with cookies for subsequent requests
+        # Keep the session server-side and hand out a token for it
+        token_entry = session_store.issue(session_from_cookies(login_result['cookies']), username, url)
+
         return Response({
             'status': 'success',
             'message': login_result['message'],
-            'session': login_result['cookies']
+            'token': token_entry['token'],
+            'expires_in': session_store.ttl
+        }, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        token_entry = get_token_entry(request)
+
+        if not token_entry:
+            return Response({
+                'status': 'error',
+                'message': 'A valid API token is required'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+
+        session_store.revoke(token_entry['token'])
+
+        return Response({
+            'status': 'success',
+            'message': 'Logged out'
         }, status=status.HTTP_200_OK)
 
 
 class MoodleCoursePDFsAPIView(APIView):
     """
     API view for retrieving PDF files from Moodle courses
+
+    `format=ndjson` streams the files as they are resolved, see course_pdfs_stream.
     """
+    renderer_classes = STREAMING_RENDERER_CLASSES
+
     def post(self, request):
         # Get the course ID and session cookies
         course_id = request.data.get('course_id')
@@ -752,6 +1462,7 @@ class MoodleCoursePDFsAPIView(APIView):
         username = request.data.get('username')
         password = request.data.get('password')
         url = request.data.get('url', 'https://elearning.univ-bba.dz')
+        token_entry = get_token_entry(request)
 
         # Check if course ID is provided
         if not course_id:
@@ -760,15 +1471,28 @@ class MoodleCoursePDFsAPIView(APIView):
                 'message': 'Course ID is required'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if we have session cookies or credentials
-        if not session_cookies and (not username or not password):
+        error = course_id_error(course_id)
+        if error is not None:
+            return error
+
+        # Check if we have a token, session cookies or credentials
+        if not token_entry and not session_cookies and (not username or not password):
             return Response({
                 'status': 'error',
-                'message': 'Either session cookies or username/password are required'
+                'message': 'An API token, session cookies or username/password are required'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # If no session cookies but credentials provided, login first
-        if not session_cookies and username and password:
+        paging, fields, error = listing_options(request.data, 'files', CourseFile.__slots__, str(course_id))
+        if error is not None:
+            return error
+
+        if token_entry:
+            session = token_entry['session']
+            url = token_entry['url']
+        elif session_cookies:
+            session = session_from_cookies(session_cookies)
+        else:
+            # No token or session cookies, login first
             login_result = moodle_login(username, password, url)
             if not login_result['success']:
                 return Response({
@@ -776,24 +1500,13 @@ class MoodleCoursePDFsAPIView(APIView):
                     'message': f"Login failed: {login_result['message']}"
                 }, status=status.HTTP_401_UNAUTHORIZED)
 
-            session_cookies = login_result['cookies']
+            session = session_from_cookies(login_result['cookies'])
 
         # Retrieve PDFs from the course
-        pdf_result = get_course_pdfs(session_cookies, course_id, url)
-
-        if not pdf_result['success']:
-            return Response({
-                'status': 'error',
-                'message': pdf_result['message']
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        return Response({
-            'status': 'success',
-            'message': pdf_result['message'],
-            'course_name': pdf_result['course_name'],
-            'count': len(pdf_result['pdfs']),
-            'pdfs': pdf_result['pdfs']
-        }, status=status.HTTP_200_OK)
+        refresh = str(request.data.get('refresh', False)).lower() in ('1', 'true', 'yes')
+        if wants_ndjson(request):
+            return course_pdfs_stream(course_id, url, session, refresh)
+        return course_pdfs_response(course_id, url, session, refresh, paging, fields)
 
     def get(self, request, course_id=None):
         # Check if course ID is provided
@@ -803,39 +1516,302 @@ class MoodleCoursePDFsAPIView(APIView):
                 'message': 'Course ID is required'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get credentials from query parameters
-        username = request.query_params.get('username')
-        password = request.query_params.get('password')
-        url = request.query_params.get('url', 'https://elearning.univ-bba.dz')
+        error = course_id_error(course_id)
+        if error is not None:
+            return error
 
-        # Check if credentials are provided
-        if not username or not password:
+        paging, fields, error = listing_options(request.query_params, 'files', CourseFile.__slots__, str(course_id))
+        if error is not None:
+            return error
+
+        token_entry = get_token_entry(request)
+
+        if token_entry:
+            session = token_entry['session']
+            url = token_entry['url']
+        else:
+            # Get credentials from query parameters
+            username = request.query_params.get('username')
+            password = request.query_params.get('password')
+            url = request.query_params.get('url', 'https://elearning.univ-bba.dz')
+
+            # Check if credentials are provided
+            if not username or not password:
+                return Response({
+                    'status': 'error',
+                    'message': 'An API token header or username and password query parameters are required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # Login first
+            login_result = moodle_login(username, password, url)
+            if not login_result['success']:
+                return Response({
+                    'status': 'error',
+                    'message': f"Login failed: {login_result['message']}"
+                }, status=status.HTTP_401_UNAUTHORIZED)
+
+            session = session_from_cookies(login_result['cookies'])
+
+        # Retrieve PDFs from the course
+        refresh = request.query_params.get('refresh', 'false').lower() in ('1', 'true', 'yes')
+        if wants_ndjson(request):
+            return course_pdfs_stream(course_id, url, session, refresh)
+        return course_pdfs_response(course_id, url, session, refresh, paging, fields, request=request)
+
+
+class ChangesAPIView(APIView):
+    """
+    API view serving the change log of the catalogue's courses, for clients that sync incrementally
+
+    Only the changes of the courses the user is enrolled in, or was verified
+    to open, are listed. The log itself is answered from the catalogue; Moodle
+    is only asked for the enrolled courses (cached per user) and about
+    requested courses outside them. The `next_cursor` of a response is the
+    `since` of the next request, also when it is empty.
+    """
+    def get(self, request):
+        token_entry = get_token_entry(request)
+        if not token_entry:
+            return Response({
+                'status': 'error',
+                'message': 'A valid API token is required'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+
+        since = request.query_params.get('since')
+        courses = request.query_params.get('courses')
+        course_ids = [course_id.strip() for course_id in courses.split(',') if course_id.strip()] if courses else None
+        if course_ids is not None and not all(course_id.isdigit() for course_id in course_ids):
             return Response({
                 'status': 'error',
-                'message': 'Username and password are required as query parameters'
+                'message': 'courses must be a comma separated list of course IDs'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Login first
-        login_result = moodle_login(username, password, url)
-        if not login_result['success']:
+        try:
+            after = decode_cursor('changes', since) if since else 0
+            limit = parse_limit(request.query_params.get('limit'))
+        except ValueError as e:
             return Response({
                 'status': 'error',
-                'message': f"Login failed: {login_result['message']}"
-            }, status=status.HTTP_401_UNAUTHORIZED)
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Retrieve PDFs from the course
-        pdf_result = get_course_pdfs(login_result['cookies'], course_id, url)
+        session = token_entry['session']
+        url = token_entry['url']
+        enrolled = enrolled_courses(token_entry)['value']
+        allowed = {str(course['id']) for course in enrolled['courses']} if enrolled['success'] else set()
+        allowed |= verified_courses(session, url)
+
+        if course_ids is None:
+            course_ids = sorted(allowed)
+        for course_id in course_ids:
+            if course_id not in allowed:
+                error = course_access_error(session, url, course_id)
+                if error is not None:
+                    return error
+
+        log = catalogue.changes(url, after, limit, course_ids)
+        return Response({
+            'status': 'success',
+            'count': len(log['changes']),
+            'changes': log['changes'],
+            'next_cursor': encode_cursor('changes', log['last_id']),
+            'has_more': log['has_more']
+        }, status=status.HTTP_200_OK)
 
-        if not pdf_result['success']:
+
+def job_session(request):
+    """
+    Return the Moodle session and URL for a job, from the API token or the credentials in the body
+
+    Returns:
+        tuple: (session, url, error Response). The session is None when the error response is set.
+    """
+    token_entry = get_token_entry(request)
+    if token_entry:
+        return token_entry['session'], token_entry['url'], None
+
+    username = request.data.get('username')
+    password = request.data.get('password')
+    url = request.data.get('url', DEFAULT_MOODLE_URL)
+
+    if not username or not password:
+        return None, url, Response({
+            'status': 'error',
+            'message': 'An API token or username and password are required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    login_result = moodle_login(username, password, url)
+    if not login_result['success']:
+        return None, url, Response({
+            'status': 'error',
+            'message': f"Login failed: {login_result['message']}"
+        }, status=status.HTTP_401_UNAUTHORIZED)
+
+    return session_from_cookies(login_result['cookies']), url, None
+
+
+def get_job_or_404(job_id):
+    """
+    Return the job, or a 404 Response if it is unknown or expired
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return None, Response({
+            'status': 'error',
+            'message': 'Unknown or expired job'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return job, None
+
+
+class JobsAPIView(APIView):
+    """
+    API view starting a background crawl or ZIP export of a course
+
+    The response carries the job ID; progress is followed on the job's
+    Server-Sent Events stream, and the job can be cancelled at any time.
+    """
+    def post(self, request):
+        kind = request.data.get('kind', 'crawl')
+        course_id = str(request.data.get('course_id') or '')
+
+        if kind not in ('crawl', 'export'):
             return Response({
                 'status': 'error',
-                'message': pdf_result['message']
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                'message': "kind must be 'crawl' or 'export'"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if not course_id.isdigit():
+            return Response({
+                'status': 'error',
+                'message': 'A numeric course_id is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        files_selector = request.data.get('files', 'all')
+        if kind == 'export':
+            try:
+                parse_files_selector(files_selector)
+            except ValueError as e:
+                return Response({
+                    'status': 'error',
+                    'message': str(e)
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        session, url, error = job_session(request)
+        if error is not None:
+            return error
+
+        error = course_access_error(session, url, course_id)
+        if error is not None:
+            return error
+
+        if kind == 'export':
+            job = job_store.start(kind, export_course, course_id, url, session, files_selector, file_cache,
+                                  getattr(settings, 'MOODLE_JOB_DIR', DEFAULT_JOB_DIR))
+        else:
+            refresh = str(request.data.get('refresh', False)).lower() in ('1', 'true', 'yes')
+            job = job_store.start(kind, crawl_course, course_id, url, session, refresh)
 
         return Response({
             'status': 'success',
-            'message': pdf_result['message'],
-            'course_name': pdf_result['course_name'],
-            'count': len(pdf_result['pdfs']),
-            'pdfs': pdf_result['pdfs']
+            'job_id': job.id,
+            'events_url': f"/api/jobs/{job.id}/events/",
+            'cancel_url': f"/api/jobs/{job.id}/cancel/"
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class JobDetailAPIView(APIView):
+    """
+    API view returning the current state of a job
+    """
+    def get(self, request, job_id):
+        job, error = get_job_or_404(job_id)
+        if error is not None:
+            return error
+
+        return Response({
+            'status': 'success',
+            'job': job.snapshot()
         }, status=status.HTTP_200_OK)
+
+
+class JobEventsAPIView(APIView):
+    """
+    API view streaming the events of a job as Server-Sent Events
+
+    Events already emitted are replayed first, from after `Last-Event-ID` when
+    a client reconnects; the stream ends with the job's final event.
+    """
+    renderer_classes = EVENT_STREAM_RENDERER_CLASSES
+
+    def get(self, request, job_id):
+        job, error = get_job_or_404(job_id)
+        if error is not None:
+            return error
+
+        last_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id') or '0'
+        last_id = int(last_id) if last_id.isdigit() else 0
+        keepalive = getattr(settings, 'MOODLE_JOB_KEEPALIVE', 15)
+
+        def messages():
+            nonlocal last_id
+            yield 'retry: 3000\n\n'
+            while True:
+                events = job.events_after(last_id, timeout=keepalive)
+                if not events:
+                    if job.finished_at is not None:
+                        return
+                    # Comment line that keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+
+                for event in events:
+                    last_id = event['id']
+                    yield sse_message(event['event'], dict(event['data'], time=event['time']), event['id'])
+                    if event['event'] in FINAL_EVENTS:
+                        return
+
+        response = StreamingHttpResponse(messages(), content_type=EVENT_STREAM_MEDIA_TYPE)
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class JobCancelAPIView(APIView):
+    """
+    API view cancelling a running job; the job stops at its next resource or chunk
+    """
+    def post(self, request, job_id):
+        job, error = get_job_or_404(job_id)
+        if error is not None:
+            return error
+
+        if job.finished_at is not None:
+            return Response({
+                'status': 'error',
+                'message': f"Job already {job.status}"
+            }, status=status.HTTP_409_CONFLICT)
+
+        job.cancel()
+        return Response({
+            'status': 'success',
+            'message': 'Cancellation requested'
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class JobDownloadAPIView(APIView):
+    """
+    API view serving the archive of a finished export job
+    """
+    def get(self, request, job_id):
+        job, error = get_job_or_404(job_id)
+        if error is not None:
+            return error
+
+        if job.kind != 'export' or job.status != 'done':
+            return Response({
+                'status': 'error',
+                'message': f"No archive: the job is {job.status}"
+            }, status=status.HTTP_409_CONFLICT)
+
+        return FileResponse(open(job.path, 'rb'), as_attachment=True, filename=job.result['archive_name'],
+                            content_type='application/zip')
@@ -0,0 +1,226 @@
+import heapq
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import catalogue, records
+from .downloads import open_resource_download
+from .models import Course
+from .moodle_auth import get_authenticated_session, get_course_pdfs
+
+logger = logging.getLogger(__name__)
+
+# Outbound requests per second allowed to the warmer, and the burst it may spend at once
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 10
+
+# Courses are recrawled once their files are older than this fraction of MOODLE_CATALOGUE_TTL,
+# so they are refreshed before requests would find them stale
+DEFAULT_REFRESH_AHEAD = 0.75
+
+# Courses whose decayed request score is below this (about two requests in the last
+# half-life) are left to crawl on demand
+DEFAULT_MIN_SCORE = 1.5
+
+# Requests charged for a login: the login script and the cookie login both load the login page and post to it
+LOGIN_REQUESTS = 4
+
+
+class TokenBucket:
+    """
+    Global budget of outbound requests, refilled at `rate` tokens per second up to `capacity`
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Wait until `tokens` requests fit in the budget, then spend them
+
+        Returns:
+            bool: False if the budget did not allow them before `timeout` seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        tokens = min(tokens, self.capacity)
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+
+            if deadline is not None:
+                if time.monotonic() + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+def throttled_session(session, bucket):
+    """
+    Make a session wait for the request budget before every request it sends
+
+    Session.send() also sends the redirects that are followed and the hedged
+    duplicates of slow requests, so course pages, resource pages, probes and
+    downloads are all charged, whoever makes them.
+
+    Returns:
+        requests.Session: The same session
+    """
+    send = session.send
+
+    def send_within_budget(request, **kwargs):
+        bucket.acquire()
+        return send(request, **kwargs)
+
+    session.send = send_within_budget
+    return session
+
+
+def warm_queue(site, now=None, min_score=DEFAULT_MIN_SCORE, refresh_ahead=DEFAULT_REFRESH_AHEAD):
+    """
+    Build the priority queue of courses to crawl ahead of demand
+
+    Args:
+        site (str): The Moodle URL
+        now (datetime, optional): The current time
+        min_score (float): Lowest decayed request score worth warming
+        refresh_ahead (float): Fraction of MOODLE_CATALOGUE_TTL after which stored files are refreshed
+
+    Returns:
+        list: A heap of (-score, course ID) tuples, hottest course first
+    """
+    now = now or timezone.now()
+    ttl = getattr(settings, 'MOODLE_CATALOGUE_TTL', catalogue.DEFAULT_CATALOGUE_TTL)
+    refresh_before = now - timedelta(seconds=ttl * refresh_ahead)
+
+    courses = Course.objects.filter(site=site, last_requested_at__isnull=False).filter(
+        Q(files_crawled_at__isnull=True) | Q(files_crawled_at__lt=refresh_before)
+    ).values_list('moodle_id', 'request_score', 'last_requested_at')
+
+    heap = []
+    for course_id, score, last_requested_at in courses:
+        score = catalogue.decayed_score(score, last_requested_at, now)
+        if score >= min_score:
+            heap.append((-score, course_id))
+
+    heapq.heapify(heap)
+    return heap
+
+
+def warm_files(session, pdfs, file_cache):
+    """
+    Download the files of a course into the file cache unless they are already there
+
+    Returns:
+        int: Number of files downloaded
+    """
+    downloaded = 0
+
+    for pdf in pdfs:
+        file_url = pdf.get('url')
+        if not file_url or pdf.get('type') == records.FOLDER_ARCHIVE or file_cache.lookup(file_url):
+            continue
+
+        download = open_resource_download(session, file_url, pdf.get('name') or 'document')
+        if not download.get('success'):
+            logger.warning(f"Could not warm {file_url}: {download.get('message')}")
+            continue
+
+        entry = file_cache.store(file_url, download['response'], download['filename'], download['content_type'])
+        catalogue.record_content_hash(file_url, entry['etag'], entry['size'])
+        downloaded += 1
+
+    return downloaded
+
+
+def warm_course(session, site, course_id, file_cache=None):
+    """
+    Crawl one course into the catalogue, and optionally its files into the file cache
+
+    The session should be a throttled_session(), which charges the request budget.
+
+    Returns:
+        dict: Result containing success status, message and the number of files downloaded
+    """
+    pdfs_result = get_course_pdfs(course_id, url=site, session=session)
+
+    if not pdfs_result.get('success'):
+        return {'success': False, 'message': pdfs_result.get('message'), 'files': 0}
+
+    catalogue.store_course_files(site, course_id, pdfs_result)
+    downloaded = warm_files(session, pdfs_result['pdfs'], file_cache) if file_cache is not None else 0
+
+    return {
+        'success': True,
+        'message': f"Warmed course {course_id}: {len(pdfs_result['pdfs'])} files listed, {downloaded} downloaded",
+        'files': downloaded
+    }
+
+
+def warm_round(site, username, password, bucket, limit=20, file_cache=None, deadline=None):
+    """
+    Crawl the hottest courses that are due for a refresh, within the request budget
+
+    Args:
+        site (str): The Moodle URL
+        username (str): The Moodle account used for crawling
+        password (str): Its password
+        bucket (TokenBucket): The global outbound request budget
+        limit (int): Maximum number of courses crawled in this round
+        file_cache (FileCache, optional): Also download the files of each course into this cache
+        deadline (float, optional): time.monotonic() value after which no new course is started
+
+    Returns:
+        dict: Result containing success status, message and the warmed course IDs
+    """
+    heap = warm_queue(site)
+    if not heap:
+        return {'success': True, 'message': 'No courses to warm', 'courses': []}
+
+    bucket.acquire(LOGIN_REQUESTS)
+    session, login_error = get_authenticated_session(username, password, site)
+    if session is None:
+        return {'success': False, 'message': login_error, 'courses': []}
+    session = throttled_session(session, bucket)
+
+    warmed = []
+    failed = 0
+    while heap and len(warmed) + failed < limit:
+        if deadline is not None and time.monotonic() > deadline:
+            break
+
+        score, course_id = heapq.heappop(heap)
+        try:
+            result = warm_course(session, site, course_id, file_cache)
+        except Exception as e:
+            result = {'success': False, 'message': str(e)}
+
+        if result['success']:
+            logger.info(f"{result['message']} (score {-score:.1f})")
+            warmed.append(course_id)
+        else:
+            logger.warning(f"Could not warm course {course_id}: {result['message']}")
+            failed += 1
+
+    return {
+        'success': True,
+        'message': f"Warmed {len(warmed)} courses ({failed} failed, {len(heap)} left for the next round)",
+        'courses': warmed
+    }